@@ -0,0 +1,556 @@
+"""
+Async (ASGI) serving mode for the face recognition app.
+
+Exposes the same routes as the Flask app in app.routes and shares its
+model loader, recognition pool, broadcast hub and trackers, but runs on an
+event loop: MJPEG viewers and WebSocket clients wait on asyncio events
+instead of holding a worker thread each, and CPU work goes to the
+recognition worker processes or a thread pool. Run it with
+
+    python main.py --asgi
+
+or ``uvicorn app.asgi:app``. Requires starlette, uvicorn and python-multipart.
+"""
+import asyncio
+import os
+import struct
+import time
+import zipfile
+from flask import render_template
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.staticfiles import StaticFiles
+from starlette.websockets import WebSocketDisconnect
+from app import metrics, routes
+from app.tenants import DEFAULT_TENANT
+from app.worker_pool import PoolSaturated
+
+# Prefix of each WebSocket frame message: big-endian uint32 sequence number
+FRAME_HEADER = struct.Struct('>I')
+
+
+async def get_recognizer(tenant=DEFAULT_TENANT):
+    """Return a tenant's recognizer, waiting up to WARMUP_TIMEOUT seconds; None while warming up."""
+    if routes.model_loader.ready and (tenant == DEFAULT_TENANT or tenant in routes.tenant_registry):
+        return routes.get_recognizer(tenant)
+    # Warming up, or a tenant model to load from disk
+    return await run_in_threadpool(routes.get_recognizer, tenant)
+
+
+def request_tenant(request, form=None):
+    """Tenant named by the X-Tenant header or a 'tenant' form/query field."""
+    return (request.headers.get('X-Tenant') or (form.get('tenant') if form is not None else None)
+            or request.query_params.get('tenant') or DEFAULT_TENANT)
+
+
+def tenant_error_response(tenant, create=False):
+    """400/404 response for an invalid or unknown tenant, or None (see routes.tenant_error)."""
+    error = routes.tenant_error(tenant, create)
+    if error is None:
+        return None
+    return JSONResponse(error[0], status_code=error[1])
+
+
+def warming_up_response():
+    """503 response for requests that arrive before the model is ready."""
+    status = routes.model_loader.status()
+    if status['state'] == 'failed':
+        message = 'Model failed to load'
+    else:
+        message = 'Model is warming up, please retry shortly'
+
+    return JSONResponse(
+        {'error': message, 'success': False, 'message': message, 'model': status},
+        status_code=503,
+        headers={'Retry-After': str(routes.RETRY_AFTER)}
+    )
+
+
+def busy_response(error):
+    """503 response for requests turned away because the recognition queue is full."""
+    return JSONResponse(
+        {'error': 'Server is busy, please retry shortly', 'success': False, 'message': str(error)},
+        status_code=503,
+        headers={'Retry-After': str(routes.BUSY_RETRY_AFTER)}
+    )
+
+
+async def recognize_on_pool(data, top_k=1, per_identity=False, timings=False, recognizer=None):
+    """Recognize an encoded image on the recognition pool without blocking the event loop."""
+    pool = routes.recognition_pool
+    if pool.workers == 0:
+        # In-process pool: the recognition itself would run on the event loop
+        return await run_in_threadpool(pool.recognize, data, top_k, per_identity, timings, recognizer)
+    return await asyncio.wrap_future(pool.submit_recognition(data, top_k, per_identity, timings, recognizer))
+
+
+def parse_flag(request, form, name):
+    """Read a boolean form/query field such as per_identity=true."""
+    return (form.get(name) or request.query_params.get(name, '')).lower() in ('1', 'true', 'yes')
+
+
+async def index(request):
+    """Render the main page (with the Flask app's template and static URLs)."""
+    with routes.app.test_request_context('/'):
+        return HTMLResponse(render_template('index.html'))
+
+
+async def recognize_image(request):
+    """Handle image upload and recognize faces."""
+    form = await request.form(max_part_size=routes.MAX_FILE_SIZE)
+    file = form.get('file')
+
+    if file is None or isinstance(file, str):
+        return JSONResponse({'error': 'No file provided'}, status_code=400)
+
+    if file.filename == '':
+        return JSONResponse({'error': 'No file selected'}, status_code=400)
+
+    if not routes.allowed_file(file.filename):
+        return JSONResponse({'error': 'File type not allowed'}, status_code=400)
+
+    try:
+        data = await file.read()
+
+        # Too small to be a real image (e.g. an empty webcam frame)
+        if len(data) < 100:
+            return JSONResponse({'error': None, 'faces': []})
+
+        # Ranked gallery matches per face, e.g. top_k=5&per_identity=true
+        try:
+            top_k = int(form.get('top_k') or request.query_params.get('top_k', 1))
+        except ValueError:
+            return JSONResponse({'error': 'top_k must be an integer'}, status_code=400)
+        top_k = max(1, min(top_k, routes.MAX_TOP_K))
+        per_identity = parse_flag(request, form, 'per_identity')
+        # timings=true adds the milliseconds spent in each processing stage
+        timings = parse_flag(request, form, 'timings')
+
+        tenant = request_tenant(request, form)
+        error = tenant_error_response(tenant)
+        if error:
+            return error
+
+        recognizer = await get_recognizer(tenant)
+        if recognizer is None:
+            return warming_up_response()
+
+        # Frames from a webcam stream reuse identities of faces already tracked;
+        # the tracker lives in this process, so those frames are recognized here
+        stream_id = form.get('stream_id')
+        if stream_id:
+            result = await run_in_threadpool(
+                recognizer.recognize_faces_in_buffer, data,
+                tracker=routes.stream_trackers.get((tenant, stream_id), recognizer), top_k=top_k,
+                per_identity=per_identity, timings=timings
+            )
+        else:
+            result = await recognize_on_pool(data, top_k=top_k, per_identity=per_identity,
+                                             timings=timings, recognizer=recognizer)
+
+        return JSONResponse(result)
+
+    except PoolSaturated as e:
+        return busy_response(e)
+    except Exception as e:
+        return JSONResponse({'error': f'Error processing image: {str(e)}'}, status_code=500)
+
+
+async def recognize_batch(request):
+    """Recognize faces in many images (multipart files and/or zip archives) in one request."""
+    form = await request.form(max_files=routes.MAX_BATCH_IMAGES + 1, max_part_size=routes.MAX_FILE_SIZE)
+    uploads = [
+        upload for upload in form.getlist('files') + form.getlist('file')
+        if not isinstance(upload, str)
+    ]
+
+    if not uploads:
+        return JSONResponse({'error': 'No files provided'}, status_code=400)
+
+    try:
+        filenames = []
+        buffers = []
+
+        for file in uploads:
+            if file.filename.lower().endswith('.zip'):
+                entries = await run_in_threadpool(routes.read_zip_images, file.file)
+            elif routes.allowed_file(file.filename):
+                entries = [(file.filename, await file.read())]
+            else:
+                return JSONResponse({'error': f'File type not allowed: {file.filename}'}, status_code=400)
+
+            for filename, data in entries:
+                filenames.append(filename)
+                buffers.append(data)
+                if len(buffers) > routes.MAX_BATCH_IMAGES:
+                    return JSONResponse(
+                        {'error': f'Too many images (max {routes.MAX_BATCH_IMAGES})'}, status_code=400
+                    )
+
+        tenant = request_tenant(request, form)
+        error = tenant_error_response(tenant)
+        if error:
+            return error
+
+        recognizer = await get_recognizer(tenant)
+        if recognizer is None:
+            return warming_up_response()
+
+        results = await run_in_threadpool(routes.recognition_pool.recognize_batch, buffers, recognizer)
+
+        return JSONResponse({
+            'error': None,
+            'results': [
+                dict(result, filename=filename)
+                for filename, result in zip(filenames, results)
+            ]
+        })
+
+    except zipfile.BadZipFile:
+        return JSONResponse({'error': 'Invalid zip archive'}, status_code=400)
+    except PoolSaturated as e:
+        return busy_response(e)
+    except Exception as e:
+        return JSONResponse({'error': f'Error processing images: {str(e)}'}, status_code=500)
+
+
+async def video_feed(request):
+    """Stream video from the configured source with face recognition."""
+    if await get_recognizer() is None:
+        return warming_up_response()
+
+    return StreamingResponse(
+        routes.broadcast_hub.asubscribe(routes.app.config['VIDEO_SOURCE']),
+        media_type='multipart/x-mixed-replace; boundary=frame'
+    )
+
+
+async def streams(request):
+    """List registered cameras with their FPS and lag, or register a new one."""
+    if await get_recognizer() is None:
+        return warming_up_response()
+
+    if request.method == 'GET':
+        return JSONResponse({'streams': routes.stream_scheduler.stats()})
+
+    if request.headers.get('content-type', '').startswith('application/json'):
+        data = await request.json()
+    else:
+        data = await request.form()
+    body, status = await run_in_threadpool(routes.register_stream, data)
+    return JSONResponse(body, status_code=status)
+
+
+async def remove_stream(request):
+    """Stop reading a registered camera."""
+    if await get_recognizer() is None:
+        return warming_up_response()
+
+    stream_id = request.path_params['stream_id']
+    if not await run_in_threadpool(routes.stream_scheduler.remove_stream, stream_id):
+        return JSONResponse({'success': False, 'message': 'Stream not found'}, status_code=404)
+    return JSONResponse({'success': True, 'message': f"Stream '{stream_id}' removed"})
+
+
+async def stream_feed(request):
+    """MJPEG feed of one registered camera (each frame is awaited on the thread pool)."""
+    if await get_recognizer() is None:
+        return warming_up_response()
+
+    try:
+        target_fps = routes.parse_target_fps(request.query_params.get('fps'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    stream_id = request.path_params['stream_id']
+    if stream_id not in routes.stream_scheduler:
+        return JSONResponse({'error': 'Stream not found'}, status_code=404)
+    return StreamingResponse(
+        routes.stream_scheduler.frames(stream_id, target_fps=target_fps),
+        media_type='multipart/x-mixed-replace; boundary=frame'
+    )
+
+
+async def stream_events(request):
+    """Server-sent events with the faces found on every camera (or one, with ?stream_id=)."""
+    if await get_recognizer() is None:
+        return warming_up_response()
+
+    return StreamingResponse(
+        routes.server_sent_events(routes.stream_scheduler, request.query_params.get('stream_id')),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache'}
+    )
+
+
+async def recognize_stream(websocket):
+    """
+    Recognize webcam frames sent over a WebSocket.
+
+    Each binary message is a 4-byte big-endian sequence number followed by
+    an encoded frame. Frames are recognized one at a time; a frame that
+    arrives while another is being processed replaces any frame still
+    waiting, so a slow server skips stale frames instead of queueing them.
+    Each reply is a JSON message in the /recognize_image format plus the
+    frame's 'seq', the server's 'processing_ms' (clients pace their sends
+    by it) and the number of frames 'dropped' so far. The connection keeps
+    its own face tracker, so identities carry over between frames.
+    """
+    await websocket.accept()
+
+    tenant = websocket.headers.get('X-Tenant') or websocket.query_params.get('tenant') or DEFAULT_TENANT
+    error = routes.tenant_error(tenant)
+    if error:
+        await websocket.send_json({'error': error[0]['error'], 'faces': []})
+        await websocket.close(code=1008)
+        return
+
+    recognizer = await get_recognizer(tenant)
+    if recognizer is None:
+        await websocket.send_json({'error': 'Model is warming up, please retry shortly', 'faces': []})
+        await websocket.close(code=1013)
+        return
+
+    stream_id = (tenant, f'ws-{id(websocket)}')
+    tracker = routes.stream_trackers.get(stream_id, recognizer)
+    # Holds at most the newest frame not yet picked up for recognition
+    frames = asyncio.Queue(maxsize=1)
+    stats = {'dropped': 0}
+    processor = asyncio.create_task(_process_stream_frames(websocket, recognizer, tracker, frames, stats))
+
+    try:
+        while True:
+            message = await websocket.receive_bytes()
+            if frames.full():
+                frames.get_nowait()
+                stats['dropped'] += 1
+            frames.put_nowait(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        processor.cancel()
+        routes.stream_trackers.discard(stream_id)
+
+
+async def _process_stream_frames(websocket, recognizer, tracker, frames, stats):
+    """Recognize the newest frame of a WebSocket stream and reply, until cancelled."""
+    while True:
+        message = await frames.get()
+        if len(message) < FRAME_HEADER.size:
+            continue
+        seq, = FRAME_HEADER.unpack_from(message)
+        data = message[FRAME_HEADER.size:]
+
+        started = time.perf_counter()
+        if len(data) < 100:
+            # Too small to be a real image (e.g. an empty webcam frame)
+            result = {'error': None, 'faces': []}
+        else:
+            try:
+                result = await run_in_threadpool(
+                    recognizer.recognize_faces_in_buffer, data, tracker=tracker
+                )
+            except Exception as e:
+                result = {'error': f'Error processing image: {str(e)}', 'faces': []}
+
+        result.update({
+            'seq': seq,
+            'processing_ms': round((time.perf_counter() - started) * 1000, 1),
+            'dropped': stats['dropped'],
+        })
+        try:
+            await websocket.send_json(result)
+        except (WebSocketDisconnect, RuntimeError):
+            # Client went away; the receive loop cancels this task
+            return
+
+
+def add_uploaded_face(recognizer, filename, data, name):
+    """Save an upload under a private temporary path and enroll it (runs on a worker thread)."""
+    with routes.upload_path(filename) as filepath:
+        with metrics.timed('upload_save'), open(filepath, 'wb') as f:
+            f.write(data)
+
+        # Convert to absolute path with forward slashes for OpenCV compatibility
+        abs_filepath = os.path.abspath(filepath).replace('\\', '/')
+        return recognizer.add_face_to_known(abs_filepath, name)
+
+
+async def add_face(request):
+    """Add a new face to known faces."""
+    form = await request.form(max_part_size=routes.MAX_FILE_SIZE)
+    file = form.get('file')
+    name = (form.get('name') or '').strip()
+
+    if file is None or isinstance(file, str) or 'name' not in form:
+        return JSONResponse({'error': 'Missing file or name'}, status_code=400)
+
+    if file.filename == '' or not name:
+        return JSONResponse({'error': 'Invalid file or name'}, status_code=400)
+
+    if not routes.allowed_file(file.filename):
+        return JSONResponse({'error': 'File type not allowed'}, status_code=400)
+
+    # Adding a face to an unknown tenant creates its gallery
+    tenant = request_tenant(request, form)
+    error = tenant_error_response(tenant, create=True)
+    if error:
+        return error
+
+    recognizer = await get_recognizer(tenant)
+    if recognizer is None:
+        return warming_up_response()
+
+    try:
+        data = await file.read()
+        # File IO and enrollment run off the event loop
+        result = await run_in_threadpool(add_uploaded_face, recognizer, file.filename, data, name)
+        return JSONResponse(result)
+
+    except Exception as e:
+        return JSONResponse({'success': False, 'message': f'Error: {str(e)}'}, status_code=500)
+
+
+async def list_known_faces(request):
+    """Get list of known faces, a page at a time with ?limit=N&after=<name>."""
+    tenant = request_tenant(request)
+    error = tenant_error_response(tenant)
+    if error:
+        return error
+
+    try:
+        limit = routes.parse_page_size(request.query_params.get('limit'))
+    except ValueError:
+        return JSONResponse({'error': 'limit must be an integer'}, status_code=400)
+
+    recognizer = await get_recognizer(tenant)
+    if recognizer is None:
+        return warming_up_response()
+
+    return JSONResponse(await run_in_threadpool(
+        routes.known_faces_page, recognizer, request.query_params.get('after'), limit
+    ))
+
+
+async def known_face(request):
+    """Image counts and enrollment status of one person."""
+    tenant = request_tenant(request)
+    error = tenant_error_response(tenant)
+    if error:
+        return error
+
+    recognizer = await get_recognizer(tenant)
+    if recognizer is None:
+        return warming_up_response()
+
+    person = await run_in_threadpool(recognizer.catalog.person, request.path_params['person_name'])
+    if person is None:
+        return JSONResponse({'error': 'Person not found'}, status_code=404)
+    return JSONResponse(person)
+
+
+async def delete_face(request):
+    """Delete a person from known faces."""
+    person_name = request.path_params['person_name']
+
+    tenant = request_tenant(request)
+    error = tenant_error_response(tenant)
+    if error:
+        return error
+
+    recognizer = await get_recognizer(tenant)
+    if recognizer is None:
+        return warming_up_response()
+
+    person_dir = os.path.join(recognizer.known_faces_dir, person_name)
+
+    try:
+        if not os.path.isdir(person_dir):
+            return JSONResponse({'success': False, 'message': 'Person not found'}, status_code=404)
+
+        # Drops the person's histograms and appends a remove record to the model's delta log
+        result = await run_in_threadpool(recognizer.delete_face_from_known, person_name)
+
+        return JSONResponse(result)
+
+    except Exception as e:
+        return JSONResponse({'success': False, 'message': f'Error: {str(e)}'}, status_code=500)
+
+
+async def health(request):
+    """Liveness check; also reports model readiness, load progress and the recognition queue."""
+    pool = routes.recognition_pool
+    schedule = routes.compaction_schedule
+    return JSONResponse({
+        'status': 'ok',
+        'ready': routes.model_loader.ready,
+        'model': routes.model_loader.status(),
+        'pool': pool.stats() if pool is not None else None,
+        'cache': routes.result_cache_stats(),
+        'compaction': schedule.last_report if schedule is not None else None,
+        'tenants': routes.tenant_registry.stats()
+    })
+
+
+async def metrics_endpoint(request):
+    """Prometheus metrics: stage and request latencies, video, model, queue and cache figures."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+
+async def ready(request):
+    """Readiness check: 200 once the model is loaded, 503 while warming up."""
+    return JSONResponse(
+        {'ready': routes.model_loader.ready, 'model': routes.model_loader.status()},
+        status_code=200 if routes.model_loader.ready else 503
+    )
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware observing each HTTP request's latency by route and status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not metrics.enabled():
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {'code': 500}
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            endpoint = getattr(route, 'path', None) or 'unmatched'
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, str(status['code']))
+
+
+app = Starlette(routes=[
+    Route('/', index),
+    Route('/recognize_image', recognize_image, methods=['POST']),
+    Route('/recognize_batch', recognize_batch, methods=['POST']),
+    Route('/video_feed', video_feed),
+    WebSocketRoute('/ws/recognize', recognize_stream),
+    Route('/streams', streams, methods=['GET', 'POST']),
+    Route('/streams/events', stream_events),
+    Route('/streams/{stream_id}', remove_stream, methods=['DELETE']),
+    Route('/streams/{stream_id}/video_feed', stream_feed),
+    Route('/add_face', add_face, methods=['POST']),
+    Route('/known_faces', list_known_faces),
+    Route('/known_faces/{person_name}', known_face),
+    Route('/delete_face/{person_name}', delete_face, methods=['DELETE', 'POST']),
+    Route('/health', health),
+    Route('/ready', ready),
+    Route('/metrics', metrics_endpoint),
+    Mount('/static', StaticFiles(directory=routes.app.static_folder), name='static'),
+], middleware=[Middleware(RequestMetricsMiddleware)])
@@ -0,0 +1,458 @@
+"""
+Bulk recognition over directory trees and video files.
+
+Inputs are walked lazily in a fixed order (directories recursively, with
+names sorted at every level; video files as frames sampled at a set rate)
+and handed to a RecognitionPool through a bounded window, so memory stays
+flat however many items there are. Results are written as they finish,
+and a checkpoint records which items are done so an interrupted scan
+resumes where it stopped, provided the inputs still walk to the same items.
+"""
+import csv
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+import cv2
+from app.worker_pool import RecognitionPool
+
+IMAGE_FILE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp')
+VIDEO_FILE_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v', '.mpg', '.mpeg', '.wmv')
+
+# Forward gaps (in frames) read through with grab(); larger gaps are seeked
+MAX_GRAB_FRAMES = 250
+CSV_FIELDS = ('source', 'frame', 'time', 'error', 'face', 'name', 'confidence', 'left', 'top', 'right', 'bottom')
+
+
+def item_key(item):
+    """Identify a scan item by its path and frame number, as stored in checkpoints."""
+    path, frame, _ = item
+    return [path, frame]
+
+
+def chain_digest(digest, key):
+    """Extend a running digest of walked items with one more item key."""
+    return hashlib.sha256((digest + json.dumps(key)).encode('utf-8')).hexdigest()
+
+
+def is_video_file(path):
+    return path.lower().endswith(VIDEO_FILE_EXTENSIONS)
+
+
+def iter_input_files(inputs):
+    """
+    Yield the image and video files named by inputs, in a repeatable order.
+
+    Args:
+        inputs: Files, directories (walked recursively) or glob patterns
+
+    Yields:
+        File paths
+    """
+    extensions = IMAGE_FILE_EXTENSIONS + VIDEO_FILE_EXTENSIONS
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, dirnames, filenames in os.walk(pattern):
+                # Sorting in place also fixes the order os.walk descends in
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.lower().endswith(extensions):
+                        yield os.path.join(root, name)
+        elif os.path.isfile(pattern):
+            yield pattern
+        else:
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(path) and path.lower().endswith(extensions):
+                    yield path
+
+
+def video_sample_points(path, sample_fps):
+    """
+    Frame numbers and timestamps to sample from a video file.
+
+    Args:
+        path: Video file path
+        sample_fps: Frames per second of video to sample (None = every frame)
+
+    Returns:
+        List of (frame number, seconds) tuples; empty if the file cannot be opened
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return []
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        fps = fps if fps and fps > 0 else 25.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count <= 0:
+            # Some containers do not store a frame count; count by demuxing
+            frame_count = 0
+            while cap.grab():
+                frame_count += 1
+    finally:
+        cap.release()
+
+    step = max(1, round(fps / sample_fps)) if sample_fps else 1
+    return [(frame, frame / fps) for frame in range(0, frame_count, step)]
+
+
+def iter_scan_items(inputs, sample_fps):
+    """
+    Yield the units of work of a scan, in a repeatable order.
+
+    Yields:
+        Tuples of (path, frame number, seconds); frame and seconds are None for images
+    """
+    for path in iter_input_files(inputs):
+        if is_video_file(path):
+            for frame, seconds in video_sample_points(path, sample_fps):
+                yield path, frame, seconds
+        else:
+            yield path, None, None
+
+
+class FrameReader:
+    """Reads sampled frames from one video at a time, moving forward without re-decoding."""
+
+    def __init__(self):
+        self.path = None
+        self._cap = None
+        self._next_frame = 0
+
+    def read(self, path, frame):
+        """
+        Read one frame.
+
+        Args:
+            path: Video file path
+            frame: Frame number
+
+        Returns:
+            BGR frame, or None if it cannot be read
+        """
+        if path != self.path:
+            self.close()
+            self._cap = cv2.VideoCapture(path)
+            self.path = path
+            self._next_frame = 0
+
+        gap = frame - self._next_frame
+        if gap < 0 or gap > MAX_GRAB_FRAMES:
+            # Backwards or far ahead (e.g. when resuming): seek instead of decoding through
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        else:
+            for _ in range(gap):
+                self._cap.grab()
+
+        ret, image = self._cap.read()
+        self._next_frame = frame + 1
+        return image if ret else None
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+        self._cap = None
+        self.path = None
+
+
+class ScanCheckpoint:
+    """
+    Which items of a scan are done, saved atomically next to the output.
+
+    Items are numbered in walk order. Everything below ``completed`` is
+    done; ``done`` maps the finished items above it to their keys, and
+    stays small because the scan never runs far ahead of its oldest
+    unfinished item. ``digest`` chains the keys of the items below
+    ``completed``, so a resume can check that the inputs still walk to
+    the same items (files added, removed or renamed, or videos with a
+    different frame count, would otherwise shift every index).
+    """
+
+    def __init__(self, path, inputs, sample_fps):
+        """
+        Initialize the checkpoint.
+
+        Args:
+            path: Checkpoint file (None to keep progress in memory only)
+            inputs: Scan inputs, stored to check that a resume matches
+            sample_fps: Video sampling rate, stored for the same reason
+        """
+        self.path = path
+        self.inputs = list(inputs)
+        self.sample_fps = sample_fps
+        self.completed = 0
+        self.done = {}
+        self.digest = ''
+        self.results = 0
+        # Loaded progress still to be matched against the walk on resume
+        self._replay_end = 0
+        self._replay_digest = ''
+        self._expected = {}
+        self._rejected = False
+
+    def load(self):
+        """
+        Restore progress from the checkpoint file.
+
+        Returns:
+            True if a checkpoint was loaded
+
+        Raises:
+            ValueError: If the checkpoint belongs to a scan with other inputs
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return False
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if (state['inputs'] != self.inputs or state['sample_fps'] != self.sample_fps
+                or 'digest' not in state):
+            raise ValueError(f"Checkpoint {self.path} was written for different inputs or sample rate")
+
+        self.completed = state['completed']
+        self.done = {int(index): key for index, key in state['done'].items()}
+        self.digest = state['digest']
+        self.results = state['results']
+        self._replay_end = self.completed
+        self._expected = dict(self.done)
+        return True
+
+    def save(self):
+        """Write the checkpoint atomically (the output must be flushed first)."""
+        if self.path is None or self._rejected:
+            return
+        state = {
+            'inputs': self.inputs,
+            'sample_fps': self.sample_fps,
+            'completed': self.completed,
+            'done': {str(index): key for index, key in sorted(self.done.items())},
+            'digest': self.digest,
+            'results': self.results,
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def is_done(self, index, item):
+        """
+        Whether a walked item was finished before the scan was resumed.
+
+        Must be called for every item in walk order.
+
+        Raises:
+            ValueError: If the walk no longer matches the checkpoint
+        """
+        key = item_key(item)
+        if index < self._replay_end:
+            self._replay_digest = chain_digest(self._replay_digest, key)
+            if index == self._replay_end - 1 and self._replay_digest != self.digest:
+                self._reject(f"items before {key[0]} changed")
+            return True
+
+        expected = self._expected.pop(index, None)
+        if expected is not None:
+            if expected != key:
+                self._reject(f"item {index} is now {key[0]}, was {expected[0]}")
+            return True
+        return False
+
+    def check_walked(self, count):
+        """
+        Check, after the walk, that every item recorded as done was walked again.
+
+        Args:
+            count: Number of items the walk produced
+
+        Raises:
+            ValueError: If the walk ended before items the checkpoint recorded
+        """
+        if count < self._replay_end or self._expected:
+            self._reject(f"the inputs now hold only {count} item(s)")
+
+    def mark_done(self, index, item):
+        """Record one finished item, advancing the contiguous watermark."""
+        self.results += 1
+        self.done[index] = item_key(item)
+        while self.completed in self.done:
+            self.digest = chain_digest(self.digest, self.done.pop(self.completed))
+            self.completed += 1
+
+    def remove(self):
+        """Delete the checkpoint after a scan completed."""
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _reject(self, reason):
+        """Refuse a resume whose walk does not match, keeping the checkpoint file as it was."""
+        self._rejected = True
+        raise ValueError(f"Checkpoint {self.path} does not match the inputs: {reason}")
+
+
+class ResultWriter:
+    """Writes scan results as JSON lines or CSV rows (one row per face)."""
+
+    def __init__(self, path, fmt, append=False):
+        """
+        Initialize the writer.
+
+        Args:
+            path: Output file, or '-' for standard output
+            fmt: 'jsonl' or 'csv'
+            append: Add to an existing file instead of truncating it
+        """
+        self.fmt = fmt
+        if path == '-':
+            self._file = sys.stdout
+            self._owned = False
+        else:
+            self._file = open(path, 'a' if append else 'w', encoding='utf-8', newline='')
+            self._owned = True
+
+        self._csv = None
+        if fmt == 'csv':
+            self._csv = csv.writer(self._file)
+            if not self._owned or self._file.tell() == 0:
+                self._csv.writerow(CSV_FIELDS)
+
+    def write(self, record):
+        """Write one item's result."""
+        if self._csv is None:
+            self._file.write(json.dumps(record) + '\n')
+            return
+
+        head = [record['source'], record['frame'], record['time'], record['error']]
+        if not record['faces']:
+            self._csv.writerow(head + [''] * (len(CSV_FIELDS) - len(head)))
+        for i, face in enumerate(record['faces'], 1):
+            loc = face['location']
+            self._csv.writerow(head + [i, face['name'], round(face['confidence'], 4),
+                                       loc['left'], loc['top'], loc['right'], loc['bottom']])
+
+    def flush(self):
+        """Push written results to disk before the checkpoint claims them."""
+        self._file.flush()
+        if self._owned:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self._file.close()
+
+
+def scan(recognizer, inputs, output='-', fmt='jsonl', workers=None, sample_fps=1.0,
+         checkpoint_path=None, resume=False, window=None, checkpoint_interval=5.0, on_result=None):
+    """
+    Recognize faces in every image and sampled video frame under the inputs.
+
+    Args:
+        recognizer: Loaded FaceRecognizer (the model is loaded once and
+            shared with the workers)
+        inputs: Files, directories or glob patterns
+        output: Output file, or '-' for standard output
+        fmt: 'jsonl' or 'csv'
+        workers: Worker processes (None = one per CPU core, 0 = in this process)
+        sample_fps: Frames per second of video to recognize (None = every frame)
+        checkpoint_path: File recording progress (None = no checkpoint)
+        resume: Continue from the checkpoint instead of starting over
+        window: Items in flight at once (defaults to 4 per worker)
+        checkpoint_interval: Seconds between checkpoint saves
+        on_result: Optional callback called with every finished record
+
+    Returns:
+        Dict with items, faces, errors, resumed (items skipped as already
+        done) and seconds
+
+    Raises:
+        ValueError: If resuming from a checkpoint of a different scan
+    """
+    checkpoint = ScanCheckpoint(checkpoint_path, inputs, sample_fps)
+    resumed = resume and checkpoint.load()
+    writer = ResultWriter(output, fmt, append=resumed)
+    pool = RecognitionPool(recognizer, workers=workers, max_pending=window)
+    window = pool.max_pending
+    # Finished items ahead of the oldest unfinished one are kept in the
+    # checkpoint, so do not run further ahead than this
+    max_lead = 16 * window
+
+    reader = FrameReader()
+    pending = {}
+    stats = {'items': 0, 'faces': 0, 'errors': 0, 'resumed': checkpoint.results if resumed else 0}
+    started = time.monotonic()
+    last_save = started
+
+    def finish(index, item, result):
+        path, frame, seconds = item
+        record = {
+            'source': path,
+            'frame': frame,
+            'time': round(seconds, 3) if seconds is not None else None,
+            'error': result['error'],
+            'faces': result['faces'],
+        }
+        writer.write(record)
+        checkpoint.mark_done(index, item)
+        stats['items'] += 1
+        stats['faces'] += len(result['faces'])
+        stats['errors'] += 1 if result['error'] else 0
+        if on_result is not None:
+            on_result(record)
+
+    def drain(block):
+        nonlocal last_save
+        if not pending:
+            return
+        finished, _ = wait(list(pending), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in finished:
+            index, item = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'error': str(e), 'faces': []}
+            finish(index, item, result)
+
+        if time.monotonic() - last_save >= checkpoint_interval:
+            writer.flush()
+            checkpoint.save()
+            last_save = time.monotonic()
+
+    walked = 0
+    try:
+        for index, item in enumerate(iter_scan_items(inputs, sample_fps)):
+            walked = index + 1
+            if checkpoint.is_done(index, item):
+                continue
+
+            while pending and (len(pending) >= window or index - checkpoint.completed >= max_lead):
+                drain(block=True)
+
+            path, frame, _ = item
+            if frame is None:
+                future = pool.submit('recognize_faces_in_image', path)
+            else:
+                image = reader.read(path, frame)
+                if image is None:
+                    finish(index, item, {'error': 'Could not read frame', 'faces': []})
+                    continue
+                future = pool.submit('recognize_faces_in_buffer', image)
+            pending[future] = (index, item)
+            drain(block=False)
+
+        checkpoint.check_walked(walked)
+        while pending:
+            drain(block=True)
+    finally:
+        reader.close()
+        pool.shutdown(wait=False)
+        writer.close()
+        checkpoint.save()
+
+    checkpoint.remove()
+    stats['seconds'] = round(time.monotonic() - started, 3)
+    return stats
@@ -0,0 +1,244 @@
+import asyncio
+import threading
+
+
+class FrameBroadcaster:
+    """
+    One capture and recognition loop for a video source, shared by many viewers.
+
+    The loop publishes each encoded MJPEG part as the latest frame; every
+    subscriber waits for a newer frame than the one it last sent, so a
+    viewer that falls behind skips frames instead of slowing the loop down
+    or queueing them. The loop stops when its last subscriber detaches.
+    """
+
+    def __init__(self, recognizer, video_source=0, **pipeline_options):
+        """
+        Initialize the broadcaster.
+
+        Args:
+            recognizer: FaceRecognizer that runs the video pipeline
+            video_source: Device index, video file path or stream URL
+            **pipeline_options: Extra options for recognize_faces_in_video
+        """
+        self.recognizer = recognizer
+        self.video_source = video_source
+        self.pipeline_options = pipeline_options
+
+        self._cond = threading.Condition()
+        self._part = None
+        self._seq = 0
+        self._subscribers = 0
+        self._closed = False
+        self._done = False
+        self._thread = None
+        # (event loop, asyncio.Event) of async subscribers, woken on each frame
+        self._async_waiters = set()
+
+    @property
+    def subscriber_count(self):
+        """Number of viewers currently attached."""
+        with self._cond:
+            return self._subscribers
+
+    def attach(self):
+        """
+        Register a subscriber, starting the loop for the first one.
+
+        Returns:
+            False if the broadcaster has already shut down, True otherwise
+        """
+        with self._cond:
+            if self._closed:
+                return False
+
+            self._subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f'broadcast-{self.video_source}', daemon=True
+                )
+                self._thread.start()
+            return True
+
+    def detach(self):
+        """Unregister a subscriber, shutting the loop down after the last one."""
+        with self._cond:
+            self._subscribers -= 1
+            if self._subscribers <= 0:
+                self._closed = True
+            self._notify()
+
+    def stream(self):
+        """
+        Yield the latest MJPEG parts for one attached subscriber.
+
+        Yields:
+            Processed frame as bytes
+        """
+        last_seq = 0
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._seq != last_seq or self._done or self._closed,
+                    timeout=1.0
+                )
+                if self._seq == last_seq:
+                    if self._done or self._closed:
+                        return
+                    continue
+
+                part = self._part
+                last_seq = self._seq
+
+            yield part
+
+    async def astream(self):
+        """
+        Async version of stream for event-loop servers.
+
+        Waits on an asyncio.Event set from the capture thread instead of
+        blocking a thread per viewer, so one process can serve many streams.
+
+        Yields:
+            Processed frame as bytes
+        """
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        last_seq = 0
+
+        with self._cond:
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                with self._cond:
+                    if self._seq == last_seq:
+                        if self._done or self._closed:
+                            return
+                        # Cleared under the lock, so a frame published after
+                        # this check always sets the event again
+                        event.clear()
+                        part = None
+                    else:
+                        part = self._part
+                        last_seq = self._seq
+
+                if part is None:
+                    await event.wait()
+                else:
+                    yield part
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+    def _notify(self):
+        """Wake all subscribers; must be called with the condition held."""
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The subscriber's event loop has been closed
+                pass
+
+    def _run(self):
+        """Run the video pipeline and publish each frame to subscribers."""
+        frames = self.recognizer.recognize_faces_in_video(
+            video_source=self.video_source, **self.pipeline_options
+        )
+
+        try:
+            for part in frames:
+                with self._cond:
+                    if self._closed:
+                        break
+                    self._part = part
+                    self._seq += 1
+                    self._notify()
+        except Exception as e:
+            print(f"✗ Video broadcast for {self.video_source} failed: {str(e)}")
+        finally:
+            frames.close()
+            with self._cond:
+                self._closed = True
+                self._done = True
+                self._notify()
+
+
+class BroadcastHub:
+    """Registry handing out one FrameBroadcaster per video source."""
+
+    def __init__(self, recognizer, **pipeline_options):
+        """
+        Initialize the hub.
+
+        Args:
+            recognizer: FaceRecognizer shared by all broadcasters
+            **pipeline_options: Extra options for recognize_faces_in_video
+        """
+        self.recognizer = recognizer
+        self.pipeline_options = pipeline_options
+        self._broadcasters = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, video_source=0):
+        """
+        Stream annotated frames for a source, sharing its capture with other viewers.
+
+        Args:
+            video_source: Device index, video file path or stream URL
+
+        Yields:
+            Processed frame as bytes
+        """
+        broadcaster = self._attach(video_source)
+
+        try:
+            yield from broadcaster.stream()
+        finally:
+            broadcaster.detach()
+
+    async def asubscribe(self, video_source=0):
+        """
+        Async version of subscribe for event-loop servers.
+
+        Args:
+            video_source: Device index, video file path or stream URL
+
+        Yields:
+            Processed frame as bytes
+        """
+        broadcaster = self._attach(video_source)
+
+        try:
+            async for part in broadcaster.astream():
+                yield part
+        finally:
+            broadcaster.detach()
+
+    def active_sources(self):
+        """Return {video_source: subscriber count} for running broadcasters."""
+        with self._lock:
+            return {
+                source: broadcaster.subscriber_count
+                for source, broadcaster in self._broadcasters.items()
+                if broadcaster.subscriber_count > 0
+            }
+
+    def _attach(self, video_source):
+        """Attach to the running broadcaster for a source, or start a new one."""
+        with self._lock:
+            broadcaster = self._broadcasters.get(video_source)
+            if broadcaster is None or not broadcaster.attach():
+                broadcaster = FrameBroadcaster(
+                    self.recognizer, video_source, **self.pipeline_options
+                )
+                broadcaster.attach()
+                self._broadcasters[video_source] = broadcaster
+            return broadcaster
+
+
+def parse_video_source(value):
+    """Interpret a configured video source: digits are device indices, anything else a path or URL."""
+    value = str(value).strip()
+    return int(value) if value.isdigit() else value
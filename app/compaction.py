@@ -0,0 +1,260 @@
+"""
+Gallery compaction: a bounded set of prototype histograms per identity.
+
+Every enrolled image adds one LBPH histogram that is stored, held in
+memory and scanned on every search. Compaction first drops near-duplicate
+enrollments of a person, then picks at most ``max_prototypes`` of the
+remaining histograms with k-medoids. Prototypes are real enrolled
+histograms (not averages), so LBPH distances and the "Unknown" threshold
+mean the same as before. ``evaluate_compaction`` measures what this costs
+on a held-out split of the gallery.
+"""
+import threading
+import time
+import numpy as np
+from app.gallery import HistogramGallery
+
+DEFAULT_PROTOTYPES = 8
+# Cosine similarity of square-rooted histograms above which two enrollments
+# count as the same picture (re-saved, recompressed, resized, ...)
+DUPLICATE_SIMILARITY = 0.95
+# Held-out accuracy (as a fraction) a compaction may lose before it is refused
+MAX_ACCURACY_DROP = 0.02
+
+
+def _unit_roots(histograms):
+    """Square-rooted histograms scaled to unit length (cosine = Hellinger affinity)."""
+    roots = np.sqrt(np.asarray(histograms, dtype=np.float32))
+    norms = np.linalg.norm(roots, axis=1, keepdims=True)
+    return roots / np.maximum(norms, 1e-12)
+
+
+def remove_near_duplicates(roots, threshold=DUPLICATE_SIMILARITY):
+    """
+    Greedily keep rows that are not near-duplicates of a row kept before them.
+
+    Args:
+        roots: (n, dim) unit-length square-rooted histograms
+        threshold: Similarity above which a row is a duplicate
+
+    Returns:
+        Indices of the kept rows, in order
+    """
+    kept = []
+    for i in range(len(roots)):
+        if not kept or float(np.max(roots[kept] @ roots[i])) < threshold:
+            kept.append(i)
+    return np.array(kept, dtype=np.intp)
+
+
+def k_medoids(distances, k, iterations=20):
+    """
+    Pick k medoids from a distance matrix by alternating assignment and update.
+
+    Starts from the most central point and then repeatedly the point
+    farthest from the medoids chosen so far, so results are deterministic.
+
+    Args:
+        distances: (n, n) symmetric distance matrix
+        k: Number of medoids (k < n)
+        iterations: Maximum assignment/update rounds
+
+    Returns:
+        Sorted indices of the medoids
+    """
+    medoids = [int(np.argmin(distances.sum(axis=1)))]
+    nearest = distances[medoids[0]].copy()
+    while len(medoids) < k:
+        medoids.append(int(np.argmax(nearest)))
+        np.minimum(nearest, distances[medoids[-1]], out=nearest)
+    medoids = np.array(medoids, dtype=np.intp)
+
+    for _ in range(iterations):
+        assign = np.argmin(distances[:, medoids], axis=1)
+        updated = medoids.copy()
+        for cluster in range(k):
+            members = np.flatnonzero(assign == cluster)
+            if len(members):
+                updated[cluster] = members[np.argmin(distances[np.ix_(members, members)].sum(axis=1))]
+        if np.array_equal(updated, medoids):
+            break
+        medoids = updated
+
+    return np.sort(medoids)
+
+
+def select_prototypes(histograms, labels, max_prototypes=DEFAULT_PROTOTYPES,
+                      duplicate_similarity=DUPLICATE_SIMILARITY):
+    """
+    Choose the gallery rows to keep for every identity.
+
+    Args:
+        histograms: (n, dim) LBPH histograms
+        labels: n labels
+        max_prototypes: Most rows kept per identity (None = only remove duplicates)
+        duplicate_similarity: Similarity above which enrollments are merged
+            (None = keep duplicates)
+
+    Returns:
+        Sorted indices of the rows to keep
+    """
+    labels = np.asarray(labels)
+    keep = []
+    for label in np.unique(labels):
+        rows = np.flatnonzero(labels == label)
+        roots = _unit_roots(histograms[rows])
+
+        if duplicate_similarity is not None:
+            unique = remove_near_duplicates(roots, duplicate_similarity)
+            rows, roots = rows[unique], roots[unique]
+
+        if max_prototypes and len(rows) > max_prototypes:
+            # Hellinger-style distance between every pair of this person's faces
+            distances = np.maximum(1.0 - roots @ roots.T, 0.0)
+            rows = rows[k_medoids(distances, max_prototypes)]
+        keep.append(rows)
+
+    return np.sort(np.concatenate(keep)) if keep else np.empty(0, dtype=np.intp)
+
+
+def holdout_split(labels, fraction=0.2, seed=0):
+    """
+    Split rows into enrolled and held-out sets, per identity.
+
+    Identities with a single image are never held out, so every probe has
+    at least one enrolled image of the same person.
+
+    Returns:
+        Tuple of (enrolled row indices, held-out row indices)
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    enrolled, held_out = [], []
+    for label in np.unique(labels):
+        rows = rng.permutation(np.flatnonzero(labels == label))
+        count = min(len(rows) - 1, int(round(len(rows) * fraction)))
+        held_out.append(rows[:count])
+        enrolled.append(rows[count:])
+    return np.sort(np.concatenate(enrolled)), np.sort(np.concatenate(held_out))
+
+
+def _score(gallery, probes, truth, max_distance):
+    """Top-1 accuracy and mean search time of a gallery on labelled probes."""
+    # One probe per search, like a face in a live frame
+    started = time.perf_counter()
+    matches = [gallery.search(probe[None], k=1)[0] for probe in probes]
+    elapsed = time.perf_counter() - started
+
+    correct = sum(
+        1 for found, label in zip(matches, truth)
+        if found and found[0][0] == label and found[0][1] <= max_distance
+    )
+    return correct / len(truth), elapsed * 1000 / len(truth)
+
+
+def evaluate_compaction(histograms, labels, max_prototypes=DEFAULT_PROTOTYPES,
+                        duplicate_similarity=DUPLICATE_SIMILARITY, holdout=0.2,
+                        max_distance=100, gallery_factory=HistogramGallery, seed=0):
+    """
+    Compare the full and the compacted gallery on a held-out split.
+
+    A fraction of each person's images is held out as probes; the rest is
+    enrolled once as is and once compacted, and both are searched.
+
+    Args:
+        histograms: (n, dim) LBPH histograms of the gallery
+        labels: n labels
+        max_prototypes: Most prototypes per identity
+        duplicate_similarity: Similarity above which enrollments are merged
+        holdout: Fraction of each identity's images used as probes
+        max_distance: Distance above which a match counts as "Unknown"
+        gallery_factory: Callable returning an empty gallery index
+        seed: Random seed of the split
+
+    Returns:
+        Dict with probes, rows, bytes, accuracy and per-probe search_ms of
+        the 'full' and 'compact' galleries, and accuracy_change (compact - full)
+    """
+    histograms = np.asarray(histograms, dtype=np.float32)
+    labels = np.asarray(labels)
+    enrolled, held_out = holdout_split(labels, holdout, seed)
+    if len(held_out) == 0:
+        return {'probes': 0, 'message': 'Not enough images per person to hold any out'}
+
+    probes, truth = histograms[held_out], labels[held_out]
+    train_histograms, train_labels = histograms[enrolled], labels[enrolled]
+    keep = select_prototypes(train_histograms, train_labels, max_prototypes, duplicate_similarity)
+
+    report = {'probes': len(held_out)}
+    for name, rows in (('full', np.arange(len(enrolled))), ('compact', keep)):
+        gallery = gallery_factory()
+        gallery.add(train_histograms[rows], train_labels[rows])
+        accuracy, search_ms = _score(gallery, probes, truth, max_distance)
+        report[name] = {
+            'rows': len(rows),
+            'bytes': int(len(rows) * gallery.dim * 4),
+            'accuracy': round(accuracy, 4),
+            'search_ms': round(search_ms, 3),
+        }
+    report['accuracy_change'] = round(report['compact']['accuracy'] - report['full']['accuracy'], 4)
+    return report
+
+
+class CompactionSchedule:
+    """
+    Re-compacts a recognizer's gallery periodically once it has grown.
+
+    Enrollments added through the API append full histograms; this thread
+    checks every ``interval`` seconds and compacts again when the gallery
+    has grown by ``min_growth`` rows since the last compaction.
+    """
+
+    def __init__(self, recognizer, interval=3600.0, min_growth=1, **options):
+        """
+        Initialize the schedule.
+
+        Args:
+            recognizer: FaceRecognizer whose gallery is compacted
+            interval: Seconds between checks
+            min_growth: Rows added since the last compaction that trigger a new one
+            **options: Options for FaceRecognizer.compact_gallery
+        """
+        self.recognizer = recognizer
+        self.interval = interval
+        self.min_growth = min_growth
+        self.options = options
+        self.last_report = None
+        self._compacted_rows = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start checking in a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='gallery-compaction', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        """Compact now if the gallery has grown enough; returns the result or None."""
+        rows = len(self.recognizer.gallery)
+        if self._compacted_rows is not None and rows - self._compacted_rows < self.min_growth:
+            return None
+
+        result = self.recognizer.compact_gallery(**self.options)
+        if result['success']:
+            self._compacted_rows = len(self.recognizer.gallery)
+            self.last_report = result['report']
+        return result
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                result = self.run_once()
+            except Exception as e:
+                print(f"✗ Scheduled gallery compaction failed: {str(e)}")
+                continue
+            if result is not None:
+                print(f"{'✓' if result['success'] else '✗'} {result['message']}")
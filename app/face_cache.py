@@ -0,0 +1,300 @@
+import os
+import pickle
+import threading
+import numpy as np
+from app.file_lock import file_lock
+
+
+class FaceCropCache:
+    """
+    Persistent cache of cropped grayscale face regions for gallery images.
+
+    Crops are stored back to back in a raw uint8 blob that is read through
+    ``np.memmap``, with a small pickled index mapping each image path to its
+    modification time, size and row in the blob. The index also records the
+    detector settings, so changing them invalidates every entry at once.
+
+    Several processes (server workers, the CLI) may share one cache: appends
+    and index writes hold an exclusive lock on a lock file next to the blob,
+    new rows always go at the blob's current end, and save merges this
+    process's changes into the index on disk. A process whose blob was
+    compacted by another one notices the new file and reloads the index.
+    """
+
+    VERSION = 1
+    NO_FACE = -1
+
+    def __init__(self, data_file='face_crops.bin', index_file='face_crops_index.pkl',
+                 detector_key=None, roi_size=(200, 200)):
+        """
+        Initialize the crop cache.
+
+        Args:
+            data_file: Path of the raw crop blob
+            index_file: Path of the pickled index
+            detector_key: Hashable description of the detector settings
+            roi_size: (width, height) of the stored face crops
+        """
+        self.data_file = data_file
+        self.index_file = index_file
+        self.detector_key = detector_key
+        self.roi_size = tuple(roi_size)
+        self._record_size = self.roi_size[0] * self.roi_size[1]
+        self.lock_file = data_file + '.lock'
+        self._entries = {}
+        self._row_count = 0
+        self._data = None
+        # Identity of the blob the rows in _entries refer to (None = no blob yet)
+        self._data_id = None
+        # Changes since the last load or save, merged into the index on save
+        self._changed = {}
+        self._removed = set()
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the index from disk, discarding it if it no longer matches."""
+        with self._lock, self._file_lock():
+            self._load_index()
+
+    def _load_index(self):
+        """Replace the in-memory state with the index on disk; both locks must be held."""
+        self._entries = {}
+        self._changed = {}
+        self._removed = set()
+        self._data = None
+        self._loaded = True
+        index = self._read_index()
+        if index is None:
+            self._row_count = self._blob_rows()
+            self._data_id = self._blob_id()
+            return
+
+        self._entries = index['entries']
+        self._row_count = index['row_count']
+        self._data_id = self._blob_id()
+
+    def _read_index(self):
+        """
+        Read the index on disk; the file lock must be held.
+
+        Returns:
+            Index dict, or None if there is none. An unreadable index, one
+            for other detector settings, or one pointing past the end of the
+            blob is deleted together with the blob.
+        """
+        if not os.path.exists(self.index_file):
+            return None
+
+        try:
+            with open(self.index_file, 'rb') as f:
+                index = pickle.load(f)
+        except Exception:
+            self._remove_files()
+            return None
+
+        if (index.get('version') != self.VERSION
+                or index.get('detector_key') != self.detector_key
+                or tuple(index.get('roi_size', ())) != self.roi_size
+                or self._blob_rows() < index['row_count']):
+            self._remove_files()
+            return None
+        return index
+
+    def get(self, image_path):
+        """
+        Look up the cached crop for an image.
+
+        Args:
+            image_path: Path to the gallery image
+
+        Returns:
+            Tuple of (hit, face_roi). face_roi is None on a miss and on a hit
+            for an image in which no face was found.
+        """
+        if not self._loaded:
+            self.load()
+
+        with self._lock:
+            key = os.path.normpath(image_path)
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+
+            try:
+                stat = os.stat(image_path)
+            except OSError:
+                return False, None
+
+            mtime_ns, size, row = entry
+            if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+                return False, None
+
+            if row == self.NO_FACE:
+                return True, None
+
+            data = self._get_data()
+            if data is None:
+                # Another process compacted the blob; its rows are numbered differently now
+                with self._file_lock():
+                    self._load_index()
+                return False, None
+            return True, np.array(data[row])
+
+    def put(self, image_path, face_roi):
+        """
+        Store the crop for an image, or record that it contains no face.
+
+        Args:
+            image_path: Path to the gallery image
+            face_roi: Grayscale face crop of roi_size, or None
+        """
+        if not self._loaded:
+            self.load()
+
+        stat = os.stat(image_path)
+
+        with self._lock:
+            row = self.NO_FACE
+            if face_roi is not None:
+                record = np.ascontiguousarray(face_roi, dtype=np.uint8)
+                with self._file_lock():
+                    self._check_blob()
+                    # Other processes append too, so the next row is wherever the blob ends now
+                    with open(self.data_file, 'ab') as f:
+                        row = f.tell() // self._record_size
+                        f.seek(row * self._record_size)
+                        f.truncate()
+                        f.write(record.tobytes())
+                    if self._data_id is None:
+                        self._data_id = self._blob_id()
+                self._row_count = row + 1
+
+            entry = (stat.st_mtime_ns, stat.st_size, row)
+            key = os.path.normpath(image_path)
+            self._entries[key] = entry
+            self._changed[key] = entry
+            self._removed.discard(key)
+
+    def prune(self, keep_paths):
+        """Drop entries for images that are no longer in the gallery."""
+        keep = {os.path.normpath(path) for path in keep_paths}
+        with self._lock:
+            for key in [key for key in self._entries if key not in keep]:
+                del self._entries[key]
+                self._changed.pop(key, None)
+                self._removed.add(key)
+
+    def save(self):
+        """
+        Merge this process's changes into the index on disk and write it,
+        compacting the blob if it is mostly garbage.
+        """
+        with self._lock, self._file_lock():
+            self._check_blob()
+            index = self._read_index()
+            if self._blob_id() != self._data_id:
+                # The index on disk did not match and was discarded with the blob
+                self._load_index()
+                index = None
+            entries = index['entries'] if index is not None else {}
+            for key in self._removed:
+                entries.pop(key, None)
+            entries.update(self._changed)
+            self._entries = entries
+            self._changed = {}
+            self._removed = set()
+            self._row_count = self._blob_rows()
+
+            live_rows = sorted(
+                row for _, _, row in self._entries.values() if row != self.NO_FACE
+            )
+            if self._row_count > 2 * len(live_rows) + 64:
+                self._compact(live_rows)
+
+            index = {
+                'version': self.VERSION,
+                'detector_key': self.detector_key,
+                'roi_size': self.roi_size,
+                'row_count': self._row_count,
+                'entries': self._entries,
+            }
+            tmp_file = self.index_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(index, f)
+            os.replace(tmp_file, self.index_file)
+
+    def _compact(self, live_rows):
+        """Rewrite the blob keeping only rows referenced by the index."""
+        data = self._get_data()
+        remap = {}
+        tmp_file = self.data_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            for new_row, old_row in enumerate(live_rows):
+                f.write(np.asarray(data[old_row]).tobytes())
+                remap[old_row] = new_row
+
+        self._data = None
+        os.replace(tmp_file, self.data_file)
+        self._data_id = self._blob_id()
+        self._row_count = len(live_rows)
+        self._entries = {
+            key: (mtime_ns, size, remap.get(row, self.NO_FACE))
+            for key, (mtime_ns, size, row) in self._entries.items()
+        }
+
+    def _get_data(self):
+        """
+        Return a memmap over the blob, reopening it after appends.
+
+        Returns:
+            The memmap, or None if the blob on disk is no longer the one the
+            index rows refer to
+        """
+        if self._data is None or len(self._data) < self._row_count:
+            try:
+                f = open(self.data_file, 'rb')
+            except OSError:
+                return None
+            with f:
+                if self._file_id(os.fstat(f.fileno())) != self._data_id:
+                    return None
+                self._data = np.memmap(
+                    f, dtype=np.uint8, mode='r',
+                    shape=(self._row_count, self.roi_size[1], self.roi_size[0])
+                )
+        return self._data
+
+    def _check_blob(self):
+        """Reload the index if another process replaced the blob; both locks must be held."""
+        if self._blob_id() != self._data_id:
+            self._load_index()
+
+    def _blob_rows(self):
+        """Number of whole rows in the blob on disk."""
+        try:
+            return os.path.getsize(self.data_file) // self._record_size
+        except OSError:
+            return 0
+
+    def _blob_id(self):
+        """Identity of the blob file on disk, or None if there is none."""
+        try:
+            return self._file_id(os.stat(self.data_file))
+        except OSError:
+            return None
+
+    @staticmethod
+    def _file_id(stat):
+        """Device and inode of a stat result; compaction replaces the file, changing both."""
+        return stat.st_dev, stat.st_ino
+
+    def _file_lock(self):
+        """Hold the lock shared with other processes using the same cache."""
+        return file_lock(self.lock_file)
+
+    def _remove_files(self):
+        """Delete a stale index and blob."""
+        for path in (self.index_file, self.data_file):
+            if os.path.exists(path):
+                os.remove(path)
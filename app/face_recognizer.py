@@ -2,16 +2,194 @@ import os
 import cv2
 import numpy as np
 from pathlib import Path
-import pickle
-import sys
+import shutil
 import io
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import redirect_stderr
+from app.compaction import (evaluate_compaction, select_prototypes, DEFAULT_PROTOTYPES, DUPLICATE_SIMILARITY,
+                            MAX_ACCURACY_DROP)
+from app.face_cache import FaceCropCache
+from app.gallery import create_gallery
+from app.gallery_catalog import GalleryCatalog, ENROLLED, NO_FACE, file_sha256
+from app.model_store import (save_model, load_model, model_exists, convert_legacy_model, write_snapshot,
+                              publish_snapshot, append_delta, read_delta, apply_delta, split_model_id,
+                              current_model_id)
+from app.result_cache import ResultCache, difference_hash, frame_thumbnail
+from app.metrics import timed, collect, stage_timings, FACES_PER_IMAGE, MODEL_LOAD_SECONDS
+from app.video_pipeline import VideoPipeline
+from app.tenants import is_valid_tenant
+from app.tracker import FaceTracker, box_iou
+
+
+# LBPH distance above which the best match is reported as "Unknown"
+UNKNOWN_DISTANCE = 100
+
+# Times a change is retried against a snapshot another process just published
+MODEL_APPEND_ATTEMPTS = 5
+
+# Fold the model's delta log into a new snapshot once it reaches this
+# fraction of the snapshot's histogram bytes (and at least the minimum)
+DELTA_COMPACT_RATIO = 0.25
+DELTA_COMPACT_MIN_BYTES = 4 * 1024 * 1024
+
+# Cascade and detector settings used by gallery ingestion worker processes
+_worker_cascade = None
+_worker_detector_params = None
+
+# Cascade classifiers by file, shared by every recognizer in the process
+_cascades = {}
+_cascades_lock = threading.Lock()
+
+
+def _load_cascade(cascade_file):
+    """Return the process-wide cascade classifier for a file, loading it on first use."""
+    with _cascades_lock:
+        cascade = _cascades.get(cascade_file)
+        if cascade is None:
+            cascade = _cascades[cascade_file] = cv2.CascadeClassifier(cascade_file)
+        return cascade
+
+
+def _read_image(image_path):
+    """Read an image from disk, returning None if it cannot be decoded."""
+    # Convert path to forward slashes for OpenCV compatibility
+    image_path_fwd = image_path.replace('\\', '/')
+    
+    # Suppress libjpeg warnings
+    with redirect_stderr(io.StringIO()), timed('imread'):
+        return cv2.imread(image_path_fwd)
+
+
+def _decode_image(buffer):
+    """
+    Decode an in-memory image with cv2.imdecode.
+    
+    Args:
+        buffer: Encoded bytes-like object or 1-D uint8 array, or an already
+            decoded 2-D/3-D image array which is returned unchanged
+        
+    Returns:
+        Decoded BGR image, or None if it cannot be decoded
+    """
+    if isinstance(buffer, np.ndarray) and buffer.ndim in (2, 3):
+        return buffer
+    
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if data.size == 0:
+        return None
+    
+    # Suppress libjpeg warnings for corrupted frames from webcam
+    with redirect_stderr(io.StringIO()), timed('decode'):
+        return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def _detect_boxes(face_cascade, gray, scale_factor=1.1, min_neighbors=5, min_size=(30, 30),
+                  detection_width=None):
+    """
+    Run the cascade on a grayscale image, optionally downscaled first.
+    
+    Args:
+        face_cascade: Loaded cascade classifier
+        gray: Grayscale image array
+        scale_factor: Cascade scaleFactor
+        min_neighbors: Cascade minNeighbors
+        min_size: Smallest face (width, height) in full-resolution pixels
+        detection_width: Downscale images wider than this before detection
+            (None = detect at full resolution)
+        
+    Returns:
+        Array of (x, y, w, h) face boxes in full-resolution coordinates
+    """
+    scale = 1.0
+    small = gray
+    if detection_width and gray.shape[1] > detection_width:
+        scale = detection_width / gray.shape[1]
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    
+    min_w = max(1, int(round(min_size[0] * scale)))
+    min_h = max(1, int(round(min_size[1] * scale)))
+    
+    faces = face_cascade.detectMultiScale(
+        small, scaleFactor=scale_factor, minNeighbors=min_neighbors, minSize=(min_w, min_h)
+    )
+    
+    if len(faces) == 0:
+        return np.empty((0, 4), dtype=int)
+    
+    faces = np.asarray(faces)
+    if scale != 1.0:
+        # Map boxes back to the full-resolution image
+        faces = np.round(faces / scale).astype(int)
+        height, width = gray.shape[:2]
+        faces[:, 2] = np.minimum(faces[:, 2], width - faces[:, 0])
+        faces[:, 3] = np.minimum(faces[:, 3], height - faces[:, 1])
+    
+    return faces
+
+
+def _extract_face_roi(face_cascade, image, detector_params=None):
+    """Detect the first face in a BGR image and return it as a 200x200 grayscale crop."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    
+    # Detect faces
+    faces = _detect_boxes(face_cascade, gray, **(detector_params or {}))
+    
+    if len(faces) == 0:
+        return None
+    
+    # Use the first (largest) face, cropped from the full-resolution image
+    (x, y, w, h) = faces[0]
+    face_roi = gray[y:y+h, x:x+w]
+    return cv2.resize(face_roi, (200, 200))
+
+
+def _init_ingest_worker(cascade_file, detector_params):
+    """Load the cascade once per ingestion worker process."""
+    global _worker_cascade, _worker_detector_params
+    # Parallelism comes from the pool, so keep OpenCV single-threaded per worker
+    cv2.setNumThreads(1)
+    _worker_cascade = cv2.CascadeClassifier(cascade_file)
+    _worker_detector_params = detector_params
+
+
+def _ingest_image(job, face_cascade=None, detector_params=None):
+    """
+    Decode one gallery image and crop its face.
+    
+    Args:
+        job: Tuple of (index, image_path)
+        face_cascade: Cascade to detect with (defaults to the worker's cascade)
+        detector_params: Detection settings (defaults to the worker's settings)
+        
+    Returns:
+        Tuple of (index, loaded, face ROI or None, error message or None)
+    """
+    index, image_path = job
+    if face_cascade is None:
+        face_cascade = _worker_cascade
+        detector_params = _worker_detector_params
+    
+    try:
+        image = _read_image(image_path)
+        if image is None:
+            return index, False, None, None
+        
+        return index, True, _extract_face_roi(face_cascade, image, detector_params), None
+    except Exception as e:
+        return index, True, None, str(e)
 
 
 class FaceRecognizer:
-    """Face recognizer using OpenCV cascade classifiers and LBPH recognizer."""
+    """Face recognizer using OpenCV cascade classifiers and LBPH histograms."""
     
-    def __init__(self, known_faces_dir='known_faces', tolerance=0.6, model='cascade'):
+    def __init__(self, known_faces_dir='known_faces', tolerance=0.6, model='cascade', workers=1,
+                 scale_factor=1.1, min_neighbors=5, min_size=(30, 30), detection_width=None,
+                 roi_detection=False, roi_margin=0.5, full_scan_interval=10, index='brute',
+                 index_options=None, result_cache_size=0, result_cache_ttl=30.0, tenant=None,
+                 tenants_dir='tenants'):
         """
         Initialize the face recognizer.
         
@@ -19,248 +197,938 @@ class FaceRecognizer:
             known_faces_dir: Directory containing known face images
             tolerance: Face comparison tolerance (lower = more strict)
             model: Detection model ('cascade' using cascade classifiers)
+            workers: Processes used to ingest the gallery (0 = one per CPU core)
+            scale_factor: Cascade scaleFactor (larger = faster, fewer scales)
+            min_neighbors: Cascade minNeighbors (larger = fewer false positives)
+            min_size: Smallest face (width, height) to detect, in full-resolution pixels
+            detection_width: Run the cascade on images downscaled to at most this
+                width and map boxes back; faces are still cropped at full
+                resolution (None = detect at full resolution)
+            roi_detection: On video streams, search only around the previous
+                frame's faces between periodic full scans
+            roi_margin: Fraction of a face's size added on each side of its ROI
+            full_scan_interval: Detection passes between full-frame scans in ROI mode
+            index: Gallery index used for matching: 'brute' (exact) or 'ivf'
+                (approximate, for very large galleries)
+            index_options: Extra index options, e.g. {'nprobe': 16} for 'ivf'
+                (more clusters searched = better recall, slower)
+            result_cache_size: Results of recent images kept to answer
+                repeated or nearly identical frames at once (0 = no cache,
+                the default)
+            result_cache_ttl: Seconds a cached result stays valid
+            tenant: Tenant whose gallery this is; its known faces, model and
+                crop cache live under tenants_dir/<tenant>/ and known_faces_dir
+                is ignored (None = the deployment's own gallery in the
+                working directory)
+            tenants_dir: Directory holding one subdirectory per tenant
         """
+        if tenant is not None:
+            if not is_valid_tenant(tenant):
+                raise ValueError(f"Invalid tenant name: {tenant}")
+            data_dir = os.path.join(tenants_dir, tenant)
+            known_faces_dir = os.path.join(data_dir, 'known_faces')
+        else:
+            data_dir = ''
+        self.tenant = tenant
+        self.tenants_dir = tenants_dir
         self.known_faces_dir = known_faces_dir
         self.tolerance = tolerance
         self.model = model
-        self.encodings_file = 'face_encodings.pkl'
-        self.recognizer = cv2.face.LBPHFaceRecognizer_create()
+        self.workers = workers
+        self.detector_params = {
+            'scale_factor': scale_factor,
+            'min_neighbors': min_neighbors,
+            'min_size': tuple(min_size),
+            'detection_width': detection_width,
+        }
+        self.roi_detection = roi_detection
+        self.roi_margin = roi_margin
+        self.full_scan_interval = full_scan_interval
         self.known_face_labels = []
         self.known_face_names = []
         self.label_to_name = {}
-        self.model_file = 'face_model.yml'
+        self.index = index
+        self.index_options = dict(index_options or {})
+        self.gallery = create_gallery(index, **self.index_options)
+        self._model = (self.gallery, self.label_to_name)
+        self.model_version = 0
+        # Id of the saved snapshot matching the in-memory model (None = unsaved)
+        self.model_id = None
+        self.load_progress = {'stage': 'idle', 'done': 0, 'total': 0}
+        # Results keyed by content digest, for kiosks and clients resending the same image
+        self.result_cache = ResultCache(result_cache_size, result_cache_ttl) if result_cache_size else None
+        self.model_dir = os.path.join(data_dir, 'face_model')
+        # Legacy LBPH YAML model and label pickle, converted on first load
+        self.model_file = os.path.join(data_dir, 'face_model.yml')
+        self.encodings_file = os.path.join(data_dir, 'face_encodings.pkl')
+        self._model_loaded = False
+        self._lock = threading.RLock()
+        self._compact_thread = None
+        self._batch_executor = None
+        self._batch_executor_size = 0
         
-        # Load cascade classifiers
+        # Load cascade classifiers (parsed once per process, shared by all tenants)
         cascade_path = cv2.data.haarcascades
-        self.face_cascade = cv2.CascadeClassifier(
-            os.path.join(cascade_path, 'haarcascade_frontalface_default.xml')
+        self.cascade_file = os.path.join(cascade_path, 'haarcascade_frontalface_default.xml')
+        self.face_cascade = _load_cascade(self.cascade_file)
+        
+        # Cache of cropped gallery faces so retrains skip unchanged images
+        self.face_cache = FaceCropCache(
+            data_file=os.path.join(data_dir, 'face_crops.bin'),
+            index_file=os.path.join(data_dir, 'face_crops_index.pkl'),
+            detector_key=self._detector_key()
         )
         
+        # People with stable labels and images with content hashes and enrollment status
+        self.catalog = GalleryCatalog(os.path.join(data_dir, 'gallery.db'), self.known_faces_dir)
+        
         # Create directory if it doesn't exist
-        Path(self.known_faces_dir).mkdir(exist_ok=True)
+        Path(self.known_faces_dir).mkdir(parents=True, exist_ok=True)
         
-    def load_known_faces(self):
-        """Load and train model on known faces."""
+    def load_known_faces(self, workers=None):
+        """
+        Load and train model on known faces.
+        
+        Args:
+            workers: Processes used to ingest the gallery when training
+                (defaults to self.workers, 0 = one per CPU core)
+        """
         print(f"Loading known faces from {self.known_faces_dir}...")
+        started = time.perf_counter()
         
-        if os.path.exists(self.model_file) and os.path.exists(self.encodings_file):
-            print(f"Loading cached model from {self.model_file}...")
-            self.recognizer.read(self.model_file)
-            with open(self.encodings_file, 'rb') as f:
-                data = pickle.load(f)
-                self.label_to_name = data['label_to_name']
-                self.known_face_names = list(set(self.label_to_name.values()))
-            print(f"Loaded model with {len(self.label_to_name)} face(s)")
+        if self._load_saved_model():
+            self._sync_catalog()
+            MODEL_LOAD_SECONDS.set(time.perf_counter() - started)
             return
         
-        # Scan for image files
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp'}
-        face_images = []
-        face_labels = []
-        label_counter = 0
+        gallery, label_to_name, face_count = self._train_from_gallery(workers=workers)
         
-        for person_dir in os.listdir(self.known_faces_dir):
-            person_path = os.path.join(self.known_faces_dir, person_dir)
+        with self._lock:
+            self._set_model(gallery, label_to_name)
+            self._model_loaded = True
             
-            if not os.path.isdir(person_path):
-                continue
+            if face_count > 0:
+                self._save_model()
+                print(f"✓ Model saved to {self.model_dir}")
+        MODEL_LOAD_SECONDS.set(time.perf_counter() - started)
+        self._report_load_progress('ready', face_count, face_count)
+    
+    @property
+    def is_ready(self):
+        """Whether a model has been loaded or trained and recognition can run."""
+        return self._model_loaded
+    
+    def _set_model(self, gallery, label_to_name):
+        """
+        Swap in a new gallery and label map as one unit.
+        
+        Recognition reads self._model once per image, so requests in
+        flight finish against the model they started with while new ones
+        see the new model; nothing waits for the swap.
+        """
+        self._model = (gallery, label_to_name)
+        self.gallery = gallery
+        self.label_to_name = label_to_name
+        self.known_face_names = list(set(label_to_name.values()))
+        self.model_version += 1
+        if self.result_cache is not None:
+            self.result_cache.clear()
+    
+    def _report_load_progress(self, stage, done=0, total=0):
+        """Publish the progress of the initial model load (see load_progress)."""
+        if stage != 'ready' and self._model_loaded:
+            return
+        self.load_progress = {'stage': stage, 'done': done, 'total': total}
+    
+    def _load_saved_model(self):
+        """
+        Load the binary model, converting a legacy YAML/pickle model first.
+        
+        Returns:
+            True if a saved model was loaded, False if training is needed
+        """
+        try:
+            if model_exists(self.model_dir):
+                print(f"Loading cached model from {self.model_dir}...")
+                self._report_load_progress('loading_model')
+                gallery, label_to_name, model_id = load_model(
+                    self.model_dir, self.index, **self.index_options
+                )
+            elif os.path.exists(self.model_file) and os.path.exists(self.encodings_file):
+                print(f"Converting {self.model_file} to {self.model_dir}...")
+                self._report_load_progress('converting_model')
+                gallery, label_to_name, model_id = convert_legacy_model(
+                    self.model_file, self.encodings_file, self.model_dir,
+                    self.index, **self.index_options
+                )
+            else:
+                return False
+        except Exception as e:
+            print(f"✗ Could not load saved model: {str(e)}")
+            return False
+        
+        with self._lock:
+            self._set_model(gallery, label_to_name)
+            self.model_id = model_id
+            self._model_loaded = True
+        self._report_load_progress('ready', len(gallery), len(gallery))
+        print(f"Loaded model with {len(self.label_to_name)} face(s)")
+        return True
+    
+    def _train_from_gallery(self, label_to_name=None, workers=None):
+        """
+        Build a fresh gallery from every image in the catalog.
+        
+        Args:
+            label_to_name: Existing label map whose labels should be kept
+                for people the catalog does not know yet
+            workers: Number of ingestion worker processes (defaults to self.workers)
             
-            print(f"Processing images for: {person_dir}")
-            self.label_to_name[label_counter] = person_dir
+        Returns:
+            Tuple of (gallery, label_to_name, number of training faces)
+        """
+        # Labels come from the catalog, so they do not change between retrains
+        if label_to_name:
+            self.catalog.seed_labels(label_to_name)
+        self.catalog.sync()
+        new_label_to_name = self.catalog.label_to_name()
+        entries = self.catalog.images()
+        image_paths = [path for path, _ in entries]
+        image_labels = [label for _, label in entries]
+        
+        face_rois = self._ingest_catalog_images(entries, workers)
+        self.catalog.mark_trained()
+        self.face_cache.prune(image_paths)
+        self.face_cache.save()
+        
+        face_images = [roi for roi in face_rois if roi is not None]
+        face_labels = [label for roi, label in zip(face_rois, image_labels) if roi is not None]
+        
+        gallery = create_gallery(self.index, **self.index_options)
+        
+        if len(face_images) > 0:
+            print(f"\nTraining model with {len(face_images)} face(s)...")
+            self._report_load_progress('training', 0, len(face_images))
+            # Extract in chunks so only one copy of the histogram matrix is held
+            histograms = np.empty((len(face_images), gallery.dim), dtype=np.float32)
+            for start in range(0, len(face_images), 256):
+                histograms[start:start + 256] = gallery.extract(face_images[start:start + 256])
+            gallery.add(histograms, face_labels)
+        else:
+            print("No face images found for training.")
+        
+        return gallery, new_label_to_name, len(face_images)
+    
+    def _ingest_catalog_images(self, entries, workers=None):
+        """
+        Crop the faces of catalog images and record their enrollment status.
+        
+        Args:
+            entries: List of (image path, label) tuples from the catalog
+            workers: Number of ingestion worker processes (defaults to self.workers)
+            
+        Returns:
+            List of face ROIs (None where no face was found), in entry order
+        """
+        image_paths = [path for path, _ in entries]
+        face_rois = [None] * len(image_paths)
+        if workers is None:
+            workers = self.workers
+        
+        self._report_load_progress('ingesting', 0, len(image_paths))
+        for done, (index, face_roi) in enumerate(self._ingest_images(image_paths, workers), 1):
+            face_rois[index] = face_roi
+            self._report_load_progress('ingesting', done, len(image_paths))
+        
+        self.catalog.set_status(
+            (path, label, ENROLLED if face_roi is not None else NO_FACE)
+            for (path, label), face_roi in zip(entries, face_rois)
+        )
+        return face_rois
+    
+    def _sync_catalog(self):
+        """
+        Bring the catalog up to date with the gallery and the loaded model.
+        
+        People whose images were added or removed outside the API, or whose
+        label differs from the model's, are re-enrolled from their images
+        (crops come from the face cache) instead of retraining everyone.
+        A new catalog adopts the model's labels and trusts it for the rest.
+        """
+        try:
+            new_catalog = self.catalog.is_empty()
+            if new_catalog:
+                self.catalog.seed_labels(self.label_to_name)
+            self.catalog.sync()
+            
+            catalog_labels = self.catalog.label_to_name()
+            stale = {
+                label for label in set(catalog_labels) | set(self.label_to_name)
+                if catalog_labels.get(label) != self.label_to_name.get(label)
+            }
+            
+            if new_catalog:
+                # Images of people already in the model are enrolled as far as it knows
+                statuses = []
+                for path, label in self.catalog.images(set(catalog_labels) - stale):
+                    cached, face_roi = self.face_cache.get(path)
+                    statuses.append((path, label, NO_FACE if cached and face_roi is None else ENROLLED))
+                self.catalog.set_status(statuses)
+                self.catalog.mark_trained(set(catalog_labels) - stale)
+            else:
+                # Changed on disk, now or by an earlier sync (e.g. `cli.py list`)
+                stale |= self.catalog.changed_labels()
+        except Exception as e:
+            print(f"✗ Could not update the gallery catalog: {str(e)}")
+            return
+        
+        if stale:
+            self._reenroll(stale)
+    
+    def _reenroll(self, labels):
+        """
+        Replace the histograms of some people with ones from their current images.
+        
+        Args:
+            labels: Labels to re-enroll; labels no longer in the catalog are dropped
+        """
+        entries = self.catalog.images(labels)
+        face_rois = self._ingest_catalog_images(entries)
+        self.face_cache.save()
+        self.catalog.mark_trained(labels)
+        
+        rows = [(face_roi, label) for face_roi, (_, label) in zip(face_rois, entries) if face_roi is not None]
+        histograms = self.gallery.extract([face_roi for face_roi, _ in rows]) if rows else None
+        
+        with self._lock:
+            gallery = self.gallery
+            for label in labels:
+                gallery.remove_label(label)
+            if rows:
+                gallery.add(histograms, [label for _, label in rows])
+            self._set_model(gallery, self.catalog.label_to_name())
+            self._save_model()
+        print(f"✓ Updated {len(labels)} person(s) changed in {self.known_faces_dir}")
+    
+    def _ingest_images(self, image_paths, workers=1):
+        """
+        Decode, detect and crop gallery images, serving unchanged ones from the cache.
+        
+        Cache misses are processed in a pool of worker processes when workers
+        is greater than one. Results are yielded as soon as they are ready,
+        so they may arrive out of order.
+        
+        Args:
+            image_paths: Paths of the gallery images
+            workers: Number of worker processes (0 = one per CPU core)
             
-            for image_name in os.listdir(person_path):
-                if not any(image_name.lower().endswith(ext) for ext in image_extensions):
-                    continue
+        Yields:
+            Tuples of (index into image_paths, face ROI or None)
+        """
+        pending = []
+        
+        for index, image_path in enumerate(image_paths):
+            cached, face_roi = self.face_cache.get(image_path)
+            if cached:
+                self._report_ingested(image_path, True, face_roi, cached=True)
+                yield index, face_roi
+            else:
+                pending.append((index, image_path))
+        
+        if not pending:
+            return
+        
+        workers = workers or os.cpu_count() or 1
+        workers = min(workers, len(pending))
+        
+        if workers <= 1:
+            results = (
+                _ingest_image(job, self.face_cascade, self.detector_params) for job in pending
+            )
+            pool = None
+        else:
+            print(f"Processing {len(pending)} image(s) with {workers} worker(s)...")
+            pool = multiprocessing.Pool(
+                workers,
+                initializer=_init_ingest_worker,
+                initargs=(self.cascade_file, self.detector_params)
+            )
+            chunksize = max(1, min(16, len(pending) // (workers * 4)))
+            results = pool.imap_unordered(_ingest_image, pending, chunksize=chunksize)
+        
+        try:
+            for index, loaded, face_roi, error in results:
+                image_path = image_paths[index]
+                self._report_ingested(image_path, loaded, face_roi, error=error)
                 
-                image_path = os.path.join(person_path, image_name)
+                if loaded and error is None:
+                    self.face_cache.put(image_path, face_roi)
                 
-                try:
-                    # Convert path to forward slashes for OpenCV compatibility
-                    image_path_fwd = image_path.replace('\\', '/')
-                    
-                    # Suppress libjpeg warnings
-                    with redirect_stderr(io.StringIO()):
-                        image = cv2.imread(image_path_fwd)
-                    
-                    if image is None:
-                        print(f"  ✗ Failed to load: {image_name}")
-                        continue
-                    
-                    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-                    
-                    # Detect faces
-                    faces = self.face_cascade.detectMultiScale(
-                        gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30)
-                    )
-                    
-                    if len(faces) == 0:
-                        print(f"  ✗ No face found in: {image_name}")
-                        continue
-                    
-                    # Use the first (largest) face
-                    (x, y, w, h) = faces[0]
-                    face_roi = gray[y:y+h, x:x+w]
-                    face_roi = cv2.resize(face_roi, (200, 200))
-                    
-                    face_images.append(face_roi)
-                    face_labels.append(label_counter)
-                    print(f"  ✓ Encoded: {image_name}")
-                    
-                except Exception as e:
-                    print(f"  ✗ Error processing {image_name}: {str(e)}")
-            
-            label_counter += 1
+                yield index, face_roi
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+    
+    def _report_ingested(self, image_path, loaded, face_roi, error=None, cached=False):
+        """Print the outcome of ingesting one gallery image."""
+        image_name = os.path.relpath(image_path, self.known_faces_dir)
         
-        if len(face_images) > 0:
-            print(f"\nTraining model with {len(face_images)} face(s)...")
-            self.recognizer.train(face_images, np.array(face_labels))
-            self.recognizer.save(self.model_file)
+        if error is not None:
+            print(f"  ✗ Error processing {image_name}: {error}")
+        elif not loaded:
+            print(f"  ✗ Failed to load: {image_name}")
+        elif face_roi is None:
+            print(f"  ✗ No face found in: {image_name}")
+        else:
+            print(f"  ✓ Encoded: {image_name}{' (cached)' if cached else ''}")
+    
+    def _read_image(self, image_path):
+        """Read an image from disk, returning None if it cannot be decoded."""
+        return _read_image(image_path)
+    
+    def _detector_key(self):
+        """Describe the detection and crop settings that produce cached face crops."""
+        return (
+            os.path.basename(self.cascade_file),
+            tuple(sorted(self.detector_params.items())),
+            (200, 200)
+        )
+    
+    def _extract_face_roi(self, image):
+        """
+        Detect the first face in a BGR image and crop it for the recognizer.
+        
+        Args:
+            image: BGR image array
             
-            # Cache metadata
-            with open(self.encodings_file, 'wb') as f:
-                pickle.dump({'label_to_name': self.label_to_name}, f)
+        Returns:
+            200x200 grayscale face region, or None if no face was found
+        """
+        return _extract_face_roi(self.face_cascade, image, self.detector_params)
+    
+    def _save_model(self):
+        """Persist the gallery histograms and label map as a binary model."""
+        self.model_id = save_model(self.model_dir, self.gallery, self.label_to_name)
+    
+    def _record_change(self, record):
+        """
+        Apply one gallery change and persist it; called with the lock held.
+        
+        The change is appended to the saved model's delta log, so adding or
+        deleting a face does not rewrite every histogram. Changes other
+        processes appended meanwhile are applied first, in log order. When
+        another process has published a newer snapshot (a compaction or a
+        full save), that snapshot is loaded and the change appended to it,
+        so no process's changes are lost. Only without any saved model is
+        the whole model saved.
+        
+        Args:
+            record: Delta record (see app.model_store.append_delta)
+        """
+        appended = None
+        for _ in range(MODEL_APPEND_ATTEMPTS):
+            if self.model_id is not None:
+                appended = append_delta(self.model_dir, self.model_id, record)
+                if appended is not None:
+                    break
+            # Follow the live snapshot (and its delta log) before appending to it
+            if self.reload_saved_model() is None:
+                break
+        
+        if appended is None:
+            if self.model_id is not None:
+                raise RuntimeError('The saved model kept changing; could not record the change')
+            self._apply_changes([record])
+            if record['op'] == 'add':
+                self._save_model()
+            return
+        
+        model_id, others = appended
+        self._apply_changes(others + [record])
+        self.model_id = model_id
+        
+        delta_bytes = split_model_id(model_id)[1]
+        snapshot_bytes = len(self.gallery) * self.gallery.dim * 4
+        if delta_bytes >= max(DELTA_COMPACT_MIN_BYTES, DELTA_COMPACT_RATIO * snapshot_bytes):
+            self._start_compaction()
+    
+    def _apply_changes(self, records):
+        """Apply delta records to the in-memory model; called with the lock held."""
+        added = {label: name for record in records if record['op'] == 'add'
+                 for label, name in record['names'].items()}
+        if added:
+            # Names first, so new histograms are never matched without them
+            self._set_model(self.gallery, {**self.label_to_name, **added})
+        self._set_model(self.gallery, apply_delta(self.gallery, self.label_to_name, records))
+    
+    def _start_compaction(self):
+        """Fold the delta log into a new snapshot on a background thread; called with the lock held."""
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            return
+        self._compact_thread = threading.Thread(target=self._compact_model, daemon=True)
+        self._compact_thread.start()
+    
+    def _compact_model(self):
+        """
+        Write the in-memory model as a new snapshot and make it the live one.
+        
+        Only capturing the gallery and switching snapshots hold the lock;
+        faces added or deleted while the snapshot is written are carried
+        over to its delta log.
+        """
+        try:
+            with self._lock:
+                base_id = self.model_id
+                arrays, meta = self.gallery.export_state()
+                label_to_name = dict(self.label_to_name)
             
-            print(f"✓ Model saved to {self.model_file}")
-            self.known_face_names = list(set(self.label_to_name.values()))
+            snapshot_id = write_snapshot(self.model_dir, arrays, meta, label_to_name)
+            
+            with self._lock:
+                model_id = publish_snapshot(self.model_dir, snapshot_id, base_id, self.model_id)
+                if model_id is not None:
+                    self.model_id = model_id
+            if model_id is not None:
+                print(f"✓ Compacted model delta log into snapshot {snapshot_id}")
+        except Exception as e:
+            print(f"✗ Could not compact model delta log: {str(e)}")
+    
+    def reload_saved_model(self):
+        """
+        Swap in the latest saved model snapshot without training.
+        
+        Used by recognition worker processes to follow the model saved by
+        the process that owns the gallery; with no saved model the gallery
+        is emptied. While the live snapshot stays the same, only the
+        changes appended to its delta log since the last reload are applied.
+        
+        Returns:
+            Id of the model now in use (None if no model is saved)
+        """
+        if (self.model_id is not None and self._model_loaded
+                and current_model_id(self.model_dir) == split_model_id(self.model_id)[0]):
+            records, model_id = read_delta(self.model_dir, self.model_id)
+            with self._lock:
+                self._apply_changes(records)
+                self.model_id = model_id
+            return model_id
+        
+        if model_exists(self.model_dir):
+            gallery, label_to_name, model_id = load_model(
+                self.model_dir, self.index, **self.index_options
+            )
         else:
-            print("No face images found for training.")
+            gallery, label_to_name, model_id = create_gallery(self.index, **self.index_options), {}, None
+        
+        with self._lock:
+            self._set_model(gallery, label_to_name)
+            self.model_id = model_id
+            self._model_loaded = True
+        return model_id
+    
+    def memory_bytes(self):
+        """
+        Approximate memory held by this recognizer's model and caches.
+        
+        The cascade classifier is shared by all recognizers in the process
+        and is not counted.
+        """
+        gallery = self.gallery
+        size = len(gallery) * gallery.dim * 4 + 64 * 1024
+        if self.result_cache is not None:
+            size += self.result_cache.stats()['bytes']
+        return size
+    
+    def close(self):
+        """Release the batch thread pool and cached results, e.g. when evicted from memory."""
+        with self._lock:
+            executor, self._batch_executor = self._batch_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if self._compact_thread is not None:
+            self._compact_thread.join()
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        self.catalog.close()
     
-    def recognize_faces_in_image(self, image_path):
+    def recognize_faces_in_image(self, image_path, top_k=1, per_identity=False, timings=False):
         """
         Recognize faces in an image.
         
         Args:
             image_path: Path to the image file
+            top_k: Number of ranked gallery matches to return per face; with
+                more than one, each face gets a 'candidates' list
+            per_identity: Rank distinct people (best image each) instead of
+                individual gallery images
+            timings: Add a 'timings' dict of milliseconds spent per stage
+                (imread, decode, gray, detect, crop, extract, search, ...)
+                and in 'total'
             
         Returns:
             List of dicts with face information
         """
+        if timings:
+            return self._with_timings(self.recognize_faces_in_image, image_path, top_k, per_identity)
+        
+        if self.result_cache is not None:
+            # Read the encoded bytes so repeated images can be answered from the cache
+            try:
+                data = np.fromfile(image_path, dtype=np.uint8)
+            except Exception:
+                return {'error': None, 'faces': []}
+            return self.recognize_faces_in_buffer(data, top_k=top_k, per_identity=per_identity)
+        
         try:
-            # Convert path to forward slashes for OpenCV compatibility
-            image_path_fwd = image_path.replace('\\', '/')
+            image = _read_image(image_path)
+        except Exception:
+            # Handle corrupted JPEG and other image errors gracefully
+            image = None
+        
+        return self._recognize_decoded(image, top_k=top_k, per_identity=per_identity)
+    
+    def recognize_faces_in_buffer(self, buffer, tracker=None, top_k=1, per_identity=False,
+                                  timings=False):
+        """
+        Recognize faces in an encoded image held in memory.
+        
+        Args:
+            buffer: Encoded image (JPEG, PNG, ...) as bytes, bytearray,
+                memoryview or 1-D uint8 NumPy array, or an already decoded
+                BGR/grayscale NumPy image
+            tracker: Optional FaceTracker for consecutive frames of one
+                stream, which skips re-recognizing faces it already knows
+            top_k: Number of ranked gallery matches to return per face
+                (ignored when a tracker is given)
+            per_identity: Rank distinct people instead of gallery images
+            timings: Add a 'timings' dict of milliseconds per stage (see
+                recognize_faces_in_image)
             
-            # Suppress libjpeg warnings for corrupted frames from webcam
-            with redirect_stderr(io.StringIO()):
-                image = cv2.imread(image_path_fwd)
+        Returns:
+            Dict with 'error' and a 'faces' list of face information
+        """
+        if timings:
+            return self._with_timings(self.recognize_faces_in_buffer, buffer, tracker, top_k,
+                                      per_identity)
+        
+        # Tracked streams carry state between frames, so only stateless calls are cached
+        cache_key = None
+        if tracker is None:
+            cache_key, cached = self.cached_result(buffer, top_k, per_identity)
+            if cached is not None:
+                return cached
+        
+        try:
+            image = _decode_image(buffer)
+        except Exception:
+            # Handle corrupted JPEG and other image errors gracefully
+            image = None
+        
+        result = self._recognize_decoded(image, tracker=tracker, top_k=top_k,
+                                         per_identity=per_identity)
+        self.cache_result(cache_key, result)
+        return result
+    
+    @staticmethod
+    def _with_timings(method, *args):
+        """Call a recognize method and add the per-stage timings of this call to its result."""
+        started = time.perf_counter()
+        with collect() as observations:
+            result = method(*args)
+        
+        result['timings'] = stage_timings(observations)
+        result['timings']['total'] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+    
+    def cached_result(self, buffer, top_k=1, per_identity=False):
+        """
+        Look up an encoded image in the result cache.
+        
+        The key combines a perceptual hash of a small grayscale thumbnail,
+        the matching options and the model version, so re-encoded or nearly
+        identical frames share an entry and a model change never returns old
+        matches. A hit is only returned when the stored thumbnail matches
+        this image's pixel by pixel (see app.result_cache), so different
+        faces that happen to share a hash never share a result.
+        
+        Args:
+            buffer: Encoded image bytes or 1-D uint8 array
+            top_k: Number of ranked gallery matches per face
+            per_identity: Rank distinct people instead of gallery images
             
-            if image is None:
-                # Return empty results instead of error for corrupted/missing files
-                return {'error': None, 'faces': []}
+        Returns:
+            Tuple of (cache key, cached result dict or None); the key is
+            None when caching is off or the image cannot be decoded
+        """
+        if self.result_cache is None:
+            return None, None
+        if isinstance(buffer, np.ndarray) and buffer.ndim in (2, 3):
+            return None, None
+        
+        with timed('cache_lookup'):
+            try:
+                thumbnail = frame_thumbnail(buffer)
+            except Exception:
+                thumbnail = None
+            if thumbnail is None:
+                return None, None
             
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        except Exception as e:
-            # Handle corrupted JPEG and other image errors gracefully
-            error_str = str(e).lower()
-            if 'corrupt' in error_str or 'huffman' in error_str:
-                # Silently skip corrupted images from webcam stream
-                return {'error': None, 'faces': []}
+            key = (difference_hash(thumbnail), top_k, per_identity, self.model_version)
+            return (key, thumbnail), self.result_cache.get(key, thumbnail)
+    
+    def cache_result(self, key, result):
+        """Store a result under a key from cached_result (ignored for None keys and errors)."""
+        if key is None or self.result_cache is None or result.get('error'):
+            return
+        key, thumbnail = key
+        # Timings describe one call, not the cached answer
+        self.result_cache.put(key, {k: v for k, v in result.items() if k != 'timings'}, thumbnail)
+    
+    def recognize_batch(self, images, max_workers=None):
+        """
+        Recognize faces in many images at once.
+        
+        Images are decoded, detected and recognized concurrently on a
+        thread pool; OpenCV releases the GIL for the heavy work, so decoding
+        of one image overlaps detection of another.
+        
+        Args:
+            images: Iterable of image file paths, encoded image buffers or
+                decoded NumPy images (any mix)
+            max_workers: Size of the thread pool (defaults to the CPU count,
+                capped at 8)
+            
+        Returns:
+            List of result dicts in the same order as images, each in the
+            format returned by recognize_faces_in_image
+        """
+        images = list(images)
+        if not images:
+            return []
+        
+        executor = self._get_batch_executor(max_workers)
+        return list(executor.map(self._recognize_batch_item, images))
+    
+    def _recognize_batch_item(self, image):
+        """Recognize faces in one batch item, whatever form it comes in."""
+        if isinstance(image, (str, os.PathLike)):
+            return self.recognize_faces_in_image(os.fspath(image))
+        return self.recognize_faces_in_buffer(image)
+    
+    def _get_batch_executor(self, max_workers=None):
+        """Return the shared batch thread pool, creating it on first use."""
+        max_workers = max_workers or min(8, os.cpu_count() or 1)
+        with self._lock:
+            if self._batch_executor is None or self._batch_executor_size != max_workers:
+                if self._batch_executor is not None:
+                    self._batch_executor.shutdown(wait=False)
+                self._batch_executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix='recognize-batch'
+                )
+                self._batch_executor_size = max_workers
+            return self._batch_executor
+    
+    def _recognize_decoded(self, image, tracker=None, top_k=1, per_identity=False):
+        """
+        Detect and recognize faces in a decoded image.
+        
+        Args:
+            image: BGR or grayscale image array, or None if decoding failed
+            tracker: Optional FaceTracker carrying identities across frames
+            top_k: Number of ranked gallery matches to return per face
+            per_identity: Rank distinct people instead of gallery images
+            
+        Returns:
+            Dict with 'error' and a 'faces' list of face information
+        """
+        if image is None:
+            # Return empty results instead of error for corrupted/missing images
             return {'error': None, 'faces': []}
         
-        # Detect faces
-        faces = self.face_cascade.detectMultiScale(
-            gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30)
-        )
+        if image.ndim == 2:
+            gray = image
+        else:
+            with timed('gray'):
+                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
-        results = []
+        if tracker is not None:
+            results = tracker.update(image, gray)
+        else:
+            results = self.match_faces(gray, self.detect_faces(gray), top_k=top_k,
+                                       per_identity=per_identity)
+        FACES_PER_IMAGE.observe(len(results))
+        
+        return {'error': None, 'faces': results}
+    
+    def detect_faces(self, gray, regions=None):
+        """
+        Detect faces in a grayscale image.
         
-        for (x, y, w, h) in faces:
-            face_roi = gray[y:y+h, x:x+w]
-            face_roi = cv2.resize(face_roi, (200, 200))
+        Args:
+            gray: Grayscale image array
+            regions: Optional (x, y, w, h) boxes to restrict detection to,
+                e.g. the previous frame's faces; each is widened by
+                roi_margin before searching
             
-            # Recognize face
-            label, confidence = self.recognizer.predict(face_roi)
+        Returns:
+            Sequence of (x, y, w, h) face boxes in full-resolution coordinates
+        """
+        with timed('detect'):
+            if not regions:
+                return _detect_boxes(self.face_cascade, gray, **self.detector_params)
+            return self._detect_in_regions(gray, regions)
+    
+    def _detect_in_regions(self, gray, regions):
+        """Run detection only around the given boxes (see detect_faces)."""
+        height, width = gray.shape[:2]
+        found = []
+        
+        for (x, y, w, h) in regions:
+            margin_x = int(w * self.roi_margin)
+            margin_y = int(h * self.roi_margin)
+            x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+            x1, y1 = min(width, x + w + margin_x), min(height, y + h + margin_y)
+            if x1 <= x0 or y1 <= y0:
+                continue
             
-            # Lower confidence is better
-            confidence_score = 1.0 - (min(confidence, 255) / 255.0)
+            for (fx, fy, fw, fh) in _detect_boxes(self.face_cascade, gray[y0:y1, x0:x1],
+                                                  **self.detector_params):
+                box = (int(fx) + x0, int(fy) + y0, int(fw), int(fh))
+                # Overlapping regions can find the same face twice
+                if all(box_iou(box, other) < 0.5 for other in found):
+                    found.append(box)
+        
+        return found
+    
+    def identify_face(self, gray, box):
+        """
+        Recognize the face inside one detected box.
+        
+        Args:
+            gray: Grayscale image the box was detected in
+            box: (x, y, w, h) face box
+            
+        Returns:
+            Dict with the face's name, confidence and location
+        """
+        return self.match_faces(gray, [box])[0]
+    
+    def match_faces(self, gray, boxes, top_k=1, per_identity=False):
+        """
+        Recognize all faces of one image against the gallery in a single batch.
+        
+        The crops' LBPH histograms are matched against every enrolled
+        histogram at once (see HistogramGallery) instead of one
+        LBPH ``predict`` call per face.
+        
+        Args:
+            gray: Grayscale image the boxes were detected in
+            boxes: Sequence of (x, y, w, h) face boxes
+            top_k: Number of ranked gallery matches to return per face; with
+                more than one, each face gets a 'candidates' list
+            per_identity: Rank distinct people (best image each) instead of
+                individual gallery images
             
-            name = self.label_to_name.get(label, "Unknown")
-            if confidence > 100:  # Threshold for unknown
-                name = "Unknown"
-                confidence_score = 0
+        Returns:
+            List of dicts with each face's name, confidence and location
+        """
+        boxes = [tuple(int(v) for v in box) for box in boxes]
+        if not boxes:
+            return []
+        
+        with timed('crop'):
+            face_rois = [cv2.resize(gray[y:y+h, x:x+w], (200, 200)) for (x, y, w, h) in boxes]
+        
+        # Take one snapshot so a concurrent retrain cannot swap the gallery mid-batch
+        gallery, label_to_name = self._model
+        with timed('extract'):
+            probes = gallery.extract(face_rois)
+        with timed('search'):
+            matches = gallery.search(probes, k=max(1, top_k), per_identity=per_identity)
+        
+        results = []
+        for (x, y, w, h), face_matches in zip(boxes, matches):
+            candidates = [self._describe_match(label, distance, label_to_name)
+                          for label, distance in face_matches]
+            best = candidates[0] if candidates else {'name': "Unknown", 'confidence': 0.0}
             
-            results.append({
-                'name': name,
-                'confidence': float(confidence_score),
+            face = {
+                'name': best['name'],
+                'confidence': best['confidence'],
                 'location': {
-                    'top': int(y),
-                    'right': int(x + w),
-                    'bottom': int(y + h),
-                    'left': int(x)
+                    'top': y,
+                    'right': x + w,
+                    'bottom': y + h,
+                    'left': x
                 }
-            })
+            }
+            if top_k > 1:
+                face['candidates'] = candidates
+            results.append(face)
         
-        return {'error': None, 'faces': results}
+        return results
+    
+    @staticmethod
+    def _describe_match(label, distance, label_to_name):
+        """Turn a (label, LBPH distance) match into a name and confidence score."""
+        # Lower distance is better
+        confidence_score = 1.0 - (min(distance, 255) / 255.0)
+        
+        name = label_to_name.get(label, "Unknown")
+        if distance > UNKNOWN_DISTANCE:
+            name = "Unknown"
+            confidence_score = 0
+        
+        return {
+            'name': name,
+            'confidence': float(confidence_score),
+            'distance': float(distance)
+        }
     
-    def recognize_faces_in_video(self, video_source=0, max_frames=None):
+    def recognize_faces_in_video(self, video_source=0, max_frames=None, target_fps=None,
+                                 detect_fps=None, max_latency=0.5, track_faces=True,
+                                 tracker_options=None):
         """
         Recognize faces in video stream (webcam or video file).
         
+        Capture, detection and encoding run as separate stages (see
+        VideoPipeline): detection always works on the newest frame and the
+        last known faces are redrawn on the frames in between, so slow
+        detection skips frames instead of building up latency.
+        
         Args:
             video_source: 0 for webcam, or path to video file
             max_frames: Maximum frames to process (None for unlimited)
+            target_fps: Maximum rate of output frames (None for unlimited)
+            detect_fps: Maximum rate of detection passes (None for unlimited)
+            max_latency: Drop frames older than this many seconds
+            track_faces: Carry identities across frames with a FaceTracker
+                instead of re-recognizing every face on every pass
+            tracker_options: Extra FaceTracker options (e.g. tracker_type,
+                detect_interval, refresh_interval)
             
         Yields:
             Processed frame as bytes
         """
-        cap = cv2.VideoCapture(video_source)
-        frame_count = 0
-        process_every_n_frames = 2  # Process every 2nd frame for speed
-        
-        try:
-            while True:
-                ret, frame = cap.read()
-                
-                if not ret:
-                    break
-                
-                frame_count += 1
-                
-                # Process every nth frame for performance
-                if frame_count % process_every_n_frames != 0:
-                    continue
-                
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = self.face_cascade.detectMultiScale(
-                    gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30)
-                )
-                
-                for (x, y, w, h) in faces:
-                    face_roi = gray[y:y+h, x:x+w]
-                    face_roi = cv2.resize(face_roi, (200, 200))
-                    
-                    label, confidence = self.recognizer.predict(face_roi)
-                    confidence_score = 1.0 - (min(confidence, 255) / 255.0)
-                    
-                    name = self.label_to_name.get(label, "Unknown")
-                    if confidence > 100:
-                        name = "Unknown"
-                    
-                    # Draw box and label
-                    color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
-                    
-                    label_text = f"{name} ({confidence_score:.2f})" if name != "Unknown" else name
-                    cv2.rectangle(frame, (x, y + h - 35), (x + w, y + h), color, cv2.FILLED)
-                    cv2.putText(frame, label_text, (x + 6, y + h - 6), 
-                              cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
-                
-                # Encode frame to jpeg
-                ret, buffer = cv2.imencode('.jpg', frame)
-                frame_bytes = buffer.tobytes()
-                
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                
-                if max_frames and frame_count >= max_frames:
-                    break
-        
-        finally:
-            cap.release()
+        pipeline = VideoPipeline(
+            self,
+            video_source=video_source,
+            target_fps=target_fps,
+            detect_fps=detect_fps,
+            max_latency=max_latency,
+            tracker=FaceTracker(self, **(tracker_options or {})) if track_faces else None
+        )
+        yield from pipeline.frames(max_frames=max_frames)
     
     def add_face_to_known(self, image_path, person_name):
         """
         Add a face image to the known faces collection.
         
+        Only the new image is detected and cropped; its histogram is appended
+        to the existing gallery instead of retraining on the whole gallery,
+        and to the saved model's delta log instead of rewriting the model.
+        
         Args:
             image_path: Path to the image
             person_name: Name of the person
@@ -268,18 +1136,184 @@ class FaceRecognizer:
         Returns:
             Success status and message
         """
-        person_dir = os.path.join(self.known_faces_dir, person_name)
-        Path(person_dir).mkdir(exist_ok=True)
+        if not self._is_valid_person_name(person_name):
+            return {'success': False, 'message': f'Invalid person name: {person_name}'}
         
         try:
-            import shutil
-            dest_path = os.path.join(person_dir, os.path.basename(image_path))
-            shutil.copy(image_path, dest_path)
+            # The same picture is enrolled only once, under any name
+            sha256 = file_sha256(image_path)
+            duplicate = self.catalog.find_image(sha256)
+            if duplicate is not None:
+                return {'success': False, 'message': f'Duplicate image: already enrolled for {duplicate[0]}'}
             
-            # Clear cache to force reload
-            if os.path.exists(self.encodings_file):
-                os.remove(self.encodings_file)
+            image = self._read_image(image_path)
+            if image is None:
+                return {'success': False, 'message': 'Could not read image'}
+            
+            face_roi = self._extract_face_roi(image)
+            if face_roi is None:
+                return {'success': False, 'message': 'No face found in image'}
+            
+            if not self._model_loaded:
+                self.load_known_faces()
+            
+            person_dir = os.path.join(self.known_faces_dir, person_name)
+            dest_path = None
+            try:
+                # Copy and record in one transaction; a concurrent upload of
+                # the same picture waits and then sees it as a duplicate
+                with self.catalog.transaction():
+                    duplicate = self.catalog.find_image(sha256)
+                    if duplicate is not None:
+                        return {'success': False,
+                                'message': f'Duplicate image: already enrolled for {duplicate[0]}'}
+                    Path(person_dir).mkdir(exist_ok=True)
+                    dest_path = self._unique_path(person_dir, os.path.basename(image_path))
+                    shutil.copy(image_path, dest_path)
+                    label = self.catalog.add_image(person_name, dest_path, sha256)
+            except Exception:
+                if dest_path is not None and os.path.exists(dest_path):
+                    os.remove(dest_path)
+                raise
+            self.face_cache.put(dest_path, face_roi)
+            self.face_cache.save()
+            
+            with self._lock:
+                self._record_change({
+                    'op': 'add',
+                    'labels': [label],
+                    'names': {label: person_name},
+                    'histograms': self.gallery.extract([face_roi]),
+                })
             
             return {'success': True, 'message': f'Face added for {person_name}'}
         except Exception as e:
             return {'success': False, 'message': f'Error adding face: {str(e)}'}
+    
+    def delete_face_from_known(self, person_name):
+        """
+        Remove a person from the known faces collection.
+        
+        The person's label and histograms are dropped from the label map and
+        the gallery straight away, so from the next recognition on their
+        faces match the next-best person (or "Unknown"), and the deletion is
+        appended to the saved model's delta log; no retrain is needed.
+        
+        Args:
+            person_name: Name of the person
+            
+        Returns:
+            Success status and message
+        """
+        if not self._is_valid_person_name(person_name):
+            return {'success': False, 'message': f'Invalid person name: {person_name}'}
+        
+        person_dir = os.path.join(self.known_faces_dir, person_name)
+        if not os.path.isdir(person_dir):
+            return {'success': False, 'message': 'Person not found'}
+        
+        try:
+            # The catalog entry goes only if the files could be removed
+            with self.catalog.transaction():
+                self.catalog.remove_person(person_name)
+                shutil.rmtree(person_dir)
+            
+            with self._lock:
+                label = self._label_for_name(person_name)
+                if label is not None:
+                    self._record_change({'op': 'remove', 'label': label})
+            
+            return {'success': True, 'message': f'Deleted {person_name}'}
+        except Exception as e:
+            return {'success': False, 'message': f'Error deleting face: {str(e)}'}
+    
+    def compact_gallery(self, max_prototypes=DEFAULT_PROTOTYPES, duplicate_similarity=DUPLICATE_SIMILARITY,
+                        holdout=0.2, evaluate=True, max_accuracy_drop=MAX_ACCURACY_DROP):
+        """
+        Shrink the gallery to a few prototype histograms per person.
+        
+        Near-duplicate enrollments are dropped and each person's remaining
+        histograms are reduced to at most max_prototypes with k-medoids
+        (see app.compaction). The compacted gallery replaces the current one
+        and is saved; images in the known faces directory are kept, so a
+        retrain restores the full gallery. A compaction that loses more
+        held-out accuracy than max_accuracy_drop is refused and the gallery
+        is left as it is.
+        
+        Args:
+            max_prototypes: Most histograms kept per person
+            duplicate_similarity: Similarity above which enrollments are merged
+            holdout: Fraction of each person's images held out to measure
+                the accuracy change
+            evaluate: Measure the accuracy change before compacting
+            max_accuracy_drop: Largest held-out accuracy loss (as a fraction)
+                accepted when evaluated (None = accept any)
+            
+        Returns:
+            Success status, message and a 'report' with the gallery sizes
+            and, when evaluated, the held-out accuracy of both galleries
+        """
+        with self._lock:
+            gallery, label_to_name = self._model
+            model_version = self.model_version
+            histograms = gallery.histograms
+            labels = np.array(gallery.labels)
+        
+        if len(labels) == 0:
+            return {'success': False, 'message': 'Gallery is empty', 'report': None}
+        
+        report = {}
+        if evaluate:
+            report['evaluation'] = evaluate_compaction(
+                histograms, labels, max_prototypes, duplicate_similarity, holdout,
+                max_distance=UNKNOWN_DISTANCE,
+                gallery_factory=lambda: create_gallery(self.index, **self.index_options)
+            )
+            change = report['evaluation'].get('accuracy_change')
+            if max_accuracy_drop is not None and change is not None and change < -max_accuracy_drop:
+                message = (f"Compaction refused: held-out accuracy would drop by {-change * 100:.2f} points "
+                           f"(limit {max_accuracy_drop * 100:.2f})")
+                return {'success': False, 'message': message, 'report': report}
+        
+        keep = select_prototypes(histograms, labels, max_prototypes, duplicate_similarity)
+        compacted = create_gallery(self.index, **self.index_options)
+        compacted.add(histograms[keep], labels[keep])
+        
+        with self._lock:
+            # Faces added or deleted meanwhile would be lost by the swap
+            if self._model[0] is not gallery or self.model_version != model_version or len(gallery) != len(labels):
+                return {'success': False, 'message': 'Gallery changed during compaction, try again', 'report': None}
+            self._set_model(compacted, label_to_name)
+            self._save_model()
+        
+        report.update({'rows_before': len(labels), 'rows_after': len(keep)})
+        message = f"Compacted gallery from {len(labels)} to {len(keep)} histogram(s)"
+        return {'success': True, 'message': message, 'report': report}
+    
+    def _label_for_name(self, person_name):
+        """Return the label assigned to a person, or None if unknown."""
+        for label, name in self.label_to_name.items():
+            if name == person_name:
+                return label
+        return None
+    
+    @staticmethod
+    def _is_valid_person_name(person_name):
+        """Check that a person name maps to a single directory inside the gallery."""
+        return (
+            bool(person_name)
+            and person_name not in ('.', '..')
+            and os.path.basename(person_name) == person_name
+            and '\\' not in person_name
+        )
+    
+    @staticmethod
+    def _unique_path(directory, filename):
+        """Return a path in directory for filename that does not overwrite a file."""
+        stem, ext = os.path.splitext(filename)
+        dest_path = os.path.join(directory, filename)
+        counter = 1
+        while os.path.exists(dest_path):
+            dest_path = os.path.join(directory, f"{stem}_{counter}{ext}")
+            counter += 1
+        return dest_path
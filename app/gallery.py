@@ -0,0 +1,536 @@
+import threading
+import cv2
+import numpy as np
+
+
+class HistogramGallery:
+    """
+    LBPH histograms of all enrolled faces as one contiguous float32 matrix.
+
+    ``cv2.face.LBPHFaceRecognizer.predict`` compares a probe against every
+    training histogram one at a time and only returns the best label. Here
+    the gallery keeps the element-wise square roots of the histograms, so a
+    single matrix product gives the Hellinger similarity of every probe in a
+    frame against every enrolled face. The best ``shortlist`` candidates per
+    probe are then re-ranked with the exact chi-square distance LBPH uses,
+    which keeps distances (and the "Unknown" threshold) identical to
+    ``predict`` while returning the top-k matches.
+
+    This is the exact (brute-force) index; see IVFGallery for an
+    approximate one that scales to very large galleries.
+    """
+
+    kind = 'brute'
+
+    def __init__(self, radius=1, neighbors=8, grid_x=8, grid_y=8, shortlist=32):
+        """
+        Initialize an empty gallery.
+
+        Args:
+            radius: LBP radius of the histograms
+            neighbors: LBP sample points of the histograms
+            grid_x: Horizontal cells of the spatial histogram
+            grid_y: Vertical cells of the spatial histogram
+            shortlist: Candidates per probe re-ranked with the exact distance
+        """
+        self.radius = radius
+        self.neighbors = neighbors
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.shortlist = shortlist
+        self.dim = grid_x * grid_y * (2 ** neighbors)
+
+        self._roots = np.empty((0, self.dim), dtype=np.float32)
+        self._labels = np.empty(0, dtype=np.int32)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @classmethod
+    def from_recognizer(cls, recognizer, **kwargs):
+        """
+        Build a gallery from the histograms stored in a trained LBPH model.
+
+        Args:
+            recognizer: cv2.face.LBPHFaceRecognizer (trained or empty)
+            **kwargs: Extra HistogramGallery options
+
+        Returns:
+            HistogramGallery with the model's histograms and labels
+        """
+        gallery = cls(
+            radius=recognizer.getRadius(),
+            neighbors=recognizer.getNeighbors(),
+            grid_x=recognizer.getGridX(),
+            grid_y=recognizer.getGridY(),
+            **kwargs
+        )
+        if not recognizer.empty():
+            histograms = recognizer.getHistograms()
+            labels = recognizer.getLabels().ravel()
+            gallery.add(np.vstack(histograms) if histograms else None, labels)
+        return gallery
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def labels(self):
+        """Labels of the enrolled histograms, in row order."""
+        return self._labels[:self._count]
+
+    @property
+    def histograms(self):
+        """Enrolled histograms as an (N, dim) float32 matrix."""
+        roots = self._roots[:self._count]
+        return roots * roots
+
+    def extract(self, face_rois):
+        """
+        Compute LBPH histograms for face crops exactly as the LBPH model does.
+
+        Args:
+            face_rois: List of grayscale face crops
+
+        Returns:
+            (len(face_rois), dim) float32 matrix of histograms
+        """
+        if len(face_rois) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+
+        # A scratch model per thread; training it only computes histograms
+        extractor = getattr(self._local, 'extractor', None)
+        if extractor is None:
+            extractor = cv2.face.LBPHFaceRecognizer_create(
+                self.radius, self.neighbors, self.grid_x, self.grid_y
+            )
+            self._local.extractor = extractor
+
+        extractor.train(list(face_rois), np.zeros(len(face_rois), dtype=np.int32))
+        return np.vstack(extractor.getHistograms()).astype(np.float32, copy=False)
+
+    def add(self, histograms, labels):
+        """
+        Append histograms to the gallery.
+
+        Rows are written past the current count before it is advanced, so
+        concurrent searches keep seeing a consistent gallery.
+
+        Args:
+            histograms: (n, dim) matrix of LBPH histograms
+            labels: n integer labels
+        """
+        labels = np.asarray(labels, dtype=np.int32).ravel()
+        if histograms is None or len(labels) == 0:
+            return
+
+        roots = np.sqrt(np.asarray(histograms, dtype=np.float32).reshape(len(labels), self.dim))
+
+        with self._lock:
+            needed = self._count + len(labels)
+            if needed > len(self._roots):
+                capacity = max(needed, 2 * len(self._roots), 64)
+                new_roots = np.empty((capacity, self.dim), dtype=np.float32)
+                new_labels = np.empty(capacity, dtype=np.int32)
+                new_roots[:self._count] = self._roots[:self._count]
+                new_labels[:self._count] = self._labels[:self._count]
+                new_roots[self._count:needed] = roots
+                new_labels[self._count:needed] = labels
+                self._roots, self._labels = new_roots, new_labels
+            else:
+                self._roots[self._count:needed] = roots
+                self._labels[self._count:needed] = labels
+            self._count = needed
+
+    def remove_label(self, label):
+        """
+        Drop every histogram enrolled under a label.
+
+        Returns:
+            Number of histograms removed
+        """
+        with self._lock:
+            keep = self._labels[:self._count] != label
+            removed = int(self._count - keep.sum())
+            if removed:
+                self._keep_rows(keep)
+            return removed
+
+    def _keep_rows(self, keep):
+        """Drop the rows not selected by a boolean mask; called with the lock held."""
+        roots = self._roots[:self._count][keep]
+        labels = self._labels[:self._count][keep]
+        # Swap in fresh arrays so in-flight searches are unaffected
+        self._roots, self._labels, self._count = roots, labels, len(labels)
+
+    def search(self, probes, k=1, per_identity=False):
+        """
+        Find the nearest enrolled faces for a batch of probe histograms.
+
+        Args:
+            probes: (m, dim) matrix of probe histograms
+            k: Number of matches to return per probe
+            per_identity: Return the best distance per label (distinct
+                identities) instead of per enrolled image
+
+        Returns:
+            List with, for each probe, up to k (label, chi-square distance)
+            tuples sorted from best to worst
+        """
+        with self._lock:
+            state = self._snapshot()
+        roots = state['roots']
+        labels = state['labels']
+
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, self.dim)
+        if len(roots) == 0 or len(probes) == 0:
+            return [[] for _ in range(len(probes))]
+
+        probe_roots = np.sqrt(probes)
+        shortlist = max(self.shortlist, 4 * k if per_identity else k)
+
+        results = []
+        for probe, candidates in zip(probes, self._shortlists(state, probe_roots, shortlist)):
+            distances = chi_square(roots[candidates] ** 2, probe)
+            order = np.argsort(distances, kind='stable')
+            matches = [(int(labels[candidates[i]]), float(distances[i])) for i in order]
+
+            if per_identity:
+                best = {}
+                for label, distance in matches:
+                    if label not in best:
+                        best[label] = distance
+                matches = list(best.items())
+
+            results.append(matches[:k])
+
+        return results
+
+    def _snapshot(self):
+        """Return the arrays a search needs; called with the lock held."""
+        return {'roots': self._roots[:self._count], 'labels': self._labels[:self._count]}
+
+    def _shortlists(self, state, probe_roots, size):
+        """
+        Pick the candidate rows of each probe to re-rank exactly.
+
+        Args:
+            state: Snapshot from _snapshot
+            probe_roots: (m, dim) square roots of the probe histograms
+            size: Candidates wanted per probe
+
+        Returns:
+            List of m row index arrays
+        """
+        # Hellinger similarity of every probe against every enrolled face
+        similarity = state['roots'] @ probe_roots.T
+        return [_top_indices(similarity[:, j], size) for j in range(len(probe_roots))]
+
+    def export_state(self):
+        """
+        Return the gallery contents for persisting (see app.model_store).
+
+        Returns:
+            Tuple of ({name: array}, meta dict)
+        """
+        with self._lock:
+            arrays, meta = self._state_for_save()
+
+        meta.update({
+            'kind': self.kind,
+            'lbp': [self.radius, self.neighbors, self.grid_x, self.grid_y],
+            'shortlist': self.shortlist,
+        })
+        return arrays, meta
+
+    @classmethod
+    def from_state(cls, arrays, meta, **options):
+        """
+        Rebuild a gallery from export_state output.
+
+        Args:
+            arrays: {name: array}; the histograms may be a read-only memory
+                map, they are only copied once the gallery grows
+            meta: Meta dict from export_state
+            **options: Backend options (e.g. nprobe) overriding the saved ones
+
+        Returns:
+            Gallery instance
+        """
+        radius, neighbors, grid_x, grid_y = meta['lbp']
+        options.setdefault('shortlist', meta['shortlist'])
+        gallery = cls(radius=radius, neighbors=neighbors, grid_x=grid_x, grid_y=grid_y, **options)
+        gallery._restore(arrays, meta)
+        return gallery
+
+    def _state_for_save(self):
+        """Return ({name: array}, meta) to persist; called with the lock held."""
+        return {
+            'roots': self._roots[:self._count],
+            'labels': self._labels[:self._count],
+        }, {}
+
+    def _restore(self, arrays, meta):
+        """Adopt arrays from export_state (roots may be a read-only memory map)."""
+        self._roots = arrays['roots']
+        self._labels = np.array(arrays['labels'], dtype=np.int32)
+        self._count = len(self._labels)
+
+
+class IVFGallery(HistogramGallery):
+    """
+    Inverted-file (IVF) approximate index over the gallery histograms.
+
+    Enrolled faces are clustered with k-means on their square-rooted
+    histograms and stored grouped by cluster, so every cluster is one
+    contiguous block of rows. A search only scores the blocks of the
+    ``nprobe`` clusters whose centroids are closest to the probe and
+    re-ranks the best of them exactly, so its cost grows with
+    ``nprobe / nlist`` of the gallery instead of all of it. Raising
+    ``nprobe`` improves recall at the cost of latency and can be done at
+    any time. Below ``train_size`` faces the gallery is searched
+    exhaustively. Faces added after clustering go to an unsorted tail that
+    is always scanned and regrouped once it gets large, and the clusters
+    are rebuilt once the gallery has grown fourfold.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, nlist=None, nprobe=8, train_size=1024, **kwargs):
+        """
+        Initialize an empty IVF gallery.
+
+        Args:
+            nlist: Number of clusters (None = square root of the gallery size)
+            nprobe: Clusters searched per probe (higher = better recall, slower)
+            train_size: Gallery size at which clustering starts
+            **kwargs: HistogramGallery options
+        """
+        super().__init__(**kwargs)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self._centroids = None
+        self._assign = np.empty(0, dtype=np.int32)
+        self._offsets = None
+        self._sorted_count = 0
+        self._trained_count = 0
+
+    def add(self, histograms, labels):
+        """Append histograms and assign them to clusters (see HistogramGallery.add)."""
+        super().add(histograms, labels)
+
+        with self._lock:
+            if self._centroids is None:
+                if self._count >= self.train_size:
+                    self._train()
+                return
+
+            if self._count > 4 * self._trained_count:
+                self._train()
+                return
+
+            if len(self._assign) < self._count:
+                new_rows = _assign_clusters(self._roots[len(self._assign):self._count], self._centroids)
+                self._assign = np.concatenate([self._assign, new_rows])
+
+            if self._count - self._sorted_count > max(1024, self._sorted_count // 4):
+                self._group_rows()
+
+    def _train(self):
+        """Cluster the gallery and group its rows by cluster; called with the lock held."""
+        roots = self._roots[:self._count]
+        nlist = min(self.nlist or max(1, int(np.sqrt(self._count))), self._count)
+        print(f"Clustering {self._count} face(s) into {nlist} list(s)...")
+
+        # Cluster a sample; assignment then covers the whole gallery
+        sample = roots
+        sample_size = 32 * nlist
+        if self._count > sample_size:
+            rng = np.random.default_rng(0)
+            sample = roots[np.sort(rng.choice(self._count, sample_size, replace=False))]
+
+        self._centroids = _kmeans(sample, nlist)
+        self._assign = _assign_clusters(roots, self._centroids)
+        self._trained_count = self._count
+        self._group_rows()
+
+    def _group_rows(self):
+        """Reorder all rows by cluster into fresh arrays; called with the lock held."""
+        order = np.argsort(self._assign[:self._count], kind='stable')
+        # Fresh arrays, so in-flight searches keep their consistent snapshot
+        self._roots = self._roots[:self._count][order]
+        self._labels = self._labels[:self._count][order]
+        self._assign = self._assign[order]
+        self._sorted_count = self._count
+        self._update_offsets()
+
+    def _update_offsets(self):
+        """Recompute where each cluster's block starts in the grouped rows."""
+        self._offsets = np.searchsorted(
+            self._assign[:self._sorted_count], np.arange(len(self._centroids) + 1)
+        )
+
+    def _keep_rows(self, keep):
+        """Drop rows together with their cluster assignments."""
+        if self._centroids is not None:
+            # Filtering preserves order, so the grouped prefix stays grouped
+            self._sorted_count = int(keep[:self._sorted_count].sum())
+            self._assign = self._assign[keep[:len(self._assign)]]
+            self._update_offsets()
+        super()._keep_rows(keep)
+
+    def _snapshot(self):
+        """Add the clusters to the search snapshot."""
+        state = super()._snapshot()
+        state['centroids'] = self._centroids
+        state['offsets'] = self._offsets
+        state['sorted_count'] = self._sorted_count
+        return state
+
+    def _shortlists(self, state, probe_roots, size):
+        """Pick candidates from the probe's nearest clusters only."""
+        centroids = state['centroids']
+        if centroids is None:
+            return super()._shortlists(state, probe_roots, size)
+
+        roots = state['roots']
+        offsets = state['offsets']
+        sorted_count = min(state['sorted_count'], len(roots))
+        nprobe = max(1, min(self.nprobe, len(centroids)))
+        cluster_scores = _cluster_scores(probe_roots, centroids)
+
+        shortlists = []
+        for j in range(len(probe_roots)):
+            blocks = [(offsets[c], offsets[c + 1]) for c in _top_indices(cluster_scores[j], nprobe)]
+            # Rows added since the last grouping are always scanned
+            blocks.append((sorted_count, len(roots)))
+            blocks = [(start, end) for start, end in blocks if end > start]
+            if not blocks:
+                shortlists.append(np.empty(0, dtype=np.intp))
+                continue
+
+            # Score each block in place; no copy of the candidate rows
+            rows = np.concatenate([np.arange(start, end) for start, end in blocks])
+            if len(rows) > size:
+                similarity = np.concatenate([roots[start:end] @ probe_roots[j] for start, end in blocks])
+                rows = rows[_top_indices(similarity, size)]
+            shortlists.append(rows)
+        return shortlists
+
+    def _state_for_save(self):
+        """Persist the clusters along with the histograms."""
+        arrays, meta = super()._state_for_save()
+        arrays['assign'] = self._assign[:self._count]
+        if self._centroids is not None:
+            arrays['centroids'] = self._centroids
+        meta['sorted_count'] = self._sorted_count
+        meta['trained_count'] = self._trained_count
+        return arrays, meta
+
+    def _restore(self, arrays, meta):
+        """Adopt saved histograms and clusters."""
+        super()._restore(arrays, meta)
+        self._assign = np.array(arrays['assign'], dtype=np.int32)
+        centroids = arrays.get('centroids')
+        self._centroids = None if centroids is None else np.array(centroids, dtype=np.float32)
+        self._sorted_count = meta.get('sorted_count', 0)
+        self._trained_count = meta.get('trained_count', 0)
+        if self._centroids is not None:
+            self._update_offsets()
+
+
+# Gallery index backends by name
+GALLERY_INDEXES = {
+    'brute': HistogramGallery,
+    'ivf': IVFGallery,
+}
+
+
+def create_gallery(index='brute', recognizer=None, **options):
+    """
+    Create a gallery index, optionally filled from a trained LBPH model.
+
+    Args:
+        index: Backend name from GALLERY_INDEXES
+        recognizer: Optional cv2.face.LBPHFaceRecognizer to take histograms from
+        **options: Backend options (e.g. shortlist, nlist, nprobe)
+
+    Returns:
+        HistogramGallery instance
+    """
+    gallery_class = GALLERY_INDEXES.get(index)
+    if gallery_class is None:
+        raise ValueError(f"Unknown gallery index: {index}")
+
+    if recognizer is not None:
+        return gallery_class.from_recognizer(recognizer, **options)
+    return gallery_class(**options)
+
+
+def _top_indices(scores, count):
+    """Indices of the count highest scores (unordered)."""
+    if count >= len(scores):
+        return np.arange(len(scores))
+    return np.argpartition(-scores, count - 1)[:count]
+
+
+def chi_square(histograms, probe):
+    """
+    Chi-square distance (OpenCV HISTCMP_CHISQR_ALT) between rows and a probe.
+
+    Args:
+        histograms: (n, dim) matrix
+        probe: (dim,) histogram
+
+    Returns:
+        (n,) float32 distances
+    """
+    diff = histograms - probe
+    total = histograms + probe
+    # Bins empty in both contribute 0 / tiny = 0; a masked divide is ~8x slower
+    total += np.float32(1e-30)
+    np.square(diff, out=diff)
+    diff /= total
+    return 2 * diff.sum(axis=1)
+
+
+def _cluster_scores(rows, centroids):
+    """Scores whose argmax is the nearest centroid (L2) of each row."""
+    # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, and ||x||^2 does not depend on c
+    return rows @ centroids.T - 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+
+
+def _assign_clusters(roots, centroids, chunk_size=4096):
+    """Index of the nearest centroid for every row, computed in chunks."""
+    assign = np.empty(len(roots), dtype=np.int32)
+    for start in range(0, len(roots), chunk_size):
+        block = np.asarray(roots[start:start + chunk_size], dtype=np.float32)
+        assign[start:start + chunk_size] = np.argmax(_cluster_scores(block, centroids), axis=1)
+    return assign
+
+
+def _kmeans(data, k, iterations=8, seed=0):
+    """
+    Cluster rows with Lloyd's k-means.
+
+    Args:
+        data: (n, dim) matrix with n >= k
+        k: Number of clusters
+        iterations: Lloyd iterations
+        seed: Random seed for the initial centroids
+
+    Returns:
+        (k, dim) float32 matrix of centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = np.array(data[rng.choice(len(data), k, replace=False)], dtype=np.float32)
+
+    for _ in range(iterations):
+        assign = _assign_clusters(data, centroids)
+        for c in range(k):
+            members = data[assign == c]
+            # Re-seed empty clusters with a random row
+            centroids[c] = members.mean(axis=0) if len(members) else data[rng.integers(len(data))]
+
+    return centroids
@@ -0,0 +1,502 @@
+"""
+SQLite catalog of the known faces gallery.
+
+The catalog records every person with a stable label and every gallery
+image with its size, modification time, SHA-256 content hash and
+enrollment status. Labels are assigned once and never reused, so they
+survive retrains and deletions. Adding and deleting go through
+transactions, listings are paginated on the name index and per-person
+counts are stored on the person's row, so no request walks the
+``known_faces/`` tree. ``sync`` reconciles the catalog with files copied
+into or removed from the tree by hand; it lists only the directories
+whose modification time changed, so an unchanged gallery costs one stat
+per person.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp')
+
+# Enrollment status of an image: waiting for the trainer, in the model, or unusable
+PENDING = 'pending'
+ENROLLED = 'enrolled'
+NO_FACE = 'no_face'
+
+# Status of a person: in the gallery, or deleted (the row keeps the label reserved)
+ACTIVE = 'active'
+DELETED = 'deleted'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS people (
+    label INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    image_count INTEGER NOT NULL DEFAULT 0,
+    enrolled_count INTEGER NOT NULL DEFAULT 0,
+    dir_mtime_ns INTEGER,
+    changed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    label INTEGER NOT NULL REFERENCES people(label),
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    added_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_label ON images(label);
+CREATE INDEX IF NOT EXISTS images_sha256 ON images(sha256);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_image_file(name):
+    """Whether a file name has one of the gallery's image extensions."""
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+class GalleryCatalog:
+    """
+    People and images of one gallery, stored in an SQLite database.
+
+    The connection is opened on first use and shared by the threads of a
+    process; other processes (the CLI, another server) see committed
+    changes through SQLite's own locking. Only the catalog is covered by
+    it: enrolling an image also writes the face crop cache and the model,
+    which take their own file locks (see FaceCropCache and model_store).
+    """
+
+    def __init__(self, path, known_faces_dir):
+        """
+        Initialize the catalog.
+
+        Args:
+            path: SQLite database file
+            known_faces_dir: Gallery directory with one subdirectory per person
+        """
+        self.path = path
+        self.known_faces_dir = known_faces_dir
+        self._conn = None
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    def _connection(self):
+        """Open the database on first use, creating its directory and tables."""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run a block as one write transaction, rolled back if it raises.
+
+        Nested blocks join the outermost transaction.
+        """
+        with self._lock:
+            conn = self._connection()
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield conn
+                finally:
+                    self._depth -= 1
+                return
+
+            conn.execute('BEGIN IMMEDIATE')
+            self._depth = 1
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            else:
+                conn.execute('COMMIT')
+            finally:
+                self._depth = 0
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+
+    def is_empty(self):
+        """Whether no person was ever recorded (a new catalog)."""
+        return not self._query('SELECT 1 FROM people LIMIT 1')
+
+    def relative_path(self, path):
+        """Catalog key of an image path inside the gallery ('person/file.jpg')."""
+        return os.path.relpath(path, self.known_faces_dir).replace(os.sep, '/')
+
+    def absolute_path(self, key):
+        """Image path of a catalog key (the inverse of relative_path)."""
+        return os.path.join(self.known_faces_dir, *key.split('/'))
+
+    # People
+
+    def label_to_name(self):
+        """Label map of the people in the gallery."""
+        return dict(self._query('SELECT label, name FROM people WHERE status = ?', (ACTIVE,)))
+
+    def label_for(self, name):
+        """Stable label of a person (also of a deleted one), or None if never seen."""
+        rows = self._query('SELECT label FROM people WHERE name = ?', (name,))
+        return rows[0][0] if rows else None
+
+    def seed_labels(self, label_to_name):
+        """
+        Adopt the labels of an existing model for people not in the catalog yet.
+
+        Keeps the labels of a model trained before the catalog existed, so
+        it stays valid. Labels or names already taken are skipped.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            for label, name in sorted(label_to_name.items()):
+                conn.execute(
+                    'INSERT OR IGNORE INTO people (label, name, status, created_at, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (int(label), name, ACTIVE, now, now)
+                )
+
+    def add_person(self, name):
+        """
+        Make a person active, assigning a new label on first enrollment.
+
+        Returns:
+            The person's label
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute('SELECT label, status FROM people WHERE name = ?', (name,)).fetchone()
+            if row is not None:
+                if row[1] != ACTIVE:
+                    conn.execute('UPDATE people SET status = ?, updated_at = ? WHERE label = ?',
+                                 (ACTIVE, now, row[0]))
+                return row[0]
+
+            label = conn.execute('SELECT COALESCE(MAX(label), -1) + 1 FROM people').fetchone()[0]
+            conn.execute(
+                'INSERT INTO people (label, name, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (label, name, ACTIVE, now, now)
+            )
+            return label
+
+    def remove_person(self, name):
+        """
+        Drop a person's images and mark them deleted; their label stays reserved.
+
+        Returns:
+            The person's label, or None if they are not in the gallery
+        """
+        with self.transaction() as conn:
+            row = conn.execute('SELECT label FROM people WHERE name = ? AND status = ?',
+                               (name, ACTIVE)).fetchone()
+            if row is None:
+                return None
+            conn.execute('DELETE FROM images WHERE label = ?', (row[0],))
+            conn.execute(
+                'UPDATE people SET status = ?, image_count = 0, enrolled_count = 0, dir_mtime_ns = NULL, '
+                'updated_at = ? WHERE label = ?',
+                (DELETED, time.time(), row[0])
+            )
+            return row[0]
+
+    def person(self, name):
+        """
+        Counts and status of one person, read from their row.
+
+        Returns:
+            Dict with name, label, status, images, enrolled, created_at and
+            updated_at, or None if the person is not in the gallery
+        """
+        rows = self._query(
+            'SELECT name, label, status, image_count, enrolled_count, created_at, updated_at '
+            'FROM people WHERE name = ? AND status = ?',
+            (name, ACTIVE)
+        )
+        return self._person_dict(rows[0]) if rows else None
+
+    def list_people(self, after=None, limit=None):
+        """
+        Page through the people in the gallery by name.
+
+        Args:
+            after: Name the page starts after (None = from the start)
+            limit: Most people returned (None = all)
+
+        Returns:
+            Tuple of (list of person dicts as returned by person, name to
+            pass as after for the next page or None on the last page)
+        """
+        sql = ('SELECT name, label, status, image_count, enrolled_count, created_at, updated_at '
+               'FROM people WHERE status = ?')
+        params = [ACTIVE]
+        if after is not None:
+            sql += ' AND name > ?'
+            params.append(after)
+        sql += ' ORDER BY name'
+        if limit is not None:
+            # One extra row tells whether there is a next page
+            sql += ' LIMIT ?'
+            params.append(limit + 1)
+
+        people = [self._person_dict(row) for row in self._query(sql, params)]
+        if limit is not None and len(people) > limit:
+            people = people[:limit]
+            return people, people[-1]['name']
+        return people, None
+
+    def count_people(self):
+        return self._query('SELECT COUNT(*) FROM people WHERE status = ?', (ACTIVE,))[0][0]
+
+    @staticmethod
+    def _person_dict(row):
+        name, label, status, images, enrolled, created_at, updated_at = row
+        return {
+            'name': name,
+            'label': label,
+            'status': status,
+            'images': images,
+            'enrolled': enrolled,
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
+
+    # Images
+
+    def find_image(self, sha256):
+        """
+        Look up an image by content hash.
+
+        Returns:
+            Tuple of (person name, image path) of an image with these
+            contents, or None
+        """
+        rows = self._query(
+            'SELECT people.name, images.path FROM images JOIN people ON people.label = images.label '
+            'WHERE images.sha256 = ? LIMIT 1',
+            (sha256,)
+        )
+        return (rows[0][0], self.absolute_path(rows[0][1])) if rows else None
+
+    def add_image(self, name, path, sha256, status=ENROLLED):
+        """
+        Record an image copied into a person's directory, adding the person if new.
+
+        Must run inside the transaction that checked for duplicates, so two
+        uploads of the same picture cannot both be enrolled.
+
+        Returns:
+            The person's label
+        """
+        stat = os.stat(path)
+        with self.transaction() as conn:
+            label = self.add_person(name)
+            conn.execute(
+                'INSERT OR REPLACE INTO images (path, label, sha256, size, mtime_ns, status, added_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.relative_path(path), label, sha256, stat.st_size, stat.st_mtime_ns, status, time.time())
+            )
+            self._update_counts(conn, [label])
+            return label
+
+    def images(self, labels=None):
+        """
+        Gallery images in label and path order.
+
+        Args:
+            labels: Only the images of these labels (None = every active person)
+
+        Returns:
+            List of (absolute image path, label) tuples
+        """
+        sql = ('SELECT images.path, images.label FROM images JOIN people ON people.label = images.label '
+               'WHERE people.status = ?')
+        params = [ACTIVE]
+        if labels is not None:
+            labels = [int(label) for label in labels]
+            if not labels:
+                return []
+            sql += f" AND images.label IN ({','.join('?' * len(labels))})"
+            params.extend(labels)
+        sql += ' ORDER BY images.label, images.path'
+        return [(self.absolute_path(path), label) for path, label in self._query(sql, params)]
+
+    def set_status(self, statuses):
+        """
+        Record the enrollment status of ingested images.
+
+        Args:
+            statuses: Iterable of (absolute image path, label, status) tuples
+        """
+        statuses = list(statuses)
+        if not statuses:
+            return
+        with self.transaction() as conn:
+            conn.executemany('UPDATE images SET status = ? WHERE path = ?',
+                             [(status, self.relative_path(path)) for path, _, status in statuses])
+            self._update_counts(conn, {label for _, label, _ in statuses})
+
+    def changed_labels(self):
+        """Labels of people whose images changed on disk since they were last trained."""
+        return {row[0] for row in self._query(
+            'SELECT label FROM people WHERE changed = 1 AND status = ?', (ACTIVE,))}
+
+    def mark_trained(self, labels=None):
+        """Clear the changed flag of people the model was updated for (None = everyone)."""
+        with self.transaction() as conn:
+            if labels is None:
+                conn.execute('UPDATE people SET changed = 0 WHERE changed = 1')
+            else:
+                conn.executemany('UPDATE people SET changed = 0 WHERE label = ?',
+                                 [(int(label),) for label in labels])
+
+    def status_counts(self):
+        """Number of gallery images by enrollment status."""
+        return dict(self._query('SELECT status, COUNT(*) FROM images GROUP BY status'))
+
+    @staticmethod
+    def _update_counts(conn, labels):
+        """Refresh the stored image counts of some people."""
+        conn.executemany(
+            'UPDATE people SET '
+            'image_count = (SELECT COUNT(*) FROM images WHERE images.label = people.label), '
+            'enrolled_count = (SELECT COUNT(*) FROM images WHERE images.label = people.label '
+            'AND images.status = ?), updated_at = ? WHERE label = ?',
+            [(ENROLLED, time.time(), int(label)) for label in labels]
+        )
+
+    # Reconciling with the directory tree
+
+    @staticmethod
+    def _dir_mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def sync(self):
+        """
+        Bring the catalog up to date with the gallery directory.
+
+        People directories are listed only when their modification time
+        differs from the one recorded, which is the case whenever a file
+        was added, removed or renamed in them (a file rewritten in place is
+        not noticed). New and changed images are hashed and recorded as
+        pending, and their person flagged as changed, until the trainer
+        ingests them (see changed_labels).
+
+        Returns:
+            Dict with the 'added' and 'removed' image paths, the
+            'people_added' and 'people_removed' names, and the set of
+            'labels' whose images changed
+        """
+        changes = {'added': [], 'removed': [], 'people_added': [], 'people_removed': [], 'labels': set()}
+        root = self.known_faces_dir
+        if not os.path.isdir(root):
+            return changes
+
+        root_mtime = self._dir_mtime(root)
+        with self.transaction() as conn:
+            people = {
+                name: (label, dir_mtime)
+                for label, name, dir_mtime in conn.execute(
+                    'SELECT label, name, dir_mtime_ns FROM people WHERE status = ?', (ACTIVE,))
+            }
+            stored_root = conn.execute("SELECT value FROM meta WHERE key = 'root_mtime_ns'").fetchone()
+
+            if stored_root is None or stored_root[0] != root_mtime:
+                present = {
+                    name for name in os.listdir(root)
+                    if os.path.isdir(os.path.join(root, name))
+                }
+                for name in sorted(set(people) - present):
+                    label = self.remove_person(name)
+                    changes['people_removed'].append(name)
+                    changes['labels'].add(label)
+                    del people[name]
+                for name in sorted(present - set(people)):
+                    people[name] = (self.add_person(name), None)
+                    changes['people_added'].append(name)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('root_mtime_ns', ?)",
+                             (root_mtime,))
+
+            for name, (label, stored_mtime) in sorted(people.items()):
+                person_dir = os.path.join(root, name)
+                dir_mtime = self._dir_mtime(person_dir)
+                if dir_mtime is not None and dir_mtime == stored_mtime:
+                    continue
+                if self._sync_person(conn, label, person_dir, changes):
+                    changes['labels'].add(label)
+                    conn.execute('UPDATE people SET changed = 1 WHERE label = ?', (label,))
+                conn.execute('UPDATE people SET dir_mtime_ns = ? WHERE label = ?', (dir_mtime, label))
+
+            if changes['labels']:
+                self._update_counts(conn, changes['labels'])
+        return changes
+
+    def _sync_person(self, conn, label, person_dir, changes):
+        """Reconcile the images of one person; returns True if any changed."""
+        recorded = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in conn.execute(
+                'SELECT path, size, mtime_ns FROM images WHERE label = ?', (label,))
+        }
+        present = {}
+        if os.path.isdir(person_dir):
+            for image_name in os.listdir(person_dir):
+                image_path = os.path.join(person_dir, image_name)
+                if is_image_file(image_name) and os.path.isfile(image_path):
+                    present[self.relative_path(image_path)] = image_path
+
+        changed = False
+        for key in sorted(set(recorded) - set(present)):
+            conn.execute('DELETE FROM images WHERE path = ?', (key,))
+            changes['removed'].append(self.absolute_path(key))
+            changed = True
+
+        now = time.time()
+        for key, image_path in sorted(present.items()):
+            stat = os.stat(image_path)
+            if recorded.get(key) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            conn.execute(
+                'INSERT OR REPLACE INTO images (path, label, sha256, size, mtime_ns, status, added_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, label, file_sha256(image_path), stat.st_size, stat.st_mtime_ns, PENDING, now)
+            )
+            changes['added'].append(image_path)
+            changed = True
+        return changed
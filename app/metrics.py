@@ -0,0 +1,363 @@
+"""
+Lightweight metrics: counters, gauges and histograms in Prometheus text format.
+
+Recording is off until ``enable`` is called. While disabled (and no
+``collect`` block is active) ``timed`` returns a shared no-op context
+manager, so instrumented code pays one attribute lookup per stage.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+
+
+# Upper bounds in seconds for stage and request latencies
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds for small counts such as faces per image
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21)
+
+_enabled = False
+_local = threading.local()
+# Collector shared by all threads (see collect(all_threads=True))
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def enable(on=True):
+    """Turn metric recording on or off for this process."""
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    """Whether metrics are being recorded in this process."""
+    return _enabled
+
+
+def _collector():
+    """Observation list of the active collect block, if any."""
+    observations = getattr(_local, 'observations', None)
+    return observations if observations is not None else _shared
+
+
+def _format_labels(names, values, extra=()):
+    """Render a Prometheus label set, e.g. {stage="detect"}."""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    """Render a sample value the way Prometheus expects."""
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class holding a metric's name, help text and label names."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, *labels):
+        """Add to the counter for one label combination."""
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        """Set the gauge for one label combination."""
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, *labels):
+        """Current value for one label combination, or None if never set."""
+        return self._values.get(labels)
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        """
+        Record one observation.
+
+        Args:
+            value: Observed value (seconds for latencies)
+            *labels: Label values, in the order of the metric's label names
+        """
+        if _enabled:
+            self._record(value, labels)
+        observations = _collector()
+        if observations is not None:
+            observations.append((self.name, labels, value))
+
+    def _record(self, value, labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def summary(self):
+        """Return {labels: (count, sum)} for every label combination observed."""
+        with self._lock:
+            return {labels: (state[2], state[1]) for labels, state in self._values.items()}
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted((labels, [list(state[0]), state[1], state[2]]) for labels, state in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labels, labels, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Set of metrics rendered together, plus callbacks sampled at scrape time."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, callback):
+        """
+        Register a callback sampled on every render.
+
+        Args:
+            callback: Callable returning an iterable of (name, kind, help,
+                samples) tuples, where samples is a list of (labels dict,
+                value) pairs
+        """
+        with self._lock:
+            self._collectors.append(callback)
+
+    def replay(self, observations):
+        """Record histogram observations collected in another process (see collect)."""
+        if not _enabled or not observations:
+            return
+        for name, labels, value in observations:
+            metric = self._metrics.get(name)
+            if isinstance(metric, Histogram):
+                metric._record(value, tuple(labels))
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            if metric._values:
+                lines.extend(metric.render())
+
+        for callback in list(self._collectors):
+            try:
+                families = list(callback())
+            except Exception as e:
+                print(f"✗ Metrics collector failed: {str(e)}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    label_text = _format_labels(labels.keys(), labels.values())
+                    lines.append(f"{name}{label_text} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'face_recognition_stage_seconds', 'Time spent in each processing stage', ('stage',)
+)
+FACES_PER_IMAGE = REGISTRY.histogram(
+    'face_recognition_faces_per_image', 'Faces detected per recognized image or frame',
+    buckets=COUNT_BUCKETS
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'face_recognition_http_request_seconds', 'HTTP request latency by endpoint', ('endpoint', 'status')
+)
+VIDEO_FRAMES = REGISTRY.counter(
+    'face_recognition_video_frames_total', 'Video frames by source and outcome', ('source', 'outcome')
+)
+VIDEO_FPS = REGISTRY.gauge(
+    'face_recognition_video_fps', 'Annotated frames encoded per second', ('source',)
+)
+MODEL_LOAD_SECONDS = REGISTRY.gauge(
+    'face_recognition_model_load_seconds', 'Time taken by the last model load or training'
+)
+
+
+class _StageTimer:
+    """Context manager recording the duration of one stage."""
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.stage)
+        return False
+
+
+class _NullTimer:
+    """Shared no-op stand-in for _StageTimer while nothing is recorded."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(stage):
+    """
+    Time a block as one processing stage, e.g. ``with timed('detect'): ...``.
+
+    Args:
+        stage: Stage name used as the 'stage' label
+
+    Returns:
+        Context manager (a no-op while metrics are off and nothing collects)
+    """
+    if _enabled or _collector() is not None:
+        return _StageTimer(stage)
+    return _NULL_TIMER
+
+
+class collect:
+    """
+    Collect the histogram observations made inside a block.
+
+    Used to build per-request timing breakdowns and to ship observations
+    made in a worker process back to the server. Observations are only
+    captured on the current thread unless all_threads is set, which is
+    meant for single-job worker processes.
+    """
+
+    def __init__(self, all_threads=False):
+        self.all_threads = all_threads
+        self.observations = []
+        self._previous = None
+
+    def __enter__(self):
+        global _shared
+        if self.all_threads:
+            with _shared_lock:
+                self._previous, _shared = _shared, self.observations
+        else:
+            self._previous = getattr(_local, 'observations', None)
+            _local.observations = self.observations
+        return self.observations
+
+    def __exit__(self, *exc):
+        global _shared
+        if self.all_threads:
+            with _shared_lock:
+                _shared = self._previous
+            enclosing = self._previous
+        else:
+            _local.observations = self._previous
+            enclosing = self._previous if self._previous is not None else _shared
+        # Nested blocks also report to the block around them
+        if enclosing is not None:
+            enclosing.extend(self.observations)
+        return False
+
+
+def stage_timings(observations):
+    """
+    Sum collected stage observations into a timing breakdown.
+
+    Args:
+        observations: List filled by a collect block
+
+    Returns:
+        Dict of stage -> milliseconds, in the order stages first ran
+    """
+    timings = {}
+    for name, labels, value in observations:
+        if name == STAGE_SECONDS.name:
+            timings[labels[0]] = timings.get(labels[0], 0.0) + value * 1000
+    return {stage: round(ms, 3) for stage, ms in timings.items()}
@@ -0,0 +1,102 @@
+import threading
+import time
+
+
+class ModelLoader:
+    """
+    Creates the FaceRecognizer and loads its model in a background thread.
+
+    The web server can bind its port straight away instead of waiting for
+    the gallery to be loaded or trained at import time. Requests ask for
+    the recognizer with ``wait``, which returns None while the model is
+    still warming up, and ``status`` reports progress for health checks.
+    """
+
+    def __init__(self, factory, on_ready=None):
+        """
+        Initialize the loader.
+
+        Args:
+            factory: Callable returning a new FaceRecognizer; heavy imports
+                (OpenCV, NumPy) belong inside it so they also run in the
+                background thread
+            on_ready: Optional callable run with the recognizer once its
+                model is loaded, before it is handed to requests
+        """
+        self.factory = factory
+        self.on_ready = on_ready
+        self.recognizer = None
+        self.state = 'idle'
+        self.error = None
+        self._loading = None
+        self._started_at = None
+        self._ready_at = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start loading in the background (only the first call has an effect)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = 'loading'
+            self._started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name='model-loader', daemon=True)
+            self._thread.start()
+
+    @property
+    def ready(self):
+        """Whether the recognizer can serve requests."""
+        return self.state == 'ready'
+
+    def wait(self, timeout=None):
+        """
+        Wait for the model to be ready.
+
+        Args:
+            timeout: Seconds to wait (None = until loading finishes, 0 = do
+                not wait)
+
+        Returns:
+            The FaceRecognizer, or None if it is still loading or failed
+        """
+        if not self.ready and timeout != 0:
+            self._done.wait(timeout)
+        return self.recognizer if self.ready else None
+
+    def status(self):
+        """
+        Describe the loading state for health checks.
+
+        Returns:
+            Dict with 'state' (idle, loading, ready or failed), 'elapsed'
+            seconds, the recognizer's load 'progress' and any 'error'
+        """
+        end = self._ready_at or time.monotonic()
+        loading = self.recognizer or self._loading
+        return {
+            'state': self.state,
+            'elapsed': round(end - self._started_at, 3) if self._started_at else 0.0,
+            'progress': dict(loading.load_progress) if loading is not None else None,
+            'error': self.error,
+        }
+
+    def _run(self):
+        """Create the recognizer, load its model and publish it."""
+        try:
+            self._loading = self.factory()
+            self._loading.load_known_faces()
+            if self.on_ready is not None:
+                self.on_ready(self._loading)
+
+            self.recognizer = self._loading
+            self._ready_at = time.monotonic()
+            self.state = 'ready'
+            print(f"✓ Model ready in {self._ready_at - self._started_at:.1f}s")
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            print(f"✗ Model loading failed: {str(e)}")
+        finally:
+            self._done.set()
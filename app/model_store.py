@@ -0,0 +1,407 @@
+import json
+import os
+import pickle
+import shutil
+import struct
+import time
+import uuid
+import cv2
+import numpy as np
+from app.file_lock import file_lock
+from app.gallery import GALLERY_INDEXES, create_gallery
+
+
+# Identifies the on-disk model layout; bump the version on incompatible changes
+MODEL_FORMAT = 'lbph-gallery'
+MODEL_FORMAT_VERSION = 1
+
+META_FILE = 'meta.json'
+NAMES_FILE = 'names.json'
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = 'LOCK'
+# Changes made after a snapshot was written, appended inside its directory
+DELTA_FILE = 'delta.log'
+
+# Delta record header: magic, JSON header length, payload length
+DELTA_MAGIC = b'FDL1'
+DELTA_HEADER = struct.Struct('<4sII')
+
+
+def save_model(path, gallery, label_to_name):
+    """
+    Write a gallery and its name table as a new model snapshot.
+
+    The model directory holds immutable snapshots, one subdirectory per
+    model id, and a CURRENT file naming the live one. A snapshot holds one
+    .npy file per array (the square-rooted LBPH histogram matrix, labels
+    and any index arrays), a JSON name table and a JSON header with the
+    format version. It is written completely before CURRENT is switched
+    with an atomic rename, so readers never see a partial model, and
+    processes that memory-mapped an older snapshot keep valid pages.
+    Later changes are appended to the snapshot's delta log (see
+    append_delta) instead of rewriting it.
+
+    Args:
+        path: Model directory
+        gallery: HistogramGallery to save
+        label_to_name: Dict of label -> person name
+
+    Returns:
+        Id of the new snapshot
+    """
+    arrays, meta = gallery.export_state()
+    snapshot_id = write_snapshot(path, arrays, meta, label_to_name)
+    return publish_snapshot(path, snapshot_id)
+
+
+def write_snapshot(path, arrays, meta, label_to_name):
+    """
+    Write a snapshot directory without making it the live one.
+
+    Args:
+        path: Model directory
+        arrays: Arrays from gallery.export_state
+        meta: Meta dict from gallery.export_state
+        label_to_name: Dict of label -> person name
+
+    Returns:
+        Id of the written snapshot, for publish_snapshot
+    """
+    # Ids sort by creation time
+    snapshot_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+    meta = dict(meta)
+    meta.update({
+        'format': MODEL_FORMAT,
+        'version': MODEL_FORMAT_VERSION,
+        'model_id': snapshot_id,
+        'count': int(len(arrays['labels'])),
+        'dim': int(arrays['roots'].shape[1]),
+    })
+
+    os.makedirs(path, exist_ok=True)
+    tmp_path = os.path.join(path, f"{snapshot_id}.tmp")
+    os.makedirs(tmp_path)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+    with open(os.path.join(tmp_path, NAMES_FILE), 'w') as f:
+        json.dump({str(label): name for label, name in label_to_name.items()}, f)
+    with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, snapshot_id))
+    return snapshot_id
+
+
+def publish_snapshot(path, snapshot_id, base_id=None, head_id=None):
+    """
+    Make a written snapshot the live one.
+
+    A snapshot folded from a model that kept changing while it was being
+    written (a background compaction) takes over the records appended to
+    the live delta log after base_id, so none of them is lost.
+
+    Args:
+        path: Model directory
+        snapshot_id: Id returned by write_snapshot
+        base_id: Model id the snapshot's contents correspond to (None =
+            replace the live model unconditionally)
+        head_id: Model id of the caller's current model, on the same
+            snapshot as base_id
+
+    Returns:
+        Model id equivalent to head_id on the new snapshot (the snapshot id
+        without head_id), or None if base_id is no longer based on the live
+        snapshot; the written snapshot is then discarded
+    """
+    with file_lock(os.path.join(path, LOCK_FILE)):
+        head_offset = 0
+        if base_id is not None:
+            base_snapshot, base_offset = split_model_id(base_id)
+            if current_model_id(path) != base_snapshot:
+                shutil.rmtree(os.path.join(path, snapshot_id), ignore_errors=True)
+                return None
+
+            # Carry the changes made since base_id over to the new snapshot
+            delta_file = os.path.join(path, base_snapshot, DELTA_FILE)
+            _, end = _read_records(delta_file, base_offset)
+            if end > base_offset:
+                with open(delta_file, 'rb') as f:
+                    f.seek(base_offset)
+                    tail = f.read(end - base_offset)
+                with open(os.path.join(path, snapshot_id, DELTA_FILE), 'wb') as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+            if head_id is not None:
+                head_offset = split_model_id(head_id)[1] - base_offset
+
+        current_tmp = os.path.join(path, f"{CURRENT_FILE}.tmp")
+        with open(current_tmp, 'w') as f:
+            f.write(snapshot_id)
+        os.replace(current_tmp, os.path.join(path, CURRENT_FILE))
+
+        _prune_snapshots(path, snapshot_id)
+    return make_model_id(snapshot_id, head_offset)
+
+
+def make_model_id(snapshot_id, offset):
+    """Model id of a snapshot plus the first offset bytes of its delta log."""
+    return f"{snapshot_id}+{offset}" if offset else snapshot_id
+
+
+def split_model_id(model_id):
+    """Split a model id into (snapshot id, delta log offset); see make_model_id."""
+    snapshot_id, _, offset = model_id.partition('+')
+    return snapshot_id, int(offset or 0)
+
+
+def append_delta(path, model_id, record):
+    """
+    Append one change to the live snapshot's delta log.
+
+    Adding or deleting a face costs one small append instead of a rewrite
+    of the whole histogram matrix. Appends from several processes are
+    serialized by a lock file; a torn record left by a crash is cut off
+    before the next append.
+
+    Args:
+        path: Model directory
+        model_id: Id of the model the caller holds
+        record: {'op': 'add', 'labels': [...], 'names': {label: name},
+            'histograms': (n, dim) matrix} or {'op': 'remove', 'label': label}
+
+    Returns:
+        Tuple of (new model id, records other processes appended after
+        model_id, to apply before this one), or None if model_id is not
+        based on the live snapshot
+    """
+    snapshot_id, offset = split_model_id(model_id)
+    data = _encode_record(record)
+    with file_lock(os.path.join(path, LOCK_FILE)):
+        if current_model_id(path) != snapshot_id:
+            return None
+
+        delta_file = os.path.join(path, snapshot_id, DELTA_FILE)
+        others, end = _read_records(delta_file, offset)
+        with open(delta_file, 'ab') as f:
+            f.truncate(end)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    return make_model_id(snapshot_id, end + len(data)), others
+
+
+def read_delta(path, model_id):
+    """
+    Read the changes appended to a snapshot's delta log after a model id.
+
+    Args:
+        path: Model directory
+        model_id: Model id to read from
+
+    Returns:
+        Tuple of (records in append order, model id after the last one)
+    """
+    snapshot_id, offset = split_model_id(model_id)
+    records, end = _read_records(os.path.join(path, snapshot_id, DELTA_FILE), offset)
+    return records, make_model_id(snapshot_id, end)
+
+
+def apply_delta(gallery, label_to_name, records):
+    """
+    Apply delta records to a gallery in place.
+
+    Args:
+        gallery: Gallery to change
+        label_to_name: Dict of label -> person name (not modified)
+        records: Records from read_delta or append_delta
+
+    Returns:
+        The updated label -> name dict
+    """
+    label_to_name = dict(label_to_name)
+    for record in records:
+        if record['op'] == 'add':
+            label_to_name.update(record['names'])
+            gallery.add(record['histograms'], record['labels'])
+        else:
+            gallery.remove_label(record['label'])
+            label_to_name.pop(record['label'], None)
+    return label_to_name
+
+
+def _encode_record(record):
+    """Serialize a delta record; the JSON header is padded so rows stay 4-byte aligned."""
+    header = {key: value for key, value in record.items() if key != 'histograms'}
+    payload = b''
+    if record['op'] == 'add':
+        header['labels'] = [int(label) for label in record['labels']]
+        header['names'] = {str(label): name for label, name in record['names'].items()}
+        payload = np.ascontiguousarray(record['histograms'], dtype=np.float32).tobytes()
+
+    header = json.dumps(header).encode('utf-8')
+    header += b' ' * (-len(header) % 4)
+    return DELTA_HEADER.pack(DELTA_MAGIC, len(header), len(payload)) + header + payload
+
+
+def _read_records(delta_file, offset):
+    """
+    Parse the complete records of a delta log after a byte offset.
+
+    Returns:
+        Tuple of (records, offset just past the last complete record)
+    """
+    try:
+        with open(delta_file, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+
+    records = []
+    pos = 0
+    while pos + DELTA_HEADER.size <= len(data):
+        magic, header_size, payload_size = DELTA_HEADER.unpack_from(data, pos)
+        start = pos + DELTA_HEADER.size
+        end = start + header_size + payload_size
+        if magic != DELTA_MAGIC or end > len(data):
+            break
+
+        record = json.loads(data[start:start + header_size])
+        if record['op'] == 'add':
+            record['names'] = {int(label): name for label, name in record['names'].items()}
+            record['histograms'] = np.frombuffer(
+                data, dtype=np.float32, count=payload_size // 4, offset=start + header_size
+            ).reshape(len(record['labels']), -1)
+        records.append(record)
+        pos = end
+    return records, offset + pos
+
+
+def _prune_snapshots(path, model_id):
+    """Remove snapshots older than the previous one; readers may still be opening that."""
+    # Files of an unversioned model this directory was upgraded from
+    for name in os.listdir(path):
+        if name.endswith('.npy') or name in (META_FILE, NAMES_FILE):
+            os.remove(os.path.join(path, name))
+
+    snapshots = sorted(
+        name for name in os.listdir(path)
+        if os.path.isdir(os.path.join(path, name)) and not name.endswith('.tmp')
+    )
+    for name in snapshots[:max(0, snapshots.index(model_id) - 1)]:
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def current_model_id(path):
+    """Return the id of the live snapshot in a model directory, or None."""
+    try:
+        with open(os.path.join(path, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def model_exists(path):
+    """Check whether a model has been saved to a model directory."""
+    return current_model_id(path) is not None or _is_flat_model(path)
+
+
+def _is_flat_model(path):
+    """Whether path holds a single unversioned model (the layout before snapshots)."""
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def load_model(path, index=None, **options):
+    """
+    Open the live snapshot of a model directory, memory-mapping its histograms.
+
+    Only the header, labels and name table are read eagerly; histogram
+    pages are loaded on demand and shared through the OS page cache by
+    every process that opens the same snapshot. Changes in the snapshot's
+    delta log are applied on top.
+
+    Args:
+        path: Model directory written by save_model
+        index: Gallery index wanted (None = the one it was saved with); a
+            model saved with another index is re-indexed in memory
+        **options: Index options (e.g. nprobe) overriding the saved ones
+
+    Returns:
+        Tuple of (gallery, label_to_name, model id)
+
+    Raises:
+        ValueError: If the directory holds no model of a supported version
+    """
+    # A writer may prune the snapshot between reading CURRENT and opening it
+    for attempt in range(3):
+        snapshot_id = current_model_id(path)
+        if snapshot_id is None:
+            if _is_flat_model(path):
+                gallery, label_to_name = _load_snapshot(path, index, **options)
+                return gallery, label_to_name, None
+            raise ValueError(f"No model saved in {path}")
+        try:
+            gallery, label_to_name = _load_snapshot(os.path.join(path, snapshot_id), index, **options)
+            records, model_id = read_delta(path, snapshot_id)
+            return gallery, apply_delta(gallery, label_to_name, records), model_id
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+
+
+def _load_snapshot(path, index=None, **options):
+    """Load one snapshot directory; see load_model."""
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+
+    if meta.get('format') != MODEL_FORMAT:
+        raise ValueError(f"{path} is not a face model")
+    if meta.get('version') != MODEL_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format version {meta.get('version')} in {path}")
+
+    with open(os.path.join(path, NAMES_FILE)) as f:
+        label_to_name = {int(label): name for label, name in json.load(f).items()}
+
+    arrays = {
+        name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode='r')
+        for name in os.listdir(path) if name.endswith('.npy')
+    }
+
+    kind = meta['kind']
+    if index is None or index == kind:
+        return GALLERY_INDEXES[kind].from_state(arrays, meta, **options), label_to_name
+
+    # Saved with another index: keep the histograms, rebuild the index
+    print(f"Re-indexing {path} from '{kind}' to '{index}'...")
+    saved = GALLERY_INDEXES[kind].from_state(arrays, meta)
+    radius, neighbors, grid_x, grid_y = meta['lbp']
+    gallery = create_gallery(
+        index, radius=radius, neighbors=neighbors, grid_x=grid_x, grid_y=grid_y, **options
+    )
+    gallery.add(saved.histograms, saved.labels)
+    return gallery, label_to_name
+
+
+def convert_legacy_model(model_file, encodings_file, path, index='brute', **options):
+    """
+    Convert an LBPH YAML model and its label pickle into a binary model directory.
+
+    Args:
+        model_file: LBPH model saved with cv2.face.LBPHFaceRecognizer.save
+        encodings_file: Pickle holding {'label_to_name': {...}}
+        path: Model directory to write
+        index: Gallery index to build
+        **options: Index options
+
+    Returns:
+        Tuple of (gallery, label_to_name, model id)
+    """
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(model_file)
+    with open(encodings_file, 'rb') as f:
+        label_to_name = pickle.load(f)['label_to_name']
+
+    gallery = create_gallery(index, recognizer, **options)
+    model_id = save_model(path, gallery, label_to_name)
+    return gallery, label_to_name, model_id
@@ -0,0 +1,205 @@
+import copy
+import io
+import threading
+import time
+from collections import OrderedDict
+from contextlib import redirect_stderr
+import cv2
+import numpy as np
+
+
+# Side of the grayscale thumbnail kept with each entry to confirm hits
+THUMB_SIZE = 64
+# Largest difference of any thumbnail pixel (0-255) between two frames
+# still answered with the same result; re-encoding and sensor noise stay
+# well below it after downscaling, a different face does not
+MAX_THUMB_DIFF = 24
+# Brightness step between neighbouring hash pixels that sets a dHash bit
+HASH_MIN_STEP = 4
+
+
+def frame_thumbnail(buffer):
+    """
+    Decode an encoded image into a small grayscale thumbnail.
+
+    JPEG decoders scale by 1/4 during the inverse DCT, so this costs a
+    fraction of a full decode.
+
+    Args:
+        buffer: Encoded image bytes or 1-D uint8 array
+
+    Returns:
+        THUMB_SIZE x THUMB_SIZE uint8 thumbnail, or None if the buffer
+        cannot be decoded
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8) if not isinstance(buffer, np.ndarray) else buffer.reshape(-1)
+    if data.size == 0:
+        return None
+
+    with redirect_stderr(io.StringIO()):
+        small = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if small is None:
+        return None
+    return cv2.resize(small, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def difference_hash(thumbnail):
+    """
+    Compute a 64-bit difference hash (dHash) of a thumbnail.
+
+    Each bit says whether a pixel of the 9x8 shrunken image is brighter
+    than its right neighbour by more than HASH_MIN_STEP; neighbours of
+    about the same brightness (flat background) give 0 instead of a bit
+    that flips with noise, so re-encoded or slightly noisy copies of a
+    frame usually share the hash. It only finds candidate entries; hits
+    are confirmed with thumbnails_match.
+
+    Args:
+        thumbnail: 2-D uint8 image
+
+    Returns:
+        Hash as a Python int
+    """
+    small = cv2.resize(thumbnail, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = small[:, 1:] - small[:, :-1] > HASH_MIN_STEP
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def thumbnails_match(first, second, max_diff=MAX_THUMB_DIFF):
+    """Whether two thumbnails differ by at most max_diff on every pixel."""
+    return first.shape == second.shape and int(cv2.absdiff(first, second).max()) <= max_diff
+
+
+def _result_size(result):
+    """Rough number of bytes held by a cached result dict."""
+    faces = result.get('faces') or []
+    candidates = sum(len(face.get('candidates') or ()) for face in faces)
+    return 256 + 512 * len(faces) + 160 * candidates
+
+
+class ResultCache:
+    """
+    LRU cache of recognition results with a time-to-live and a memory bound.
+
+    Keys are built by the caller (perceptual hash, matching options and
+    model version), so a model change makes old entries unreachable;
+    ``clear`` drops them at once. An entry may keep the thumbnail of the
+    frame it was computed for: a lookup with a thumbnail that does not
+    match it is a miss, so two frames that merely share a hash never share
+    a result. Entries are evicted least recently used first when either
+    max_entries or max_bytes is exceeded.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30.0, max_bytes=8 * 1024 * 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of cached results
+            ttl: Seconds a result stays valid
+            max_bytes: Approximate memory budget for cached results
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejections = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, thumbnail=None):
+        """
+        Look up a result.
+
+        Args:
+            key: Hashable cache key
+            thumbnail: Thumbnail of the frame looked up, compared with the
+                entry's (see thumbnails_match)
+
+        Returns:
+            Copy of the cached result dict, or None on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None and entry[3] is not None and (
+                    thumbnail is None or not thumbnails_match(entry[3], thumbnail)):
+                # Same hash, different frame
+                self.rejections += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            result = entry[0]
+
+        # Callers may annotate the result they get back
+        return copy.deepcopy(result)
+
+    def put(self, key, result, thumbnail=None):
+        """
+        Store a result, evicting least recently used entries to stay within bounds.
+
+        Args:
+            key: Hashable cache key
+            result: Result dict
+            thumbnail: Thumbnail of the frame the result was computed for
+                (None = answer every lookup of the key)
+        """
+        size = _result_size(result) + (thumbnail.nbytes if thumbnail is not None else 0)
+        if size > self.max_bytes:
+            return
+
+        result = copy.deepcopy(result)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (result, time.monotonic(), size, thumbnail)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, e.g. after the model changed."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hit, miss and eviction counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'rejections': self.rejections,
+            }
+
+    def _drop(self, key):
+        """Remove one entry; the lock must be held."""
+        size = self._entries.pop(key)[2]
+        self._bytes -= size
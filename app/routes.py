@@ -1,14 +1,31 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, g
+import json
+import math
 from werkzeug.utils import secure_filename
 import os
+import multiprocessing
+import shutil
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
 from pathlib import Path
-from app.face_recognizer import FaceRecognizer
+from app.broadcaster import parse_video_source
+from app.model_loader import ModelLoader
+from app.tenants import DEFAULT_TENANT, TenantRegistry, is_valid_tenant, tenant_exists
+from app.worker_pool import PoolSaturated
+from app import metrics
 
 # Configuration
 root_dir = Path(__file__).parent.parent
 UPLOAD_FOLDER = str(root_dir / 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+MAX_BATCH_IMAGES = 100
+MAX_TOP_K = 20
+MAX_PAGE_SIZE = 1000  # People listed per /known_faces page
+RETRY_AFTER = 5  # Seconds clients are asked to wait while the model warms up
+BUSY_RETRY_AFTER = 1  # Seconds clients are asked to wait when the recognition queue is full
 
 # Create app with correct template and static paths
 app = Flask(
@@ -18,13 +35,313 @@ app = Flask(
 )
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+# Webcam index, video file path or RTSP URL served by /video_feed
+app.config['VIDEO_SOURCE'] = parse_video_source(os.environ.get('VIDEO_SOURCE', '0'))
+# Seconds a request waits for the model while it is still loading
+app.config['WARMUP_TIMEOUT'] = float(os.environ.get('WARMUP_TIMEOUT', '5'))
+# Recognition worker processes (unset = one per CPU core, 0 = recognize on request threads)
+# and the number of queued jobs after which requests are turned away with 503
+app.config['RECOGNITION_WORKERS'] = (
+    int(os.environ['RECOGNITION_WORKERS']) if os.environ.get('RECOGNITION_WORKERS') else None
+)
+app.config['RECOGNITION_QUEUE'] = int(os.environ.get('RECOGNITION_QUEUE', '0')) or None
+# Results of recent images reused for repeated uploads (0 = off, the default) and their
+# lifetime in seconds
+app.config['RESULT_CACHE_SIZE'] = int(os.environ.get('RESULT_CACHE_SIZE', '0'))
+app.config['RESULT_CACHE_TTL'] = float(os.environ.get('RESULT_CACHE_TTL', '30'))
+# Cameras sharing one detection budget, as 'id=source[;priority=P][;fps=F]' entries
+# separated by commas, and the number of detection threads they share
+app.config['STREAMS'] = [spec for spec in os.environ.get('STREAMS', '').split(',') if spec.strip()]
+app.config['STREAM_WORKERS'] = int(os.environ.get('STREAM_WORKERS', '2'))
+# Seconds between checks that re-compact the gallery to a few prototypes per person
+# once faces were added (0 = off), the most prototypes kept per person, and the
+# held-out accuracy loss (as a fraction) above which a compaction is refused
+app.config['COMPACT_INTERVAL'] = float(os.environ.get('COMPACT_INTERVAL', '0'))
+app.config['COMPACT_PROTOTYPES'] = int(os.environ.get('COMPACT_PROTOTYPES', '8'))
+app.config['COMPACT_MAX_ACCURACY_DROP'] = float(os.environ.get('COMPACT_MAX_ACCURACY_DROP', '0.02'))
+# Directory with one gallery per tenant (chosen by the X-Tenant header or a 'tenant'
+# field), the memory budget for tenant models kept loaded and their maximum number
+# (0 = only the budget applies)
+app.config['TENANTS_DIR'] = os.environ.get('TENANTS_DIR', 'tenants')
+app.config['TENANT_CACHE_MB'] = float(os.environ.get('TENANT_CACHE_MB', '512'))
+app.config['TENANT_CACHE_MAX'] = int(os.environ.get('TENANT_CACHE_MAX', '0')) or None
+# Record latency histograms and counters for /metrics (METRICS=0 turns recording off)
+app.config['METRICS'] = os.environ.get('METRICS', '1') != '0'
+metrics.enable(app.config['METRICS'])
 
 # Create upload folder if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Initialize face recognizer
-recognizer = FaceRecognizer(tolerance=0.6, model='hog')
-recognizer.load_known_faces()
+# Set up by on_model_ready once the recognizer is loaded
+broadcast_hub = None
+stream_trackers = None
+recognition_pool = None
+stream_scheduler = None
+compaction_schedule = None
+
+
+def create_recognizer():
+    """Create the face recognizer (imported here so OpenCV loads in the background)."""
+    from app.face_recognizer import FaceRecognizer
+    return FaceRecognizer(
+        tolerance=0.6,
+        model='hog',
+        result_cache_size=app.config['RESULT_CACHE_SIZE'],
+        result_cache_ttl=app.config['RESULT_CACHE_TTL']
+    )
+
+
+def create_tenant_recognizer(tenant):
+    """Create a tenant's face recognizer; TenantRegistry loads its model."""
+    from app.face_recognizer import FaceRecognizer
+    return FaceRecognizer(
+        tolerance=0.6,
+        model='hog',
+        result_cache_size=app.config['RESULT_CACHE_SIZE'],
+        result_cache_ttl=app.config['RESULT_CACHE_TTL'],
+        tenant=tenant,
+        tenants_dir=app.config['TENANTS_DIR']
+    )
+
+
+# Tenant galleries loaded on first use; the least recently used are dropped over budget
+tenant_registry = TenantRegistry(
+    create_tenant_recognizer,
+    max_bytes=int(app.config['TENANT_CACHE_MB'] * 1024 * 1024),
+    max_tenants=app.config['TENANT_CACHE_MAX']
+)
+
+
+def on_model_ready(recognizer):
+    """Create the helpers that share the loaded recognizer."""
+    global broadcast_hub, stream_trackers, recognition_pool, stream_scheduler, compaction_schedule
+    from app.broadcaster import BroadcastHub
+    from app.compaction import CompactionSchedule
+    from app.stream_scheduler import StreamScheduler, parse_stream_spec
+    from app.tracker import TrackerRegistry
+    from app.worker_pool import RecognitionPool
+    
+    # The deployment's own gallery is the default tenant and is never evicted
+    tenant_registry.pin(DEFAULT_TENANT, recognizer)
+    
+    # One capture/recognition loop per video source, shared by all viewers
+    broadcast_hub = BroadcastHub(recognizer)
+    
+    # Face trackers for browser webcam streams, keyed by tenant and the client's stream_id
+    stream_trackers = TrackerRegistry(recognizer)
+    
+    # Worker processes for uploaded images; each follows the saved model snapshot
+    recognition_pool = RecognitionPool(
+        recognizer,
+        workers=app.config['RECOGNITION_WORKERS'],
+        max_pending=app.config['RECOGNITION_QUEUE']
+    )
+    
+    # Registered cameras, read concurrently and detected on a shared set of threads
+    stream_scheduler = StreamScheduler(recognizer, workers=app.config['STREAM_WORKERS'], tracker_options={})
+    for spec in app.config['STREAMS']:
+        try:
+            stream_scheduler.add_stream(**parse_stream_spec(spec))
+        except ValueError as e:
+            print(f"✗ Invalid stream '{spec}': {str(e)}")
+    
+    # Periodic compaction keeps the gallery small as faces are enrolled
+    if app.config['COMPACT_INTERVAL'] > 0:
+        compaction_schedule = CompactionSchedule(
+            recognizer,
+            interval=app.config['COMPACT_INTERVAL'],
+            max_prototypes=app.config['COMPACT_PROTOTYPES'],
+            max_accuracy_drop=app.config['COMPACT_MAX_ACCURACY_DROP']
+        )
+        compaction_schedule.start()
+
+
+# Load or train the model in the background so the server can bind its port at once
+model_loader = ModelLoader(create_recognizer, on_ready=on_model_ready)
+# Recognition workers re-import the entry point when spawned; only the server loads
+if multiprocessing.parent_process() is None:
+    model_loader.start()
+
+
+def get_recognizer(tenant=DEFAULT_TENANT):
+    """
+    Return a tenant's recognizer, waiting up to WARMUP_TIMEOUT seconds; None while warming up.
+    
+    Other tenants are served once the default gallery (and the recognition
+    pool) is ready; their models are loaded on first use.
+    """
+    recognizer = model_loader.wait(app.config['WARMUP_TIMEOUT'])
+    if recognizer is None or tenant in (None, DEFAULT_TENANT):
+        return recognizer
+    return tenant_registry.get(tenant)
+
+
+def request_tenant():
+    """Tenant named by the X-Tenant header or a 'tenant' form/query field."""
+    return request.headers.get('X-Tenant') or request.values.get('tenant') or DEFAULT_TENANT
+
+
+def tenant_error(tenant, create=False):
+    """
+    Check a tenant name from a request.
+    
+    Args:
+        tenant: Tenant name
+        create: Whether the request may create the tenant (adding a face)
+    
+    Returns:
+        Tuple of (response body, HTTP status) if the tenant is invalid or
+        unknown, otherwise None
+    """
+    if not is_valid_tenant(tenant):
+        message = 'Invalid tenant name'
+        return {'error': message, 'success': False, 'message': message}, 400
+    if not create and not tenant_exists(tenant, app.config['TENANTS_DIR']):
+        message = 'Tenant not found'
+        return {'error': message, 'success': False, 'message': message}, 404
+    return None
+
+
+def known_faces_page(recognizer, after=None, limit=None):
+    """
+    Body of a /known_faces response, read from the gallery catalog.
+    
+    Args:
+        recognizer: FaceRecognizer of the tenant
+        after: Name the page starts after (None = from the start)
+        limit: Most people listed (None = all)
+    
+    Returns:
+        Dict with the 'faces' names, per-person 'people' counts, the
+        'next' page's after value (None on the last page) and the 'total'
+    """
+    catalog = recognizer.catalog
+    people, next_after = catalog.list_people(after, limit)
+    return {
+        'faces': [person['name'] for person in people],
+        'people': people,
+        'next': next_after,
+        'total': catalog.count_people()
+    }
+
+
+def parse_page_size(value):
+    """Read a limit=N page size, clamped to MAX_PAGE_SIZE (None = everything); raises ValueError."""
+    if value in (None, ''):
+        return None
+    return max(1, min(int(value), MAX_PAGE_SIZE))
+
+
+def warming_up_response():
+    """503 response for requests that arrive before the model is ready."""
+    status = model_loader.status()
+    if status['state'] == 'failed':
+        message = 'Model failed to load'
+    else:
+        message = 'Model is warming up, please retry shortly'
+    
+    response = jsonify({'error': message, 'success': False, 'message': message, 'model': status})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER)
+    return response
+
+
+def busy_response(error):
+    """503 response for requests turned away because the recognition queue is full."""
+    message = 'Server is busy, please retry shortly'
+    response = jsonify({'error': message, 'success': False, 'message': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(BUSY_RETRY_AFTER)
+    return response
+
+
+def collect_metrics():
+    """Gauges sampled when /metrics is scraped: model size, queues and caches."""
+    status = model_loader.status()
+    yield ('face_recognition_model_ready', 'gauge', 'Whether the model is loaded (1) or warming up (0)',
+           [({}, int(model_loader.ready))])
+    
+    recognizer = model_loader.recognizer
+    if recognizer is None:
+        yield ('face_recognition_model_load_progress', 'gauge', 'Items processed by the initial model load',
+               [({'stage': status['progress']['stage']}, status['progress']['done'])] if status['progress'] else [])
+        return
+    
+    gallery = recognizer.gallery
+    yield ('face_recognition_model_faces', 'gauge', 'Face histograms in the gallery', [({}, len(gallery))])
+    yield ('face_recognition_model_identities', 'gauge', 'People in the gallery',
+           [({}, len(recognizer.label_to_name))])
+    yield ('face_recognition_model_bytes', 'gauge', 'Size of the gallery histogram matrix',
+           [({}, len(gallery) * gallery.dim * 4)])
+    yield ('face_recognition_model_version', 'gauge', 'Model swaps since startup',
+           [({}, recognizer.model_version)])
+    
+    if recognition_pool is not None:
+        pool = recognition_pool.stats()
+        yield ('face_recognition_queue_depth', 'gauge', 'Jobs queued or running',
+               [({'queue': 'recognition'}, pool['pending'])])
+        yield ('face_recognition_queue_capacity', 'gauge', 'Jobs admitted before requests are rejected',
+               [({'queue': 'recognition'}, pool['max_pending'])])
+        yield ('face_recognition_pool_jobs_total', 'counter', 'Recognition jobs by outcome',
+               [({'outcome': outcome}, pool[outcome]) for outcome in ('completed', 'failed', 'rejected')])
+    
+    cache = result_cache_stats()
+    if cache is not None:
+        yield ('face_recognition_result_cache_entries', 'gauge', 'Cached recognition results',
+               [({}, cache['entries'])])
+        yield ('face_recognition_result_cache_bytes', 'gauge', 'Approximate memory held by cached results',
+               [({}, cache['bytes'])])
+        yield ('face_recognition_result_cache_events_total', 'counter', 'Result cache lookups and removals',
+               [({'event': event}, cache[event]) for event in ('hits', 'misses', 'evictions', 'expirations', 'rejections')])
+    
+    tenants = tenant_registry.stats()
+    yield ('face_recognition_tenants_loaded', 'gauge', 'Tenant galleries held in memory',
+           [({}, tenants['loaded'])])
+    yield ('face_recognition_tenant_bytes', 'gauge', 'Approximate memory held by loaded tenant galleries',
+           [({}, tenants['bytes'])])
+    yield ('face_recognition_tenant_cache_events_total', 'counter', 'Tenant gallery lookups and evictions',
+           [({'event': event}, tenants[event]) for event in ('hits', 'misses', 'evictions')])
+    
+    if broadcast_hub is not None:
+        yield ('face_recognition_video_viewers', 'gauge', 'Viewers attached to each video source',
+               [({'source': str(source)}, count) for source, count in broadcast_hub.active_sources().items()])
+    if stream_trackers is not None:
+        yield ('face_recognition_tracked_streams', 'gauge', 'Webcam streams with a face tracker',
+               [({}, len(stream_trackers))])
+    if stream_scheduler is not None:
+        streams = stream_scheduler.stats()
+        yield ('face_recognition_stream_fps', 'gauge', 'Detection passes per second achieved by each stream',
+               [({'stream': stream_id}, stats['fps']) for stream_id, stats in streams.items()])
+        yield ('face_recognition_stream_lag_seconds', 'gauge', 'Time from capture to published result',
+               [({'stream': stream_id}, stats['lag_ms'] / 1000) for stream_id, stats in streams.items()])
+        yield ('face_recognition_stream_frames_total', 'counter', 'Frames captured, processed or skipped per stream',
+               [({'stream': stream_id, 'outcome': outcome}, stats[outcome])
+                for stream_id, stats in streams.items() for outcome in ('captured', 'processed', 'skipped')])
+
+
+metrics.REGISTRY.add_collector(collect_metrics)
+
+
+@app.before_request
+def start_request_timer():
+    """Remember when the request started, for the latency histogram."""
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    """Observe the request's latency by endpoint and status."""
+    if metrics.enabled() and 'request_started' in g:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - g.request_started, endpoint, str(response.status_code)
+        )
+    return response
+
+
+def parse_flag(name):
+    """Read a boolean form/query field such as per_identity=true."""
+    return request.values.get(name, '').lower() in ('1', 'true', 'yes')
 
 
 def allowed_file(filename):
@@ -32,6 +349,46 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+@contextmanager
+def upload_path(filename):
+    """
+    Provide a temporary path for an uploaded file, removed afterwards.
+    
+    Every upload gets its own directory under UPLOAD_FOLDER, so concurrent
+    uploads of files with the same name never overwrite each other, while
+    the file keeps its (sanitized) name for the gallery copy.
+    
+    Args:
+        filename: Name the client gave the file
+        
+    Yields:
+        Absolute path to write the upload to
+    """
+    directory = tempfile.mkdtemp(dir=app.config['UPLOAD_FOLDER'])
+    try:
+        yield os.path.join(directory, secure_filename(filename) or 'upload')
+    finally:
+        with metrics.timed('upload_remove'):
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def read_zip_images(stream):
+    """Return (filename, bytes) for each allowed image inside a zip archive."""
+    entries = []
+    
+    with zipfile.ZipFile(stream) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not allowed_file(info.filename):
+                continue
+            if info.file_size > MAX_FILE_SIZE:
+                raise ValueError(f'{info.filename} is larger than {MAX_FILE_SIZE} bytes')
+            if len(entries) > MAX_BATCH_IMAGES:
+                break
+            entries.append((info.filename, archive.read(info)))
+    
+    return entries
+
+
 @app.route('/')
 def index():
     """Render the main page."""
@@ -53,42 +410,234 @@ def recognize_image():
         return jsonify({'error': 'File type not allowed'}), 400
     
     try:
-        # Save file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Decode straight from the request stream; no temp file round trip
+        data = file.stream.read()
         
-        # Validate file was saved and has content
-        if not os.path.exists(filepath) or os.path.getsize(filepath) < 100:
-            # File too small or doesn't exist
-            if os.path.exists(filepath):
-                os.remove(filepath)
+        # Too small to be a real image (e.g. an empty webcam frame)
+        if len(data) < 100:
             return jsonify({'error': None, 'faces': []}), 200
         
-        # Convert to absolute path with forward slashes for OpenCV compatibility
-        abs_filepath = os.path.abspath(filepath).replace('\\', '/')
+        # Ranked gallery matches per face, e.g. top_k=5&per_identity=true
+        try:
+            top_k = int(request.values.get('top_k', 1))
+        except ValueError:
+            return jsonify({'error': 'top_k must be an integer'}), 400
+        top_k = max(1, min(top_k, MAX_TOP_K))
+        per_identity = parse_flag('per_identity')
+        # timings=true adds the milliseconds spent in each processing stage
+        timings = parse_flag('timings')
         
-        # Recognize faces
-        result = recognizer.recognize_faces_in_image(abs_filepath)
+        tenant = request_tenant()
+        error = tenant_error(tenant)
+        if error:
+            return jsonify(error[0]), error[1]
         
-        # Clean up
-        os.remove(filepath)
+        recognizer = get_recognizer(tenant)
+        if recognizer is None:
+            return warming_up_response()
+        
+        # Frames from a webcam stream reuse identities of faces already tracked;
+        # the tracker lives in this process, so those frames are recognized here
+        stream_id = request.form.get('stream_id')
+        if stream_id:
+            result = recognizer.recognize_faces_in_buffer(
+                data, tracker=stream_trackers.get((tenant, stream_id), recognizer), top_k=top_k,
+                per_identity=per_identity, timings=timings
+            )
+        else:
+            result = recognition_pool.recognize(data, top_k=top_k, per_identity=per_identity,
+                                                timings=timings, recognizer=recognizer)
         
         return jsonify(result)
     
+    except PoolSaturated as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': f'Error processing image: {str(e)}'}), 500
 
 
+@app.route('/recognize_batch', methods=['POST'])
+def recognize_batch():
+    """Recognize faces in many images (multipart files and/or zip archives) in one request."""
+    uploads = request.files.getlist('files') + request.files.getlist('file')
+    
+    if not uploads:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    try:
+        filenames = []
+        buffers = []
+        
+        for file in uploads:
+            if file.filename.lower().endswith('.zip'):
+                entries = read_zip_images(file.stream)
+            elif allowed_file(file.filename):
+                entries = [(file.filename, file.stream.read())]
+            else:
+                return jsonify({'error': f'File type not allowed: {file.filename}'}), 400
+            
+            for filename, data in entries:
+                filenames.append(filename)
+                buffers.append(data)
+                if len(buffers) > MAX_BATCH_IMAGES:
+                    return jsonify({'error': f'Too many images (max {MAX_BATCH_IMAGES})'}), 400
+        
+        tenant = request_tenant()
+        error = tenant_error(tenant)
+        if error:
+            return jsonify(error[0]), error[1]
+        
+        recognizer = get_recognizer(tenant)
+        if recognizer is None:
+            return warming_up_response()
+        
+        results = recognition_pool.recognize_batch(buffers, recognizer=recognizer)
+        
+        return jsonify({
+            'error': None,
+            'results': [
+                dict(result, filename=filename)
+                for filename, result in zip(filenames, results)
+            ]
+        })
+    
+    except zipfile.BadZipFile:
+        return jsonify({'error': 'Invalid zip archive'}), 400
+    except PoolSaturated as e:
+        return busy_response(e)
+    except Exception as e:
+        return jsonify({'error': f'Error processing images: {str(e)}'}), 500
+
+
 @app.route('/video_feed')
 def video_feed():
-    """Stream video from webcam with face recognition."""
+    """Stream video from the configured source with face recognition."""
+    if get_recognizer() is None:
+        return warming_up_response()
+    
+    return Response(
+        broadcast_hub.subscribe(app.config['VIDEO_SOURCE']),
+        mimetype='multipart/x-mixed-replace; boundary=frame'
+    )
+
+
+@app.route('/streams', methods=['GET', 'POST'])
+def streams():
+    """List registered cameras with their FPS and lag, or register a new one."""
+    if get_recognizer() is None:
+        return warming_up_response()
+    
+    if request.method == 'GET':
+        return jsonify({'streams': stream_scheduler.stats()})
+    
+    body, status = register_stream(request.get_json(silent=True) or request.form)
+    return jsonify(body), status
+
+
+def register_stream(data):
+    """
+    Register a camera from request fields (source, optional stream_id, priority, target_fps).
+    
+    Returns:
+        Tuple of (response body, HTTP status)
+    """
+    from app.stream_scheduler import parse_stream_spec
+    source = str(data.get('source', '')).strip()
+    if not source:
+        return {'success': False, 'message': 'Missing source'}, 400
+    
+    try:
+        spec = parse_stream_spec(source, default_id=data.get('stream_id'))
+        if data.get('stream_id'):
+            spec['stream_id'] = str(data['stream_id'])
+        if data.get('priority') is not None:
+            spec['priority'] = float(data['priority'])
+        if data.get('target_fps') is not None:
+            spec['target_fps'] = float(data['target_fps']) or None
+        stream_scheduler.add_stream(**spec)
+    except ValueError as e:
+        return {'success': False, 'message': str(e)}, 400
+    
+    return {'success': True, 'message': f"Stream '{spec['stream_id']}' registered",
+            'stream_id': spec['stream_id']}, 200
+
+
+@app.route('/streams/<stream_id>', methods=['DELETE'])
+def remove_stream(stream_id):
+    """Stop reading a registered camera."""
+    if get_recognizer() is None:
+        return warming_up_response()
+    
+    if not stream_scheduler.remove_stream(stream_id):
+        return jsonify({'success': False, 'message': 'Stream not found'}), 404
+    return jsonify({'success': True, 'message': f"Stream '{stream_id}' removed"})
+
+
+def parse_target_fps(value):
+    """
+    Parse the frame rate limit of an MJPEG feed.
+    
+    Args:
+        value: The 'fps' query parameter (None or empty = no limit)
+    
+    Returns:
+        Frames per second, or None for every captured frame
+    
+    Raises:
+        ValueError: If the value is not a positive number
+    """
+    if not value:
+        return None
+    try:
+        fps = float(value)
+    except ValueError:
+        fps = None
+    if fps is None or not math.isfinite(fps) or fps <= 0:
+        raise ValueError(f"fps must be a positive number, got '{value}'")
+    return fps
+
+
+@app.route('/streams/<stream_id>/video_feed')
+def stream_feed(stream_id):
+    """MJPEG feed of one registered camera, annotated with its latest faces."""
+    if get_recognizer() is None:
+        return warming_up_response()
+    
+    try:
+        target_fps = parse_target_fps(request.args.get('fps'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if stream_id not in stream_scheduler:
+        return jsonify({'error': 'Stream not found'}), 404
     return Response(
-        recognizer.recognize_faces_in_video(video_source=0),
+        stream_scheduler.frames(stream_id, target_fps=target_fps),
         mimetype='multipart/x-mixed-replace; boundary=frame'
     )
 
 
+@app.route('/streams/events')
+def stream_events():
+    """Server-sent events with the faces found on every camera (or one, with ?stream_id=)."""
+    if get_recognizer() is None:
+        return warming_up_response()
+    
+    return Response(
+        server_sent_events(stream_scheduler, request.args.get('stream_id')),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache'}
+    )
+
+
+def server_sent_events(scheduler, stream_id=None, keepalive=15.0):
+    """Format scheduler events as a text/event-stream, with periodic keep-alive comments."""
+    for event in scheduler.events(stream_id, timeout=keepalive):
+        if event is None:
+            yield ': keep-alive\n\n'
+        else:
+            yield f"id: {event['seq']}\nevent: faces\ndata: {json.dumps(event)}\n\n"
+
+
 @app.route('/add_face', methods=['POST'])
 def add_face():
     """Add a new face to known faces."""
@@ -104,24 +653,27 @@ def add_face():
     if not allowed_file(file.filename):
         return jsonify({'error': 'File type not allowed'}), 400
     
+    # Adding a face to an unknown tenant creates its gallery
+    tenant = request_tenant()
+    error = tenant_error(tenant, create=True)
+    if error:
+        return jsonify(error[0]), error[1]
+    
+    recognizer = get_recognizer(tenant)
+    if recognizer is None:
+        return warming_up_response()
+    
     try:
         # Save temporarily
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Convert to absolute path with forward slashes for OpenCV compatibility
-        abs_filepath = os.path.abspath(filepath).replace('\\', '/')
-        
-        # Add to known faces
-        result = recognizer.add_face_to_known(abs_filepath, name)
-        
-        # Clean up
-        os.remove(filepath)
-        
-        if result['success']:
-            # Reload known faces
-            recognizer.load_known_faces()
+        with upload_path(file.filename) as filepath:
+            with metrics.timed('upload_save'):
+                file.save(filepath)
+            
+            # Convert to absolute path with forward slashes for OpenCV compatibility
+            abs_filepath = os.path.abspath(filepath).replace('\\', '/')
+            
+            # Add to known faces (updates the model incrementally)
+            result = recognizer.add_face_to_known(abs_filepath, name)
         
         return jsonify(result)
     
@@ -131,38 +683,64 @@ def add_face():
 
 @app.route('/known_faces')
 def list_known_faces():
-    """Get list of known faces."""
-    known_faces_dir = 'known_faces'
-    faces = []
+    """Get list of known faces, a page at a time with ?limit=N&after=<name>."""
+    tenant = request_tenant()
+    error = tenant_error(tenant)
+    if error:
+        return jsonify(error[0]), error[1]
+    
+    try:
+        limit = parse_page_size(request.args.get('limit'))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
     
-    if os.path.exists(known_faces_dir):
-        for person_name in os.listdir(known_faces_dir):
-            person_path = os.path.join(known_faces_dir, person_name)
-            if os.path.isdir(person_path):
-                faces.append(person_name)
+    recognizer = get_recognizer(tenant)
+    if recognizer is None:
+        return warming_up_response()
     
-    return jsonify({'faces': sorted(faces)})
+    return jsonify(known_faces_page(recognizer, request.args.get('after'), limit))
+
+
+@app.route('/known_faces/<person_name>')
+def known_face(person_name):
+    """Image counts and enrollment status of one person."""
+    tenant = request_tenant()
+    error = tenant_error(tenant)
+    if error:
+        return jsonify(error[0]), error[1]
+    
+    recognizer = get_recognizer(tenant)
+    if recognizer is None:
+        return warming_up_response()
+    
+    person = recognizer.catalog.person(person_name)
+    if person is None:
+        return jsonify({'error': 'Person not found'}), 404
+    return jsonify(person)
 
 
 @app.route('/delete_face/<person_name>', methods=['DELETE', 'POST'])
 def delete_face(person_name):
     """Delete a person from known faces."""
-    person_dir = os.path.join('known_faces', person_name)
+    tenant = request_tenant()
+    error = tenant_error(tenant)
+    if error:
+        return jsonify(error[0]), error[1]
+    
+    recognizer = get_recognizer(tenant)
+    if recognizer is None:
+        return warming_up_response()
+    
+    person_dir = os.path.join(recognizer.known_faces_dir, person_name)
     
     try:
-        if os.path.exists(person_dir):
-            import shutil
-            shutil.rmtree(person_dir)
-            
-            # Clear cache to force reload
-            if os.path.exists('face_model.yml'):
-                os.remove('face_model.yml')
-            if os.path.exists('face_encodings.pkl'):
-                os.remove('face_encodings.pkl')
-            
-            return jsonify({'success': True, 'message': f'Deleted {person_name}'})
-        else:
+        if not os.path.isdir(person_dir):
             return jsonify({'success': False, 'message': 'Person not found'}), 404
+        
+        # Drops the person's histograms and appends a remove record to the model's delta log
+        result = recognizer.delete_face_from_known(person_name)
+        
+        return jsonify(result)
     
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
@@ -170,8 +748,37 @@ def delete_face(person_name):
 
 @app.route('/health')
 def health():
-    """Health check endpoint."""
-    return jsonify({'status': 'ok'})
+    """Liveness check; also reports model readiness, load progress and the recognition queue."""
+    return jsonify({
+        'status': 'ok',
+        'ready': model_loader.ready,
+        'model': model_loader.status(),
+        'pool': recognition_pool.stats() if recognition_pool is not None else None,
+        'cache': result_cache_stats(),
+        'compaction': compaction_schedule.last_report if compaction_schedule is not None else None,
+        'tenants': tenant_registry.stats()
+    })
+
+
+def result_cache_stats():
+    """Hit, miss and eviction counters of the recognizer's result cache, if any."""
+    recognizer = model_loader.recognizer
+    if recognizer is None or recognizer.result_cache is None:
+        return None
+    return recognizer.result_cache.stats()
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics: stage and request latencies, video, model, queue and cache figures."""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/ready')
+def ready():
+    """Readiness check: 200 once the model is loaded, 503 while warming up."""
+    status = model_loader.status()
+    return jsonify({'ready': model_loader.ready, 'model': status}), 200 if model_loader.ready else 503
 
 
 if __name__ == '__main__':
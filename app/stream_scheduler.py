@@ -0,0 +1,516 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+import cv2
+from app.metrics import timed, VIDEO_FRAMES
+from app.tracker import FaceTracker
+from app.video_pipeline import draw_faces, mjpeg_part, _ewma
+
+
+_STREAM_ID = re.compile(r'^([A-Za-z0-9_.-]+)=(?!//)(.+)$')
+
+
+def parse_stream_spec(value, default_id=None):
+    """
+    Parse a stream given as ``[id=]source[;priority=P][;fps=F]``.
+
+    Args:
+        value: Spec string, e.g. 'door=rtsp://cam1/live;priority=2;fps=5'
+        default_id: Stream id when the spec has none (defaults to the
+            source's file name or device index)
+
+    Returns:
+        Dict with stream_id, source, priority and target_fps, ready for
+        StreamScheduler.add_stream
+
+    Raises:
+        ValueError: If an option is unknown or not a number
+    """
+    from app.broadcaster import parse_video_source
+
+    parts = str(value).strip().split(';')
+    spec = {'priority': 1.0, 'target_fps': None}
+    for option in parts[1:]:
+        key, _, number = option.partition('=')
+        key = key.strip()
+        if key not in ('priority', 'fps'):
+            raise ValueError(f"Unknown stream option '{key}' in {value}")
+        spec['priority' if key == 'priority' else 'target_fps'] = float(number)
+
+    match = _STREAM_ID.match(parts[0].strip())
+    stream_id, source = match.groups() if match else (None, parts[0].strip())
+    spec['source'] = parse_video_source(source)
+    spec['stream_id'] = stream_id or default_id or os.path.splitext(os.path.basename(str(spec['source'])))[0]
+    return spec
+
+
+class CameraStream:
+    """One registered source: its capture thread, latest frame and scheduling state."""
+
+    def __init__(self, stream_id, source, priority=1.0, target_fps=None, realtime=None, loop=False):
+        """
+        Initialize the stream.
+
+        Args:
+            stream_id: Name of the stream in events, stats and URLs
+            source: Device index, video file path or stream URL (e.g. RTSP)
+            priority: Relative share of the detection budget when the
+                workers are oversubscribed
+            target_fps: Maximum detection passes per second (None = as many
+                as its share allows)
+            realtime: Pace file sources at their native frame rate
+                (None = only for local video files)
+            loop: Restart file sources when they end
+        """
+        if priority <= 0:
+            raise ValueError("priority must be positive")
+
+        self.stream_id = stream_id
+        self.source = source
+        self.priority = float(priority)
+        self.target_fps = target_fps
+        if realtime is None:
+            realtime = isinstance(source, str) and os.path.isfile(source)
+        self.realtime = realtime
+        self.loop = loop
+        self.state = 'starting'
+        self.tracker = None
+
+        # Latest captured frame and the faces last found on this stream
+        self.frame = None
+        self.frame_id = 0
+        self.frame_time = 0.0
+        self.faces = []
+
+        # Scheduling state, guarded by the scheduler's condition
+        self.busy = False
+        self.processed_id = 0
+        self.last_start = 0.0
+        self.last_done = 0.0
+        self.vtime = 0.0
+        self.thread = None
+        self.stats = {
+            'captured': 0,
+            'processed': 0,
+            'skipped': 0,
+            'errors': 0,
+            'fps': 0.0,
+            'lag_ms': 0.0,
+            'detect_ms': 0.0,
+            'busy_seconds': 0.0,
+        }
+
+    @property
+    def running(self):
+        return self.state in ('starting', 'running')
+
+    def due_at(self):
+        """Earliest time the next detection pass may start under the FPS target."""
+        if not self.target_fps:
+            return 0.0
+        return self.last_start + 1.0 / self.target_fps
+
+
+class StreamScheduler:
+    """
+    Shares one detection budget between several video sources.
+
+    Every registered stream has its own capture thread that keeps only the
+    newest frame, and a fixed pool of worker threads runs detection and
+    recognition for all of them. A free worker takes the stream with the
+    smallest virtual time among those that have a new frame and are due
+    under their FPS target; a pass advances a stream's virtual time by its
+    cost divided by its priority, so when the workers are oversubscribed
+    each stream gets a share of worker time proportional to its priority
+    (weighted fair queueing), and a stream capped by its FPS target leaves
+    its unused share to the others.
+
+    Results are published as events (``events`` / ``add_listener``) and
+    each stream can be watched as MJPEG (``frames``); encoding runs on the
+    viewer's thread, outside the detection budget.
+    """
+
+    def __init__(self, recognizer, workers=2, jpeg_quality=80, max_events=1000, tracker_options=None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            recognizer: Loaded FaceRecognizer shared by all streams
+            workers: Detection worker threads shared by all streams
+            jpeg_quality: JPEG quality of the per-stream MJPEG feeds
+            max_events: Recent events kept for late subscribers
+            tracker_options: FaceTracker options for each stream (None to
+                recognize every face on every pass instead of tracking)
+        """
+        self.recognizer = recognizer
+        self.workers = max(1, workers)
+        self.jpeg_quality = jpeg_quality
+        self.tracker_options = tracker_options
+
+        self._streams = {}
+        self._cond = threading.Condition()
+        self._running = False
+        self._stopped = False
+        self._threads = []
+        self._vclock = 0.0
+        self._events = deque(maxlen=max_events)
+        self._event_seq = 0
+        self._listeners = []
+
+    def __len__(self):
+        return len(self._streams)
+
+    def __contains__(self, stream_id):
+        return stream_id in self._streams
+
+    def start(self):
+        """Start the detection workers."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._stopped = False
+
+        self._threads = [
+            threading.Thread(target=self._worker_loop, name=f'stream-worker-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop every stream and the workers."""
+        with self._cond:
+            self._running = False
+            self._stopped = True
+            streams = list(self._streams.values())
+            for stream in streams:
+                stream.state = 'stopped'
+            self._cond.notify_all()
+
+        for thread in self._threads + [stream.thread for stream in streams]:
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout=5)
+        self._threads = []
+
+    def add_stream(self, stream_id, source, priority=1.0, target_fps=None, realtime=None, loop=False):
+        """
+        Register a source and start reading it.
+
+        Args:
+            stream_id: Unique name of the stream
+            source: Device index, video file path or stream URL
+            priority: Relative share of the detection budget
+            target_fps: Maximum detection passes per second (None = unlimited)
+            realtime: Pace file sources at their native frame rate
+            loop: Restart file sources when they end
+
+        Returns:
+            The CameraStream
+
+        Raises:
+            ValueError: If the id is already registered or priority is not positive
+        """
+        stream = CameraStream(stream_id, source, priority, target_fps, realtime, loop)
+        if self.tracker_options is not None:
+            stream.tracker = FaceTracker(self.recognizer, **self.tracker_options)
+
+        with self._cond:
+            if stream_id in self._streams:
+                raise ValueError(f"Stream '{stream_id}' already exists")
+            # Start level with the busiest stream instead of owing it a backlog
+            stream.vtime = self._vclock
+            self._streams[stream_id] = stream
+
+        stream.thread = threading.Thread(
+            target=self._capture_loop, args=(stream,), name=f'stream-capture-{stream_id}', daemon=True
+        )
+        stream.thread.start()
+        self.start()
+        print(f"✓ Registered stream '{stream_id}' ({source})")
+        return stream
+
+    def remove_stream(self, stream_id):
+        """
+        Stop reading a source and forget it.
+
+        Returns:
+            True if the stream existed
+        """
+        with self._cond:
+            stream = self._streams.pop(stream_id, None)
+            if stream is None:
+                return False
+            stream.state = 'stopped'
+            self._cond.notify_all()
+
+        if stream.thread is not None and stream.thread is not threading.current_thread():
+            stream.thread.join(timeout=5)
+        print(f"✓ Removed stream '{stream_id}'")
+        return True
+
+    def stats(self):
+        """
+        Per-stream throughput and lag.
+
+        Returns:
+            Dict of stream id -> stats, where fps is the achieved detection
+            rate, lag_ms the time from capture to published result and share
+            the stream's fraction of the worker time used so far
+        """
+        with self._cond:
+            total_busy = sum(stream.stats['busy_seconds'] for stream in self._streams.values())
+            result = {}
+            for stream_id, stream in self._streams.items():
+                stats = dict(stream.stats)
+                stats['fps'] = round(stats['fps'], 2)
+                stats['lag_ms'] = round(stats['lag_ms'], 1)
+                stats['detect_ms'] = round(stats['detect_ms'], 1)
+                stats['share'] = round(stats.pop('busy_seconds') / total_busy, 3) if total_busy else 0.0
+                stats.update({
+                    'source': str(stream.source),
+                    'state': stream.state,
+                    'priority': stream.priority,
+                    'target_fps': stream.target_fps,
+                })
+                result[stream_id] = stats
+            return result
+
+    def add_listener(self, callback):
+        """
+        Call a function with every published event.
+
+        Args:
+            callback: Callable taking one event dict; it runs on a worker
+                thread and should return quickly
+        """
+        with self._cond:
+            self._listeners.append(callback)
+
+    def events(self, stream_id=None, after=None, timeout=None):
+        """
+        Yield published events as they arrive.
+
+        Args:
+            stream_id: Only yield events of this stream (None for all)
+            after: Also replay buffered events with a higher seq (None to
+                start with the next event)
+            timeout: Yield None after this many idle seconds, e.g. to send
+                keep-alives (None to wait indefinitely)
+
+        Yields:
+            Event dicts with seq, stream_id, frame_id, time, lag_ms and faces
+        """
+        with self._cond:
+            last_seq = self._event_seq if after is None else after
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._event_seq != last_seq or self._stopped, timeout=timeout)
+                if self._stopped and self._event_seq == last_seq:
+                    return
+                if self._event_seq == last_seq:
+                    pending = None
+                else:
+                    pending = [event for event in self._events if event['seq'] > last_seq]
+                    last_seq = self._event_seq
+
+            if pending is None:
+                yield None
+                continue
+            for event in pending:
+                if stream_id is None or event['stream_id'] == stream_id:
+                    yield event
+
+    def frames(self, stream_id, target_fps=None):
+        """
+        Yield one stream's frames, annotated with its latest faces, as MJPEG parts.
+
+        Args:
+            stream_id: Registered stream id
+            target_fps: Maximum rate of output frames (None = every captured frame)
+
+        Yields:
+            Encoded frame as bytes
+
+        Raises:
+            KeyError: If the stream is not registered
+        """
+        stream = self._streams[stream_id]
+        last_id = 0
+        last_emit = 0.0
+
+        while True:
+            if target_fps:
+                wait = last_emit + 1.0 / target_fps - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+
+            with self._cond:
+                self._cond.wait_for(lambda: stream.frame_id != last_id or not stream.running, timeout=1.0)
+                if stream.frame_id == last_id:
+                    if not stream.running:
+                        return
+                    continue
+                frame = stream.frame
+                faces = stream.faces
+                last_id = stream.frame_id
+
+            output = frame.copy()
+            draw_faces(output, faces)
+            with timed('encode'):
+                ret, buffer = cv2.imencode('.jpg', output, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            if not ret:
+                continue
+            last_emit = time.monotonic()
+            yield mjpeg_part(buffer.tobytes())
+
+    def _capture_loop(self, stream):
+        """Read one source, keeping only its latest frame."""
+        cap = cv2.VideoCapture(stream.source)
+        if not cap.isOpened():
+            print(f"✗ Cannot open stream '{stream.stream_id}' ({stream.source})")
+            with self._cond:
+                stream.state = 'failed'
+                self._cond.notify_all()
+            return
+
+        try:
+            interval = 0.0
+            if stream.realtime:
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                interval = 1.0 / fps if fps and fps > 0 else 0.0
+            next_time = time.monotonic()
+            with self._cond:
+                if stream.state == 'starting':
+                    stream.state = 'running'
+
+            while stream.running:
+                with timed('capture'):
+                    ret, frame = cap.read()
+                if not ret:
+                    if stream.loop and stream.stats['captured']:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    break
+                VIDEO_FRAMES.inc(1, stream.stream_id, 'captured')
+
+                with self._cond:
+                    if stream.frame_id != stream.processed_id:
+                        # Replaced before any worker got to it
+                        stream.stats['skipped'] += 1
+                    stream.frame = frame
+                    stream.frame_id += 1
+                    stream.frame_time = time.monotonic()
+                    stream.stats['captured'] += 1
+                    self._cond.notify_all()
+
+                if interval:
+                    next_time += interval
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_time = time.monotonic()
+        finally:
+            cap.release()
+            with self._cond:
+                if stream.running:
+                    stream.state = 'ended'
+                self._cond.notify_all()
+
+    def _next_stream(self, now):
+        """
+        Pick the stream the next free worker should process; the condition must be held.
+
+        Returns:
+            Tuple of (stream or None, seconds to wait before asking again or None)
+        """
+        chosen = None
+        wake_at = None
+        for stream in self._streams.values():
+            if stream.busy or stream.frame_id == stream.processed_id or stream.state == 'stopped':
+                continue
+            due = stream.due_at()
+            if due > now:
+                wake_at = due if wake_at is None else min(wake_at, due)
+                continue
+            # Streams that were idle or capped do not bank credit for later
+            stream.vtime = max(stream.vtime, self._vclock)
+            if chosen is None or (stream.vtime, -stream.priority) < (chosen.vtime, -chosen.priority):
+                chosen = stream
+
+        if chosen is not None:
+            return chosen, None
+        return None, (wake_at - now if wake_at is not None else None)
+
+    def _worker_loop(self):
+        """Run detection passes for whichever stream is next in line."""
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running:
+                        return
+                    now = time.monotonic()
+                    stream, wait = self._next_stream(now)
+                    if stream is not None:
+                        break
+                    self._cond.wait(timeout=wait if wait is not None else 1.0)
+
+                stream.busy = True
+                stream.last_start = now
+                self._vclock = stream.vtime
+                frame = stream.frame
+                frame_id = stream.frame_id
+                frame_time = stream.frame_time
+                stream.processed_id = frame_id
+
+            started = time.monotonic()
+            try:
+                faces = self.recognizer.recognize_faces_in_buffer(frame, tracker=stream.tracker)['faces']
+                error = None
+            except Exception as e:
+                faces = []
+                error = str(e)
+            finished = time.monotonic()
+            cost = finished - started
+
+            with self._cond:
+                stream.busy = False
+                stream.vtime += cost / stream.priority
+                stats = stream.stats
+                stats['busy_seconds'] += cost
+                stats['detect_ms'] = _ewma(stats['detect_ms'], cost * 1000)
+                stats['lag_ms'] = _ewma(stats['lag_ms'], (finished - frame_time) * 1000)
+                if stream.last_done:
+                    stats['fps'] = _ewma(stats['fps'], 1.0 / max(finished - stream.last_done, 1e-6))
+                stream.last_done = finished
+                if error is None:
+                    stream.faces = faces
+                    stats['processed'] += 1
+                else:
+                    stats['errors'] += 1
+
+                self._event_seq += 1
+                event = {
+                    'seq': self._event_seq,
+                    'stream_id': stream.stream_id,
+                    'frame_id': frame_id,
+                    'time': time.time(),
+                    'lag_ms': round((finished - frame_time) * 1000, 1),
+                    'faces': faces,
+                }
+                if error is not None:
+                    event['error'] = error
+                self._events.append(event)
+                listeners = list(self._listeners)
+                self._cond.notify_all()
+
+            VIDEO_FRAMES.inc(1, stream.stream_id, 'detected' if error is None else 'failed')
+            for callback in listeners:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"✗ Stream event listener failed: {str(e)}")
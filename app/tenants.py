@@ -0,0 +1,194 @@
+"""
+Per-tenant galleries for serving many customers from one deployment.
+
+Each tenant keeps its known faces, binary model and crop cache under
+``tenants/<tenant>/``; the default tenant uses the deployment's own
+``known_faces/`` and ``face_model/``. TenantRegistry loads a tenant's
+recognizer on first use and keeps recently used ones in memory up to a
+byte budget, evicting the least recently used. Models are memory-mapped
+binary snapshots, so a tenant that was evicted loads again in about a
+millisecond.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TENANT = 'default'
+
+_TENANT_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+
+
+def is_valid_tenant(tenant):
+    """Check that a tenant name is safe to use as a single directory name."""
+    return bool(tenant) and bool(_TENANT_NAME.match(tenant)) and '..' not in tenant
+
+
+def known_faces_dir(tenant, tenants_dir='tenants', default_dir='known_faces'):
+    """Directory holding a tenant's known faces (see FaceRecognizer's tenant option)."""
+    if tenant in (None, DEFAULT_TENANT):
+        return default_dir
+    return os.path.join(tenants_dir, tenant, 'known_faces')
+
+
+def tenant_exists(tenant, tenants_dir='tenants'):
+    """Whether a tenant has a gallery on disk (the default tenant always exists)."""
+    return tenant in (None, DEFAULT_TENANT) or os.path.isdir(os.path.join(tenants_dir, tenant))
+
+
+def list_tenants(tenants_dir='tenants'):
+    """Sorted names of the tenants with a gallery directory."""
+    if not os.path.isdir(tenants_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(tenants_dir)
+        if is_valid_tenant(name) and os.path.isdir(os.path.join(tenants_dir, name))
+    )
+
+
+class TenantRegistry:
+    """
+    Loaded recognizers by tenant, least recently used evicted first.
+
+    Concurrent first requests for the same tenant wait for one load
+    instead of loading it twice. Pinned tenants (the default gallery) are
+    counted against the budget but never evicted.
+    """
+
+    def __init__(self, factory, max_bytes=512 * 1024 * 1024, max_tenants=None):
+        """
+        Initialize the registry.
+
+        Args:
+            factory: Callable taking a tenant name and returning a new,
+                not yet loaded FaceRecognizer for it
+            max_bytes: Memory budget for loaded models (see
+                FaceRecognizer.memory_bytes)
+            max_tenants: Most tenants loaded at once (None = only the
+                memory budget applies)
+        """
+        self.factory = factory
+        self.max_bytes = max_bytes
+        self.max_tenants = max_tenants
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.last_load_ms = 0.0
+        self._entries = OrderedDict()
+        self._pinned = set()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, tenant):
+        return tenant in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def pin(self, tenant, recognizer):
+        """Register an already loaded recognizer that must never be evicted."""
+        with self._lock:
+            self._entries[tenant] = recognizer
+            self._pinned.add(tenant)
+
+    def get(self, tenant):
+        """
+        Return a tenant's recognizer, loading its model on first use.
+
+        Args:
+            tenant: Tenant name
+
+        Returns:
+            Loaded FaceRecognizer
+
+        Raises:
+            Whatever the factory or the model load raises
+        """
+        while True:
+            with self._lock:
+                recognizer = self._entries.get(tenant)
+                if recognizer is not None:
+                    self._entries.move_to_end(tenant)
+                    self.hits += 1
+                    return recognizer
+
+                loading = self._loading.get(tenant)
+                if loading is None:
+                    loading = self._loading[tenant] = threading.Event()
+                    break
+            # Another request is loading this tenant; use its result
+            loading.wait()
+
+        try:
+            started = time.perf_counter()
+            recognizer = self.factory(tenant)
+            recognizer.load_known_faces()
+            load_ms = (time.perf_counter() - started) * 1000
+
+            with self._lock:
+                self._entries[tenant] = recognizer
+                self.misses += 1
+                self.last_load_ms = load_ms
+                evicted = self._evict(keep=tenant)
+        finally:
+            with self._lock:
+                self._loading.pop(tenant, None)
+            loading.set()
+
+        for old in evicted:
+            old.close()
+        return recognizer
+
+    def discard(self, tenant):
+        """Drop a tenant's recognizer, e.g. after its gallery was deleted."""
+        with self._lock:
+            recognizer = self._entries.pop(tenant, None)
+            self._pinned.discard(tenant)
+        if recognizer is not None:
+            recognizer.close()
+
+    def memory_bytes(self):
+        with self._lock:
+            recognizers = list(self._entries.values())
+        return sum(recognizer.memory_bytes() for recognizer in recognizers)
+
+    def stats(self):
+        """Loaded tenants, memory use and hit/miss/eviction counters."""
+        with self._lock:
+            loaded = len(self._entries)
+            lookups = self.hits + self.misses
+            stats = {
+                'loaded': loaded,
+                'pinned': len(self._pinned),
+                'max_bytes': self.max_bytes,
+                'max_tenants': self.max_tenants,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'last_load_ms': round(self.last_load_ms, 2),
+            }
+        stats['bytes'] = self.memory_bytes()
+        return stats
+
+    def _evict(self, keep):
+        """
+        Drop least recently used tenants until within budget; the lock must be held.
+
+        Returns:
+            Evicted recognizers, to be closed outside the lock
+        """
+        total = sum(recognizer.memory_bytes() for recognizer in self._entries.values())
+        evicted = []
+        for tenant in list(self._entries):
+            over_count = self.max_tenants is not None and len(self._entries) > self.max_tenants
+            if total <= self.max_bytes and not over_count:
+                break
+            if tenant == keep or tenant in self._pinned:
+                continue
+            recognizer = self._entries.pop(tenant)
+            total -= recognizer.memory_bytes()
+            evicted.append(recognizer)
+            self.evictions += 1
+        return evicted
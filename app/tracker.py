@@ -0,0 +1,310 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+import cv2
+
+
+# OpenCV tracker constructors by name, looked up in cv2 and then cv2.legacy
+OPENCV_TRACKERS = {
+    'kcf': 'TrackerKCF_create',
+    'csrt': 'TrackerCSRT_create',
+    'mil': 'TrackerMIL_create',
+    'mosse': 'TrackerMOSSE_create',
+}
+
+
+def _create_opencv_tracker(tracker_type):
+    """Create an OpenCV single-object tracker, or raise ValueError if unavailable."""
+    factory_name = OPENCV_TRACKERS.get(tracker_type)
+    if factory_name is None:
+        raise ValueError(f"Unknown tracker type: {tracker_type}")
+
+    for module in (cv2, getattr(cv2, 'legacy', None)):
+        factory = getattr(module, factory_name, None)
+        if factory is not None:
+            return factory()
+
+    raise ValueError(f"OpenCV tracker '{tracker_type}' is not available in this build")
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _centroid_close(a, b):
+    """Check whether two boxes' centres are within half a face width of each other."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    dx = (ax + aw / 2) - (bx + bw / 2)
+    dy = (ay + ah / 2) - (by + bh / 2)
+    limit = 0.5 * max(aw, ah, bw, bh)
+    return dx * dx + dy * dy <= limit * limit
+
+
+class Track:
+    """A face followed across frames, with its last recognized identity."""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.name = "Unknown"
+        self.confidence = 0.0
+        self.last_predicted = 0.0
+        self.missed = 0
+        self.cv_tracker = None
+
+    def as_face(self):
+        """Return the track in the face dict format used by FaceRecognizer."""
+        x, y, w, h = self.box
+        return {
+            'name': self.name,
+            'confidence': float(self.confidence),
+            'track_id': self.track_id,
+            'location': {
+                'top': y,
+                'right': x + w,
+                'bottom': y + h,
+                'left': x
+            }
+        }
+
+
+class FaceTracker:
+    """
+    Carries face identities across consecutive frames of one stream.
+
+    Detected faces are associated with existing tracks by IoU (falling back
+    to centroid distance), and the LBPH ``predict`` only runs for a track
+    when it is new, when its identity is weak, or when its refresh interval
+    has expired. With an OpenCV tracker type configured, full cascade
+    detection also runs only every ``detect_interval`` frames and the
+    trackers move the boxes in between. Tracks are dropped when the
+    recognizer swaps in a new model, so names never outlive the gallery
+    they came from.
+    """
+
+    def __init__(self, recognizer, detect_interval=1, refresh_interval=2.0, min_confidence=0.3,
+                 iou_threshold=0.3, max_missed=2, tracker_type=None):
+        """
+        Initialize the tracker.
+
+        Args:
+            recognizer: FaceRecognizer providing detect_faces and identify_face
+            detect_interval: Run cascade detection every N frames (only with
+                tracker_type; without it boxes cannot move between detections)
+            refresh_interval: Seconds after which a track is re-recognized
+            min_confidence: Known faces below this confidence are re-recognized
+                on every detection
+            iou_threshold: Minimum IoU to associate a detection with a track
+            max_missed: Frames a track survives without a matching detection
+            tracker_type: Optional OpenCV tracker ('kcf', 'csrt', 'mil', 'mosse')
+        """
+        if tracker_type is not None:
+            # Fail early if this OpenCV build lacks the requested tracker
+            _create_opencv_tracker(tracker_type)
+
+        self.recognizer = recognizer
+        self.detect_interval = max(1, detect_interval) if tracker_type else 1
+        self.refresh_interval = refresh_interval
+        self.min_confidence = min_confidence
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracker_type = tracker_type
+
+        self.tracks = []
+        self._frame_index = 0
+        self._since_full_scan = 0
+        # Model the tracks were identified with; a swap drops them
+        self._model_version = recognizer.model_version
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.stats = {'frames': 0, 'detections': 0, 'predictions': 0, 'reused': 0}
+
+    def reset(self):
+        """Forget all tracks."""
+        with self._lock:
+            self.tracks = []
+            self._frame_index = 0
+            self._since_full_scan = 0
+
+    def update(self, image, gray=None):
+        """
+        Process the next frame of the stream.
+
+        Args:
+            image: BGR (or grayscale) frame
+            gray: Grayscale version of the frame, if already computed
+
+        Returns:
+            List of face dicts (with a 'track_id') for the current tracks
+        """
+        if gray is None:
+            gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        with self._lock:
+            now = time.monotonic()
+            self.stats['frames'] += 1
+
+            # Names from a replaced model may be stale (e.g. a person was deleted)
+            if self.recognizer.model_version != self._model_version:
+                self._model_version = self.recognizer.model_version
+                self.tracks = []
+                self._since_full_scan = 0
+
+            if self._frame_index % self.detect_interval == 0 or not self.tracks:
+                self._detect(image, gray, now)
+            else:
+                self._follow(image, gray, now)
+
+            self._frame_index += 1
+            return [track.as_face() for track in self.tracks]
+
+    def _detect(self, image, gray, now):
+        """Run cascade detection and associate the boxes with tracks."""
+        self.stats['detections'] += 1
+
+        # In ROI mode only search around known faces, with periodic full scans
+        regions = None
+        if self.recognizer.roi_detection and self.tracks:
+            if self._since_full_scan < self.recognizer.full_scan_interval:
+                regions = [track.box for track in self.tracks]
+        self._since_full_scan = self._since_full_scan + 1 if regions else 1
+
+        boxes = [tuple(int(v) for v in box) for box in self.recognizer.detect_faces(gray, regions)]
+
+        # Greedy association, best-overlapping pairs first
+        pairs = []
+        for t, track in enumerate(self.tracks):
+            for b, box in enumerate(boxes):
+                iou = box_iou(track.box, box)
+                if iou >= self.iou_threshold or _centroid_close(track.box, box):
+                    pairs.append((iou, t, b))
+        pairs.sort(reverse=True)
+
+        matched_tracks = set()
+        matched_boxes = set()
+        for _, t, b in pairs:
+            if t in matched_tracks or b in matched_boxes:
+                continue
+            matched_tracks.add(t)
+            matched_boxes.add(b)
+            track = self.tracks[t]
+            track.box = boxes[b]
+            track.missed = 0
+            self._refresh(track, image, gray, now, new=False)
+
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    continue
+            survivors.append(track)
+
+        for b, box in enumerate(boxes):
+            if b not in matched_boxes:
+                track = Track(next(self._ids), box)
+                self._refresh(track, image, gray, now, new=True)
+                survivors.append(track)
+
+        self.tracks = survivors
+
+    def _follow(self, image, gray, now):
+        """Move tracks with their OpenCV trackers between detections."""
+        survivors = []
+        for track in self.tracks:
+            ok, box = track.cv_tracker.update(image) if track.cv_tracker is not None else (False, None)
+            if ok:
+                track.box = tuple(int(v) for v in box)
+                track.missed = 0
+            else:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    continue
+            survivors.append(track)
+        self.tracks = survivors
+
+    def _refresh(self, track, image, gray, now, new):
+        """Re-recognize a track if it needs it, and re-seed its OpenCV tracker."""
+        stale = now - track.last_predicted >= self.refresh_interval
+        weak = track.name != "Unknown" and track.confidence < self.min_confidence
+
+        if new or stale or weak:
+            face = self.recognizer.identify_face(gray, track.box)
+            track.name = face['name']
+            track.confidence = face['confidence']
+            track.last_predicted = now
+            self.stats['predictions'] += 1
+        else:
+            self.stats['reused'] += 1
+
+        if self.tracker_type is not None:
+            track.cv_tracker = _create_opencv_tracker(self.tracker_type)
+            track.cv_tracker.init(image, track.box)
+
+
+class TrackerRegistry:
+    """Bounded set of FaceTrackers keyed by client stream id."""
+
+    def __init__(self, recognizer, max_streams=256, ttl=60.0, **tracker_options):
+        """
+        Initialize the registry.
+
+        Args:
+            recognizer: FaceRecognizer shared by all trackers
+            max_streams: Maximum number of streams tracked at once
+            ttl: Seconds of inactivity after which a stream is forgotten
+            **tracker_options: Options passed to each FaceTracker
+        """
+        self.recognizer = recognizer
+        self.max_streams = max_streams
+        self.ttl = ttl
+        self.tracker_options = tracker_options
+        self._trackers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._trackers)
+
+    def get(self, stream_id, recognizer=None):
+        """
+        Return the tracker for a stream, creating it on first use.
+
+        Args:
+            stream_id: Key of the stream
+            recognizer: FaceRecognizer for a new tracker (None = the shared one),
+                e.g. a tenant's gallery
+        """
+        now = time.monotonic()
+        with self._lock:
+            # Expire idle streams (least recently used first)
+            while self._trackers:
+                oldest_id, (_, last_used) = next(iter(self._trackers.items()))
+                expired = now - last_used > self.ttl
+                full = stream_id not in self._trackers and len(self._trackers) >= self.max_streams
+                if not (expired or full):
+                    break
+                del self._trackers[oldest_id]
+
+            entry = self._trackers.pop(stream_id, None)
+            tracker = entry[0] if entry else FaceTracker(recognizer or self.recognizer, **self.tracker_options)
+            self._trackers[stream_id] = (tracker, now)
+            return tracker
+
+    def discard(self, stream_id):
+        """Forget one stream, e.g. when its connection closes."""
+        with self._lock:
+            self._trackers.pop(stream_id, None)
+
+    def reset(self):
+        """Forget every stream, e.g. after the model changed."""
+        with self._lock:
+            self._trackers.clear()
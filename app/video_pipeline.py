@@ -0,0 +1,274 @@
+import os
+import time
+import threading
+import cv2
+from app.metrics import timed, VIDEO_FRAMES, VIDEO_FPS
+
+
+def draw_faces(frame, faces):
+    """
+    Draw recognition boxes and labels onto a BGR frame in place.
+
+    Args:
+        frame: BGR image array
+        faces: List of face dicts as returned by FaceRecognizer
+    """
+    for face in faces:
+        loc = face['location']
+        x, y = loc['left'], loc['top']
+        w, h = loc['right'] - loc['left'], loc['bottom'] - loc['top']
+        name = face['name']
+
+        # Draw box and label
+        color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+
+        label_text = f"{name} ({face['confidence']:.2f})" if name != "Unknown" else name
+        cv2.rectangle(frame, (x, y + h - 35), (x + w, y + h), color, cv2.FILLED)
+        cv2.putText(frame, label_text, (x + 6, y + h - 6),
+                    cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
+
+
+def mjpeg_part(jpeg_bytes):
+    """Wrap an encoded JPEG as one part of a multipart/x-mixed-replace stream."""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n')
+
+
+class VideoPipeline:
+    """
+    Capture, detection and encoding stages for a video source with bounded latency.
+
+    A capture thread keeps only the most recent frame, a detection thread
+    always works on the newest frame it has not seen yet, and the encoder
+    stage (the ``frames`` generator) redraws the last known faces on every
+    frame in between. When detection is slower than capture, frames are
+    skipped for detection instead of queueing up, so latency stays bounded
+    and the effective skip rate follows the detection cost.
+    """
+
+    def __init__(self, recognizer, video_source=0, target_fps=None, detect_fps=None,
+                 max_latency=0.5, realtime=None, jpeg_quality=80, tracker=None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            recognizer: FaceRecognizer used for detection and recognition
+            video_source: Device index, video file path or stream URL
+            target_fps: Maximum rate of encoded output frames (None = unlimited)
+            detect_fps: Maximum rate of detection passes (None = as fast as possible)
+            max_latency: Frames older than this many seconds are dropped
+                instead of encoded
+            realtime: Pace file sources at their native frame rate
+                (None = only for local video files)
+            jpeg_quality: JPEG quality of encoded output frames
+            tracker: Optional FaceTracker that carries identities between
+                detection passes instead of re-recognizing every face
+        """
+        self.recognizer = recognizer
+        self.video_source = video_source
+        self.target_fps = target_fps
+        self.detect_fps = detect_fps
+        self.max_latency = max_latency
+        self.jpeg_quality = jpeg_quality
+        self.tracker = tracker
+        if realtime is None:
+            realtime = isinstance(video_source, str) and os.path.isfile(video_source)
+        self.realtime = realtime
+
+        self._cond = threading.Condition()
+        self._running = False
+        self._capture_done = False
+        self._frame = None
+        self._frame_id = 0
+        self._frame_time = 0.0
+        self._faces = []
+        self._threads = []
+        self._max_frames = None
+        self.stats = {
+            'captured': 0,
+            'detected': 0,
+            'encoded': 0,
+            'dropped': 0,
+            'detect_ms': 0.0,
+            'latency_ms': 0.0,
+            'fps': 0.0,
+        }
+        # Label of this source in metrics
+        self._source_label = str(video_source)
+
+    def start(self, max_frames=None):
+        """Start the capture and detection threads."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._capture_done = False
+            self._max_frames = max_frames
+
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name='video-capture', daemon=True),
+            threading.Thread(target=self._detect_loop, name='video-detect', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop the pipeline and wait for its threads to exit."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=5)
+        self._threads = []
+
+    def frames(self, max_frames=None):
+        """
+        Run the pipeline and yield annotated frames as MJPEG parts.
+
+        Args:
+            max_frames: Maximum frames to capture (None for unlimited)
+
+        Yields:
+            Processed frame as bytes
+        """
+        self.start(max_frames)
+        last_id = 0
+        last_emit = 0.0
+
+        try:
+            while True:
+                if self.target_fps:
+                    wait = last_emit + 1.0 / self.target_fps - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: (self._frame_id != last_id or self._capture_done
+                                 or not self._running),
+                        timeout=1.0
+                    )
+                    if not self._running:
+                        break
+                    if self._frame_id == last_id:
+                        if self._capture_done:
+                            break
+                        continue
+
+                    frame = self._frame
+                    frame_time = self._frame_time
+                    faces = self._faces
+                    last_id = self._frame_id
+
+                latency = time.monotonic() - frame_time
+                if self.max_latency is not None and latency > self.max_latency:
+                    self.stats['dropped'] += 1
+                    VIDEO_FRAMES.inc(1, self._source_label, 'dropped')
+                    continue
+
+                # Redraw the last known faces on every frame between detections
+                output = frame.copy()
+                draw_faces(output, faces)
+
+                with timed('encode'):
+                    ret, buffer = cv2.imencode(
+                        '.jpg', output, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality]
+                    )
+                if not ret:
+                    continue
+
+                now = time.monotonic()
+                if last_emit:
+                    self.stats['fps'] = _ewma(self.stats['fps'], 1.0 / max(now - last_emit, 1e-6))
+                    VIDEO_FPS.set(round(self.stats['fps'], 2), self._source_label)
+                last_emit = now
+                self.stats['encoded'] += 1
+                self.stats['latency_ms'] = _ewma(self.stats['latency_ms'], (last_emit - frame_time) * 1000)
+                VIDEO_FRAMES.inc(1, self._source_label, 'encoded')
+
+                yield mjpeg_part(buffer.tobytes())
+        finally:
+            self.stop()
+
+    def _capture_loop(self):
+        """Read frames from the source, keeping only the latest one."""
+        cap = cv2.VideoCapture(self.video_source)
+
+        try:
+            interval = 0.0
+            if self.realtime:
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                interval = 1.0 / fps if fps and fps > 0 else 0.0
+            next_time = time.monotonic()
+
+            while self._running:
+                with timed('capture'):
+                    ret, frame = cap.read()
+
+                if not ret:
+                    break
+                VIDEO_FRAMES.inc(1, self._source_label, 'captured')
+
+                with self._cond:
+                    self._frame = frame
+                    self._frame_id += 1
+                    self._frame_time = time.monotonic()
+                    self.stats['captured'] += 1
+                    self._cond.notify_all()
+
+                if self._max_frames and self.stats['captured'] >= self._max_frames:
+                    break
+
+                if interval:
+                    next_time += interval
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_time = time.monotonic()
+        finally:
+            cap.release()
+            with self._cond:
+                self._capture_done = True
+                self._cond.notify_all()
+
+    def _detect_loop(self):
+        """Detect and recognize faces on the newest captured frame."""
+        last_id = 0
+        last_start = 0.0
+
+        while True:
+            if self.detect_fps:
+                wait = last_start + 1.0 / self.detect_fps - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: (not self._running or self._frame_id != last_id
+                             or self._capture_done)
+                )
+                if not self._running or self._frame_id == last_id:
+                    return
+
+                frame = self._frame
+                last_id = self._frame_id
+
+            last_start = time.monotonic()
+            faces = self.recognizer.recognize_faces_in_buffer(frame, tracker=self.tracker)['faces']
+            detect_ms = (time.monotonic() - last_start) * 1000
+
+            with self._cond:
+                self._faces = faces
+                self.stats['detected'] += 1
+                self.stats['detect_ms'] = _ewma(self.stats['detect_ms'], detect_ms)
+                VIDEO_FRAMES.inc(1, self._source_label, 'detected')
+                self._cond.notify_all()
+
+
+def _ewma(current, sample, alpha=0.2):
+    """Exponentially weighted moving average, seeded with the first sample."""
+    return sample if current == 0.0 else current + alpha * (sample - current)
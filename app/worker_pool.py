@@ -0,0 +1,370 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app import metrics
+
+
+# FaceRecognizer of the current worker process, created by _init_worker
+_worker = None
+# Recognizers of other tenants in this worker, least recently used first
+_tenant_workers = OrderedDict()
+_worker_options = None
+
+# Tenant models each worker keeps open (they are memory-mapped, so cheap to reopen)
+WORKER_TENANTS = 8
+
+# Methods a job may call on the worker's recognizer
+POOL_METHODS = ('recognize_faces_in_buffer', 'recognize_faces_in_image', 'recognize_batch')
+
+
+class PoolSaturated(Exception):
+    """Raised when the recognition queue is full and a job is turned away."""
+
+
+def _recognizer_options(recognizer):
+    """Constructor arguments that recreate a FaceRecognizer's settings in a worker."""
+    params = recognizer.detector_params
+    return {
+        'known_faces_dir': recognizer.known_faces_dir,
+        'tolerance': recognizer.tolerance,
+        'model': recognizer.model,
+        'scale_factor': params['scale_factor'],
+        'min_neighbors': params['min_neighbors'],
+        'min_size': params['min_size'],
+        'detection_width': params['detection_width'],
+        'roi_detection': recognizer.roi_detection,
+        'roi_margin': recognizer.roi_margin,
+        'full_scan_interval': recognizer.full_scan_interval,
+        'index': recognizer.index,
+        'index_options': recognizer.index_options,
+        'tenant': recognizer.tenant,
+        'tenants_dir': recognizer.tenants_dir,
+        # Results are cached once, in the parent, before jobs are queued
+        'result_cache_size': 0,
+    }
+
+
+def _init_worker(options, model_dir):
+    """Create the worker's recognizer; its model is loaded by the first job."""
+    global _worker, _worker_options
+    import cv2
+    from app.face_recognizer import FaceRecognizer
+
+    # One process per core already; OpenCV threads would only oversubscribe
+    cv2.setNumThreads(1)
+    _worker_options = options
+    _worker = FaceRecognizer(**options)
+    _worker.model_dir = model_dir
+
+
+def _worker_for(tenant):
+    """Return this worker's recognizer for a tenant (None = the pool's own gallery)."""
+    if tenant is None:
+        return _worker
+
+    recognizer = _tenant_workers.pop(tenant, None)
+    if recognizer is None:
+        from app.face_recognizer import FaceRecognizer
+        recognizer = FaceRecognizer(**dict(_worker_options, tenant=tenant))
+    _tenant_workers[tenant] = recognizer
+    while len(_tenant_workers) > WORKER_TENANTS:
+        _tenant_workers.popitem(last=False)[1].close()
+    return recognizer
+
+
+def _run_job(tenant, model_id, method, args, kwargs, submitted_at=None):
+    """
+    Run one recognizer call, first following the parent to its model snapshot.
+
+    Returns:
+        Tuple of (result, metric observations to replay in the parent, or
+        None when the parent does not record metrics)
+    """
+    worker = _worker_for(tenant)
+    if not worker.is_ready or worker.model_id != model_id:
+        worker.reload_saved_model()
+
+    if submitted_at is None:
+        return getattr(worker, method)(*args, **kwargs), None
+
+    with metrics.collect(all_threads=True) as observations:
+        metrics.STAGE_SECONDS.observe(max(0.0, time.time() - submitted_at), 'queue_wait')
+        result = getattr(worker, method)(*args, **kwargs)
+    return result, observations
+
+
+class RecognitionPool:
+    """
+    Runs recognition jobs on a bounded pool of worker processes.
+
+    Each worker holds a read-only copy of the saved model: it memory-maps
+    the snapshot named by the parent's model_id and reloads only when a
+    job arrives with a newer id, so adding or deleting a face never
+    changes a model under a job in progress. Detection and matching run
+    in separate processes, so throughput scales with cores instead of
+    being serialized by the GIL.
+
+    Admission is bounded: once max_pending jobs are queued or running,
+    submit raises PoolSaturated instead of letting the queue grow, and
+    the caller should answer 503 with Retry-After.
+    """
+
+    def __init__(self, recognizer, workers=None, max_pending=None):
+        """
+        Initialize the pool.
+
+        Args:
+            recognizer: Loaded FaceRecognizer owning the gallery; workers copy
+                its settings and follow its saved model
+            workers: Worker processes (None = one per CPU core, 0 = run jobs
+                on the calling thread with the same admission control)
+            max_pending: Jobs queued or running before new ones are rejected
+                (defaults to 4 per worker)
+        """
+        self.recognizer = recognizer
+        self.workers = (os.cpu_count() or 1) if workers is None else max(0, workers)
+        self.max_pending = max_pending or 4 * max(1, self.workers)
+        self.pending = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Queue a recognizer call.
+
+        Args:
+            method: Name of the FaceRecognizer method (one of POOL_METHODS)
+            *args, **kwargs: Arguments for the method; must be picklable
+
+        Returns:
+            Future resolving to the method's result
+
+        Raises:
+            PoolSaturated: If max_pending jobs are already queued or running
+        """
+        return self.submit_many([(method, args, kwargs)])[0]
+
+    def submit_many(self, calls, recognizer=None):
+        """
+        Queue several recognizer calls, admitting all of them or none.
+
+        Args:
+            calls: List of (method, args, kwargs) tuples
+            recognizer: Tenant recognizer to run the calls against (None =
+                the pool's own); workers open the tenant's saved model
+
+        Returns:
+            List of futures, one per call
+
+        Raises:
+            PoolSaturated: If the calls do not fit in the queue
+        """
+        for method, _, _ in calls:
+            if method not in POOL_METHODS:
+                raise ValueError(f"{method} cannot run on the recognition pool")
+
+        with self._lock:
+            if self.pending + len(calls) > self.max_pending:
+                self.rejected += 1
+                raise PoolSaturated(f"Recognition queue is full ({self.pending} pending)")
+            self.pending += len(calls)
+
+        futures = []
+        try:
+            for method, args, kwargs in calls:
+                futures.append(self._start(method, args, kwargs, recognizer or self.recognizer))
+        except Exception:
+            # Calls that never started give their slots back
+            with self._lock:
+                self.pending -= len(calls) - len(futures)
+            raise
+        return futures
+
+    def run(self, method, *args, **kwargs):
+        """Run a recognizer call on the pool and wait for its result (see submit)."""
+        return self.submit(method, *args, **kwargs).result()
+
+    def submit_recognition(self, buffer, top_k=1, per_identity=False, timings=False, recognizer=None):
+        """
+        Queue recognition of an encoded image, answering repeats from the result cache.
+
+        Cache hits resolve at once and take no queue slot.
+
+        Args:
+            buffer: Encoded image bytes
+            top_k: Number of ranked gallery matches per face
+            per_identity: Rank distinct people instead of gallery images
+            timings: Add a per-stage 'timings' dict to the result
+            recognizer: Tenant recognizer to use (None = the pool's own)
+
+        Returns:
+            Future resolving to the result dict
+
+        Raises:
+            PoolSaturated: If the image is not cached and the queue is full
+        """
+        recognizer = recognizer or self.recognizer
+        options = {'top_k': top_k, 'per_identity': per_identity, 'timings': timings}
+        call = [('recognize_faces_in_buffer', (buffer,), options)]
+        if self.workers == 0:
+            # The recognizer consults its own cache when it runs the job
+            return self.submit_many(call, recognizer)[0]
+
+        started = time.perf_counter()
+        with metrics.collect() as observations:
+            key, result = recognizer.cached_result(buffer, top_k, per_identity)
+        if result is not None:
+            if timings:
+                result['timings'] = metrics.stage_timings(observations)
+                result['timings']['total'] = round((time.perf_counter() - started) * 1000, 3)
+            future = Future()
+            future.set_result(result)
+            return future
+
+        future = self.submit_many(call, recognizer)[0]
+        future.add_done_callback(lambda done: self._cache_job_result(recognizer, key, done))
+        return future
+
+    def recognize(self, buffer, top_k=1, per_identity=False, timings=False, recognizer=None):
+        """Recognize an encoded image and wait for the result (see submit_recognition)."""
+        return self.submit_recognition(buffer, top_k, per_identity, timings, recognizer).result()
+
+    def recognize_batch(self, images, recognizer=None):
+        """
+        Recognize many images, spreading them over the workers in chunks.
+
+        Args:
+            images: List of encoded image buffers or image paths
+            recognizer: Tenant recognizer to use (None = the pool's own)
+
+        Returns:
+            List of result dicts in the same order as images
+
+        Raises:
+            PoolSaturated: If the chunks do not fit in the queue
+        """
+        if not images:
+            return []
+
+        chunk_size = -(-len(images) // max(1, self.workers))
+        chunks = [images[i:i + chunk_size] for i in range(0, len(images), chunk_size)]
+        # Each worker process handles its chunk on a single thread
+        options = {'max_workers': 1} if self.workers else {}
+        futures = self.submit_many([('recognize_batch', (chunk,), options) for chunk in chunks], recognizer)
+        return [result for future in futures for result in future.result()]
+
+    def stats(self):
+        """Queue and throughput counters for health checks."""
+        return {
+            'workers': self.workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'rejected': self.rejected,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+    def shutdown(self, wait=True):
+        """Stop the worker processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _start(self, method, args, kwargs, recognizer):
+        """Hand one admitted call to a worker (or run it inline without workers)."""
+        if self.workers == 0:
+            future = Future()
+            try:
+                result = getattr(recognizer, method)(*args, **kwargs)
+            except Exception as e:
+                self._release(failed=True)
+                future.set_exception(e)
+            else:
+                self._release()
+                future.set_result(result)
+            return future
+
+        # Workers send their stage timings back only when this process records them
+        tenant = None if recognizer is self.recognizer else recognizer.tenant
+        job = (tenant, recognizer.model_id, method, args, kwargs,
+               time.time() if metrics.enabled() else None)
+        try:
+            job_future = self._get_executor().submit(_run_job, *job)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool once
+            print("✗ Recognition worker died, restarting the pool")
+            self._reset_executor()
+            job_future = self._get_executor().submit(_run_job, *job)
+
+        future = Future()
+        job_future.add_done_callback(lambda done: self._finish_job(done, future))
+        return future
+
+    def _finish_job(self, job_future, future):
+        """
+        Unpack a worker's (result, observations) into the caller's future.
+
+        The job's admission slot is released first, so a caller woken by
+        the result can submit its next job without being turned away.
+        """
+        if job_future.cancelled():
+            self._release(failed=True)
+            future.cancel()
+            return
+        error = job_future.exception()
+        if error is not None:
+            with self._lock:
+                if isinstance(error, BrokenProcessPool):
+                    self._executor = None
+            self._release(failed=True)
+            future.set_exception(error)
+            return
+
+        result, observations = job_future.result()
+        metrics.REGISTRY.replay(observations)
+        self._release()
+        future.set_result(result)
+
+    @staticmethod
+    def _cache_job_result(recognizer, key, future):
+        """Cache the result of a finished recognition job."""
+        if not future.cancelled() and future.exception() is None:
+            recognizer.cache_result(key, future.result())
+
+    def _release(self, failed=False):
+        """Release a job's admission slot and count its outcome."""
+        with self._lock:
+            self.pending -= 1
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def _get_executor(self):
+        """Return the process pool, starting its workers on first use."""
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers start clean instead of inheriting the
+                # parent's threads and OpenCV state through fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(_recognizer_options(self.recognizer), self.recognizer.model_dir),
+                )
+            return self._executor
+
+    def _reset_executor(self):
+        """Drop a broken process pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for training, recognition, video and HTTP throughput.
+
+Builds a synthetic gallery in a scratch directory, times the main code
+paths and writes the results as JSON so runs can be compared across
+commits:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --output new.json --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from app.face_recognizer import FaceRecognizer  # noqa: E402
+from app.tracker import FaceTracker  # noqa: E402
+from app.video_pipeline import VideoPipeline  # noqa: E402
+from benchmarks import synthetic  # noqa: E402
+
+# Files FaceRecognizer writes into the working directory
+MODEL_FILES = ('face_model',)
+CROP_CACHE_FILES = ('face_crops.bin', 'face_crops_index.pkl')
+CATALOG_FILES = ('gallery.db', 'gallery.db-wal', 'gallery.db-shm')
+
+
+def timed(func, *args, **kwargs):
+    """Call func quietly and return (seconds, result)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        return time.perf_counter() - start, result
+
+
+def percentile(samples, q):
+    """Return the q-th percentile of a list of numbers."""
+    return float(np.percentile(np.asarray(samples), q)) if samples else 0.0
+
+
+def latency_summary(samples):
+    """Summarize latency samples in milliseconds."""
+    ms = [s * 1000 for s in samples]
+    return {
+        'count': len(ms),
+        'mean_ms': float(np.mean(ms)) if ms else 0.0,
+        'p50_ms': percentile(ms, 50),
+        'p99_ms': percentile(ms, 99),
+    }
+
+
+def remove_files(paths):
+    """Delete the given files and directories if they exist."""
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def bench_training(args):
+    """Time load_known_faces cold, from the model cache, from the crop cache and after changes."""
+    results = {}
+
+    # Cold means no model, crop cache or catalog (with its stable labels) yet
+    remove_files(MODEL_FILES + CROP_CACHE_FILES + CATALOG_FILES)
+    results['cold_s'], _ = timed(FaceRecognizer(workers=args.workers).load_known_faces)
+
+    results['cached_model_s'], _ = timed(FaceRecognizer().load_known_faces)
+
+    remove_files(MODEL_FILES)
+    results['cached_crops_retrain_s'], _ = timed(FaceRecognizer().load_known_faces)
+
+    # One changed gallery image, then a retrain that only re-detects it
+    changed = os.path.join('known_faces', sorted(os.listdir('known_faces'))[0])
+    changed = os.path.join(changed, sorted(os.listdir(changed))[0])
+    os.utime(changed, None)
+    remove_files(MODEL_FILES)
+    results['one_changed_retrain_s'], _ = timed(FaceRecognizer().load_known_faces)
+
+    # Incremental enrollment of one new image into the cached model
+    recognizer = FaceRecognizer()
+    timed(recognizer.load_known_faces)
+    new_image = os.path.join(tempfile.gettempdir(), f'bench_enroll_{os.getpid()}.jpg')
+    cv2.imwrite(new_image, synthetic.compose_scene(320, 320, [10 ** 6], face_size=180))
+    results['incremental_add_s'], result = timed(
+        recognizer.add_face_to_known, new_image, 'bench_enrolled'
+    )
+    results['incremental_add_ok'] = result['success']
+    os.remove(new_image)
+    shutil.rmtree(os.path.join('known_faces', 'bench_enrolled'), ignore_errors=True)
+    remove_files(MODEL_FILES)
+    timed(FaceRecognizer().load_known_faces)
+
+    return results
+
+
+def bench_recognition(recognizer, args):
+    """Time recognize_faces_in_buffer per megapixel and per face count."""
+    results = {'by_megapixels': [], 'by_face_count': []}
+
+    for width, height in [(640, 480), (1280, 720), (1920, 1080), (3840, 2160)]:
+        image = synthetic.compose_scene(width, height, [0])
+        samples = [timed(recognizer.recognize_faces_in_buffer, image)[0]
+                   for _ in range(args.repeat)]
+        megapixels = width * height / 1e6
+        summary = latency_summary(samples)
+        summary.update({
+            'width': width,
+            'height': height,
+            'megapixels': megapixels,
+            'ms_per_megapixel': summary['p50_ms'] / megapixels,
+        })
+        results['by_megapixels'].append(summary)
+
+    for faces in [1, 2, 4, 8]:
+        image = synthetic.compose_scene(1280, 960, faces)
+        samples = []
+        found = 0
+        for _ in range(args.repeat):
+            elapsed, result = timed(recognizer.recognize_faces_in_buffer, image)
+            samples.append(elapsed)
+            found = len(result['faces'])
+        summary = latency_summary(samples)
+        summary.update({'faces': faces, 'faces_found': found})
+        results['by_face_count'].append(summary)
+
+    return results
+
+
+def bench_video(recognizer, args):
+    """Measure output and detection frame rates of the video pipeline on a local file."""
+    video_path = os.path.abspath('bench_video.avi')
+    synthetic.write_video(video_path, frames=args.video_frames)
+
+    results = {}
+    for label, track_faces in [('untracked', False), ('tracked', True)]:
+        pipeline = VideoPipeline(
+            recognizer, video_path, realtime=False, max_latency=None,
+            tracker=FaceTracker(recognizer) if track_faces else None
+        )
+        elapsed, frames = timed(lambda: sum(1 for _ in pipeline.frames()))
+        results[label] = {
+            'frames_out': frames,
+            'output_fps': frames / elapsed if elapsed else 0.0,
+            'detection_fps': pipeline.stats['detected'] / elapsed if elapsed else 0.0,
+            'detect_ms': pipeline.stats['detect_ms'],
+            'captured': pipeline.stats['captured'],
+        }
+
+    # Realtime-paced run through the public generator, as /video_feed uses it
+    elapsed, frames = timed(
+        lambda: sum(1 for _ in recognizer.recognize_faces_in_video(video_path))
+    )
+    results['realtime'] = {'frames_out': frames, 'output_fps': frames / elapsed if elapsed else 0.0}
+
+    os.remove(video_path)
+    return results
+
+
+def bench_http(args):
+    """Measure /recognize_image throughput and latency through the Flask test client."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app.routes import app, model_loader
+        model_loader.wait()
+
+    ok, buffer = cv2.imencode('.jpg', synthetic.compose_scene(640, 480, [0]))
+    payload = buffer.tobytes()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_client = max(1, args.requests // args.concurrency)
+
+    def client():
+        test_client = app.test_client()
+        for _ in range(per_client):
+            start = time.perf_counter()
+            response = test_client.post(
+                '/recognize_image',
+                data={'file': (io.BytesIO(payload), 'frame.jpg')},
+                content_type='multipart/form-data'
+            )
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    results = latency_summary(latencies)
+    results.update({
+        'concurrency': args.concurrency,
+        'requests_per_s': len(latencies) / wall if wall else 0.0,
+        'errors': len(errors),
+    })
+    return results
+
+
+def git_commit():
+    """Return the current git commit hash, if available."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def flatten(results, prefix=''):
+    """Flatten nested results into {'a.b.c': number} for comparison."""
+    flat = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            flat.update(flatten(value, f'{prefix}{key}.'))
+    elif isinstance(results, list):
+        for i, value in enumerate(results):
+            flat.update(flatten(value, f'{prefix}{i}.'))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        flat[prefix[:-1]] = results
+    return flat
+
+
+def compare(current, baseline_path, threshold):
+    """Print metrics that regressed by more than threshold against a previous run."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    old = flatten(baseline['results'])
+    new = flatten(current['results'])
+    regressions = []
+
+    for key, new_value in sorted(new.items()):
+        old_value = old.get(key)
+        if not old_value:
+            continue
+        # Times and latencies regress upwards, rates regress downwards
+        higher_is_better = key.endswith(('_fps', 'requests_per_s'))
+        lower_is_better = key.endswith(('_s', '_ms', 'ms_per_megapixel'))
+        if not (higher_is_better or lower_is_better):
+            continue
+        ratio = new_value / old_value
+        worse = ratio < 1 - threshold if higher_is_better else ratio > 1 + threshold
+        if worse:
+            regressions.append((key, old_value, new_value, ratio))
+
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta'].get('commit')}):")
+    if not regressions:
+        print(f"  ✓ No regressions beyond {threshold:.0%}")
+    for key, old_value, new_value, ratio in regressions:
+        print(f"  ✗ {key}: {old_value:.4g} -> {new_value:.4g} ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Face recognition performance benchmarks')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON results file')
+    parser.add_argument('--compare', help='Previous results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative change counted as a regression (default 0.2)')
+    parser.add_argument('--gallery', help='Existing known_faces directory to use instead of a synthetic one')
+    parser.add_argument('--people', type=int, default=20, help='Synthetic gallery people')
+    parser.add_argument('--images-per-person', type=int, default=5, help='Synthetic images per person')
+    parser.add_argument('--workers', type=int, default=1, help='Ingestion workers for the cold load')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions per recognition case')
+    parser.add_argument('--video-frames', type=int, default=150, help='Frames in the synthetic video')
+    parser.add_argument('--requests', type=int, default=100, help='HTTP requests to send')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent HTTP clients')
+    parser.add_argument('--only', nargs='+', choices=['training', 'recognition', 'video', 'http'],
+                        help='Run only these benchmarks')
+    args = parser.parse_args()
+
+    selected = set(args.only or ['training', 'recognition', 'video', 'http'])
+    output_path = os.path.abspath(args.output)
+    gallery = os.path.abspath(args.gallery) if args.gallery else None
+    original_cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='face_bench_')
+
+    try:
+        # FaceRecognizer keeps its gallery and model files relative to the cwd
+        os.chdir(workdir)
+        if gallery:
+            shutil.copytree(gallery, 'known_faces')
+        else:
+            print(f"Building synthetic gallery ({args.people} x {args.images_per_person})...")
+            synthetic.build_gallery('known_faces', args.people, args.images_per_person)
+
+        results = {}
+        if 'training' in selected:
+            print("Benchmarking training...")
+            results['training'] = bench_training(args)
+
+        recognizer = FaceRecognizer()
+        timed(recognizer.load_known_faces)
+
+        if 'recognition' in selected:
+            print("Benchmarking recognition...")
+            results['recognition'] = bench_recognition(recognizer, args)
+        if 'video' in selected:
+            print("Benchmarking video...")
+            results['video'] = bench_video(recognizer, args)
+        if 'http' in selected:
+            print("Benchmarking HTTP...")
+            results['http'] = bench_http(args)
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results written to {output_path}")
+
+    if args.compare:
+        regressions = compare(report, args.compare, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
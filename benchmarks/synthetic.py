@@ -0,0 +1,139 @@
+"""
+Synthetic fixtures for the benchmarks.
+
+Draws simple cartoon faces that the Haar frontal-face cascade detects
+reliably, so the benchmarks can build galleries, probe images and video
+files without shipping real photos.
+"""
+import os
+import cv2
+import numpy as np
+
+
+def draw_face(seed, size=200):
+    """
+    Draw a grayscale cartoon face whose features vary with the seed.
+
+    Args:
+        seed: Identity seed; the same seed gives a similar face
+        size: Width and height of the face image in pixels
+
+    Returns:
+        size x size uint8 image
+    """
+    rng = np.random.default_rng(seed)
+    image = np.full((size, size), 60, np.uint8)
+    cx, cy = size // 2, size // 2
+    skin = int(rng.integers(150, 210))
+
+    cv2.ellipse(image, (cx, cy), (int(size * 0.33), int(size * 0.43)), 0, 0, 360, skin, -1)
+
+    eye_y = cy - int(size * 0.1)
+    eye_x = int(size * 0.14) + int(rng.integers(-4, 4))
+    brow = int(size * 0.09)
+    for side in (-1, 1):
+        cv2.ellipse(image, (cx + side * eye_x, eye_y),
+                    (int(size * 0.07), int(size * 0.035)), 0, 0, 360, 40, -1)
+        cv2.line(image, (cx + side * eye_x - brow, eye_y - brow),
+                 (cx + side * eye_x + brow, eye_y - brow + int(rng.integers(-3, 3))), 50, 5)
+
+    cv2.line(image, (cx, eye_y + 10), (cx - 6, cy + int(size * 0.1)), skin - 50, 3)
+    cv2.ellipse(image, (cx, cy + int(size * 0.2)),
+                (int(size * 0.1), int(size * 0.03)), 0, 0, 360, 80, -1)
+
+    image = cv2.GaussianBlur(image, (7, 7), 0)
+    return image
+
+
+def add_noise(image, seed, amount=10):
+    """Return a copy of an image with uniform noise added."""
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(-amount, amount, image.shape)
+    return np.clip(image.astype(int) + noise, 0, 255).astype(np.uint8)
+
+
+def compose_scene(width, height, faces, seed=0, face_size=None):
+    """
+    Place cartoon faces on a plain background in a BGR image.
+
+    Args:
+        width: Image width
+        height: Image height
+        faces: Number of faces, or list of identity seeds
+        seed: Seed for the background noise
+        face_size: Face size in pixels (default fits the faces in a row)
+
+    Returns:
+        BGR image
+    """
+    seeds = list(range(faces)) if isinstance(faces, int) else list(faces)
+    scene = np.full((height, width), 100, np.uint8)
+
+    if seeds:
+        columns = int(np.ceil(np.sqrt(len(seeds))))
+        rows = int(np.ceil(len(seeds) / columns))
+        cell_w, cell_h = width // columns, height // rows
+        size = face_size or int(min(cell_w, cell_h) * 0.7)
+
+        for i, face_seed in enumerate(seeds):
+            row, col = divmod(i, columns)
+            x = col * cell_w + (cell_w - size) // 2
+            y = row * cell_h + (cell_h - size) // 2
+            scene[y:y + size, x:x + size] = draw_face(face_seed, size)
+
+    return cv2.cvtColor(add_noise(scene, seed), cv2.COLOR_GRAY2BGR)
+
+
+def build_gallery(root, people, images_per_person):
+    """
+    Write a known_faces-style gallery of synthetic people.
+
+    Args:
+        root: Gallery directory (one subdirectory per person)
+        people: Number of people
+        images_per_person: Images written for each person
+
+    Returns:
+        Number of images written
+    """
+    count = 0
+    for person in range(people):
+        person_dir = os.path.join(root, f'person_{person:05d}')
+        os.makedirs(person_dir, exist_ok=True)
+        for k in range(images_per_person):
+            scene = compose_scene(320, 320, [person], seed=person * 1000 + k, face_size=180)
+            cv2.imwrite(os.path.join(person_dir, f'img_{k}.jpg'), scene)
+            count += 1
+    return count
+
+
+def write_video(path, frames=150, width=640, height=480, fps=25, face_seed=0):
+    """
+    Write a video file of one face moving across the frame.
+
+    Args:
+        path: Output path (.avi, MJPG)
+        frames: Number of frames
+        width: Frame width
+        height: Frame height
+        fps: Frame rate stored in the file
+        face_seed: Identity seed of the face
+
+    Returns:
+        Path of the written video
+    """
+    size = min(width, height) // 2
+    face = draw_face(face_seed, size)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+
+    try:
+        for i in range(frames):
+            scene = np.full((height, width), 100, np.uint8)
+            x = int((width - size) * (0.5 + 0.4 * np.sin(i / 20.0)))
+            y = (height - size) // 2
+            scene[y:y + size, x:x + size] = face
+            writer.write(cv2.cvtColor(add_noise(scene, i), cv2.COLOR_GRAY2BGR))
+    finally:
+        writer.release()
+
+    return path
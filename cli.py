@@ -4,8 +4,19 @@ CLI utility for face recognition operations.
 Provides command-line interface for common tasks.
 """
 import argparse
+import glob
+import json
 import os
+import sys
+import time
+from app import metrics
+from app.batch_scan import scan
+from app.compaction import DEFAULT_PROTOTYPES, DUPLICATE_SIMILARITY, MAX_ACCURACY_DROP
 from app.face_recognizer import FaceRecognizer
+from app.gallery import GALLERY_INDEXES
+from app.gallery_catalog import ENROLLED, IMAGE_EXTENSIONS
+from app.model_store import convert_legacy_model
+from app.tenants import DEFAULT_TENANT, is_valid_tenant, list_tenants
 
 
 def main():
@@ -16,51 +27,275 @@ def main():
 
     # Recognize command
     recognize_parser = subparsers.add_parser('recognize', help='Recognize faces in image')
-    recognize_parser.add_argument('image', help='Path to image file')
+    recognize_parser.add_argument('image', help='Path to image file, directory of images, or glob pattern')
     recognize_parser.add_argument('--tolerance', type=float, default=0.6, help='Face comparison tolerance')
     recognize_parser.add_argument('--model', default='hog', choices=['hog', 'cnn'], help='Detection model')
+    add_detection_arguments(recognize_parser)
+    add_index_arguments(recognize_parser)
+    add_tenant_arguments(recognize_parser)
+    add_profile_argument(recognize_parser)
 
     # Add face command
     add_parser = subparsers.add_parser('add', help='Add face to known faces')
     add_parser.add_argument('image', help='Path to image file')
     add_parser.add_argument('name', help='Person name')
     add_parser.add_argument('--model', default='hog', choices=['hog', 'cnn'], help='Detection model')
+    add_detection_arguments(add_parser)
+    add_index_arguments(add_parser)
+    add_tenant_arguments(add_parser)
+    add_profile_argument(add_parser)
 
     # List command
     list_parser = subparsers.add_parser('list', help='List known faces')
+    list_parser.add_argument('--limit', type=int, default=None, help='Most people listed')
+    list_parser.add_argument('--after', default=None, help='List people whose names sort after this one')
+    add_tenant_arguments(list_parser)
+
+    # Tenants command
+    tenants_parser = subparsers.add_parser('tenants', help='List tenant galleries')
+    tenants_parser.add_argument('--tenants-dir', default='tenants', help='Directory holding the tenant galleries')
 
     # Encode command
     encode_parser = subparsers.add_parser('encode', help='Encode all known faces')
     encode_parser.add_argument('--tolerance', type=float, default=0.6, help='Face comparison tolerance')
     encode_parser.add_argument('--model', default='hog', choices=['hog', 'cnn'], help='Detection model')
+    encode_parser.add_argument('--workers', type=int, default=1,
+                               help='Worker processes for decoding and detection (0 = one per CPU core)')
+    encode_parser.add_argument('--compact', action='store_true',
+                               help='Keep only a few prototype histograms per person (smaller, faster gallery)')
+    encode_parser.add_argument('--prototypes', type=int, default=DEFAULT_PROTOTYPES,
+                               help='Most histograms kept per person with --compact')
+    encode_parser.add_argument('--duplicate-similarity', type=float, default=DUPLICATE_SIMILARITY,
+                               help='Similarity above which enrollments count as duplicates with --compact')
+    encode_parser.add_argument('--holdout', type=float, default=0.2,
+                               help='Fraction of each person\'s images held out to measure the accuracy change')
+    encode_parser.add_argument('--max-accuracy-drop', type=float, default=MAX_ACCURACY_DROP,
+                               help='Refuse to compact if held-out accuracy drops by more than this fraction')
+    add_detection_arguments(encode_parser)
+    add_index_arguments(encode_parser)
+    add_tenant_arguments(encode_parser)
+    add_profile_argument(encode_parser)
+
+    # Convert command
+    convert_parser = subparsers.add_parser('convert', help='Convert a YAML/pickle model to the binary format')
+    convert_parser.add_argument('--model-file', default='face_model.yml', help='LBPH YAML model to convert')
+    convert_parser.add_argument('--encodings-file', default='face_encodings.pkl',
+                                help='Pickle with the label to name map')
+    convert_parser.add_argument('--output', default='face_model', help='Binary model directory to write')
+    add_index_arguments(convert_parser)
+
+    # Scan command
+    scan_parser = subparsers.add_parser('scan', help='Recognize faces in image trees and video files')
+    scan_parser.add_argument('inputs', nargs='+',
+                             help='Image or video files, directories (walked recursively) or glob patterns')
+    scan_parser.add_argument('--output', '-o', default='-', help='Results file (.jsonl or .csv; - for stdout)')
+    scan_parser.add_argument('--format', choices=['jsonl', 'csv'], default=None,
+                             help='Output format (default: from the output file extension, else jsonl)')
+    scan_parser.add_argument('--sample-fps', type=float, default=1.0,
+                             help='Video frames recognized per second of video (0 = every frame)')
+    scan_parser.add_argument('--workers', type=int, default=0,
+                             help='Worker processes for recognition (0 = one per CPU core)')
+    scan_parser.add_argument('--checkpoint', default=None,
+                             help='Progress file (default: OUTPUT.checkpoint when writing to a file)')
+    scan_parser.add_argument('--resume', action='store_true', help='Continue an interrupted scan from its checkpoint')
+    scan_parser.add_argument('--tolerance', type=float, default=0.6, help='Face comparison tolerance')
+    add_detection_arguments(scan_parser)
+    add_index_arguments(scan_parser)
+    add_tenant_arguments(scan_parser)
+    add_profile_argument(scan_parser)
+
+    # Streams command
+    streams_parser = subparsers.add_parser('streams', help='Recognize faces on several cameras or video files at once')
+    streams_parser.add_argument('streams', nargs='+', metavar='STREAM',
+                                help="Source as [id=]source[;priority=P][;fps=F], e.g. 'door=0;priority=2'")
+    streams_parser.add_argument('--workers', type=int, default=2, help='Detection threads shared by all streams')
+    streams_parser.add_argument('--duration', type=float, default=None,
+                                help='Seconds to run (default: until every stream ends or Ctrl+C)')
+    streams_parser.add_argument('--loop', action='store_true', help='Replay video files when they end')
+    streams_parser.add_argument('--events', default=None, help='Write every result event to this JSONL file')
+    streams_parser.add_argument('--report-interval', type=float, default=5.0,
+                                help='Seconds between per-stream statistics reports')
+    add_detection_arguments(streams_parser)
+    add_index_arguments(streams_parser)
 
     args = parser.parse_args()
 
+    profile = getattr(args, 'profile', False)
+    if profile:
+        metrics.enable()
+    started = time.perf_counter()
+
     if args.command == 'recognize':
         recognize_image(args)
     elif args.command == 'add':
         add_face(args)
     elif args.command == 'list':
-        list_known_faces()
+        list_known_faces(args)
+    elif args.command == 'tenants':
+        list_tenant_galleries(args)
     elif args.command == 'encode':
         encode_known_faces(args)
+    elif args.command == 'convert':
+        convert_model(args)
+    elif args.command == 'scan':
+        scan_inputs(args)
+    elif args.command == 'streams':
+        run_streams(args)
     else:
         parser.print_help()
 
+    if profile:
+        print_profile(time.perf_counter() - started)
+
+
+def add_detection_arguments(parser):
+    """Add the face detection tuning options to a subcommand parser."""
+    group = parser.add_argument_group('detection')
+    group.add_argument('--scale-factor', type=float, default=1.1,
+                       help='Cascade scale factor (larger = faster, may miss faces)')
+    group.add_argument('--min-neighbors', type=int, default=5,
+                       help='Cascade min neighbors (larger = fewer false positives)')
+    group.add_argument('--min-size', type=int, nargs=2, default=(30, 30), metavar=('W', 'H'),
+                       help='Smallest face to detect, in full-resolution pixels')
+    group.add_argument('--detection-width', type=int, default=None,
+                       help='Downscale images wider than this before detection')
+    group.add_argument('--roi-detection', action='store_true',
+                       help='On video, search only around previous faces between full scans')
+    group.add_argument('--roi-margin', type=float, default=0.5,
+                       help='Fraction of face size added around each ROI')
+    group.add_argument('--full-scan-interval', type=int, default=10,
+                       help='Detection passes between full-frame scans in ROI mode')
+
+
+def detection_options(args):
+    """Return FaceRecognizer keyword arguments for the detection options."""
+    return {
+        'scale_factor': args.scale_factor,
+        'min_neighbors': args.min_neighbors,
+        'min_size': tuple(args.min_size),
+        'detection_width': args.detection_width,
+        'roi_detection': args.roi_detection,
+        'roi_margin': args.roi_margin,
+        'full_scan_interval': args.full_scan_interval,
+    }
+
+
+def add_index_arguments(parser):
+    """Add the gallery index options to a subcommand parser."""
+    group = parser.add_argument_group('index')
+    group.add_argument('--index', default='brute', choices=sorted(GALLERY_INDEXES),
+                       help='Gallery index: exact brute force or approximate IVF for large galleries')
+    group.add_argument('--nprobe', type=int, default=8,
+                       help='IVF clusters searched per face (higher = better recall, slower)')
+    group.add_argument('--nlist', type=int, default=None,
+                       help='IVF clusters (default: square root of the gallery size)')
+
+
+def tenant_name(value):
+    """argparse type for tenant names."""
+    if not is_valid_tenant(value):
+        raise argparse.ArgumentTypeError(f"invalid tenant name: {value}")
+    return value
+
+
+def add_tenant_arguments(parser):
+    """Add the tenant selection options to a subcommand parser."""
+    group = parser.add_argument_group('tenant')
+    group.add_argument('--tenant', type=tenant_name, default=DEFAULT_TENANT,
+                       help='Gallery to use (default: the deployment\'s own known_faces)')
+    group.add_argument('--tenants-dir', default='tenants', help='Directory holding the tenant galleries')
+
+
+def tenant_options(args):
+    """Return FaceRecognizer keyword arguments for the tenant options."""
+    tenant = None if args.tenant == DEFAULT_TENANT else args.tenant
+    return {'tenant': tenant, 'tenants_dir': args.tenants_dir}
+
+
+def add_profile_argument(parser):
+    """Add the --profile option to a subcommand parser."""
+    parser.add_argument('--profile', action='store_true',
+                        help='Print the time spent in each processing stage when done')
+
+
+def print_profile(elapsed):
+    """Print the per-stage timing breakdown recorded while --profile was on."""
+    stages = sorted(
+        ((labels[0], count, total) for labels, (count, total) in metrics.STAGE_SECONDS.summary().items()),
+        key=lambda row: row[2], reverse=True
+    )
+    stage_total = sum(total for _, _, total in stages) or 1.0
+
+    print("\nProfile")
+    print("-" * 62)
+    print(f"{'Stage':<16}{'Calls':>8}{'Total ms':>12}{'Mean ms':>12}{'Share':>10}")
+    for stage, count, total in stages:
+        print(f"{stage:<16}{count:>8}{total * 1000:>12.1f}{total * 1000 / count:>12.2f}"
+              f"{total / stage_total:>10.1%}")
+    print("-" * 62)
+
+    faces = metrics.FACES_PER_IMAGE.summary().get(())
+    if faces:
+        print(f"Images: {faces[0]}, faces: {int(faces[1])}")
+    load_time = metrics.MODEL_LOAD_SECONDS.value()
+    if load_time is not None:
+        print(f"Model load: {load_time * 1000:.1f} ms")
+    print(f"Wall time: {elapsed * 1000:.1f} ms")
+
+
+def index_options(args):
+    """Return FaceRecognizer keyword arguments for the gallery index options."""
+    options = {}
+    if args.index == 'ivf':
+        options = {'nprobe': args.nprobe, 'nlist': args.nlist}
+    return {'index': args.index, 'index_options': options}
+
 
 def recognize_image(args):
-    """Recognize faces in an image."""
-    if not os.path.exists(args.image):
-        print(f"Error: Image file not found: {args.image}")
+    """Recognize faces in an image, or in every image of a directory or glob."""
+    image_paths = collect_image_paths(args.image)
+
+    if not image_paths:
+        print(f"Error: No image files found: {args.image}")
         return
 
     print(f"Loading recognizer (tolerance={args.tolerance}, model={args.model})...")
-    recognizer = FaceRecognizer(tolerance=args.tolerance, model=args.model)
+    recognizer = FaceRecognizer(
+        tolerance=args.tolerance, model=args.model, **detection_options(args), **index_options(args),
+        **tenant_options(args)
+    )
     recognizer.load_known_faces()
 
-    print(f"Recognizing faces in: {args.image}")
-    result = recognizer.recognize_faces_in_image(args.image)
+    if len(image_paths) == 1:
+        print(f"Recognizing faces in: {image_paths[0]}")
+        print_faces(recognizer.recognize_faces_in_image(image_paths[0]))
+        return
 
+    print(f"Recognizing faces in {len(image_paths)} image(s)...")
+    results = recognizer.recognize_batch(image_paths)
+
+    for image_path, result in zip(image_paths, results):
+        print(f"\n{image_path}")
+        print_faces(result)
+
+
+def collect_image_paths(pattern):
+    """Expand an image path, directory or glob pattern into sorted image paths."""
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    elif os.path.exists(pattern):
+        return [pattern]
+    else:
+        paths = glob.glob(pattern, recursive=True)
+
+    return sorted(
+        path for path in paths
+        if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def print_faces(result):
+    """Print the faces found in one recognition result."""
     if result['error']:
         print(f"Error: {result['error']}")
         return
@@ -86,7 +321,9 @@ def add_face(args):
     print(f"Adding face for: {args.name}")
     print(f"Image: {args.image}")
 
-    recognizer = FaceRecognizer(model=args.model)
+    recognizer = FaceRecognizer(
+        model=args.model, **detection_options(args), **index_options(args), **tenant_options(args)
+    )
     result = recognizer.add_face_to_known(args.image, args.name)
 
     if result['success']:
@@ -95,43 +332,220 @@ def add_face(args):
         print(f"✗ {result['message']}")
 
 
-def list_known_faces():
-    """List all known faces."""
-    known_faces_dir = 'known_faces'
+def list_known_faces(args):
+    """List known faces from the gallery catalog."""
+    recognizer = FaceRecognizer(**tenant_options(args))
+    catalog = recognizer.catalog
 
-    if not os.path.exists(known_faces_dir):
-        print("No known faces directory found.")
-        return
+    if catalog.is_empty():
+        # First use: record the gallery, keeping the labels of a saved model
+        recognizer.load_known_faces()
+    else:
+        changes = catalog.sync()
+        if changes['added'] or changes['removed']:
+            print(f"Found {len(changes['added'])} new and {len(changes['removed'])} removed image(s); "
+                  f"they are enrolled on the next load")
 
-    faces = []
-    for person_name in os.listdir(known_faces_dir):
-        person_path = os.path.join(known_faces_dir, person_name)
-        if os.path.isdir(person_path):
-            image_count = len([f for f in os.listdir(person_path)
-                             if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp'))])
-            faces.append((person_name, image_count))
+    people, next_after = catalog.list_people(args.after, args.limit)
 
-    if not faces:
+    if not people:
         print("No known faces found.")
         return
 
     print("Known Faces:")
     print("-" * 50)
-    for name, count in sorted(faces):
-        print(f"  {name}: {count} image(s)")
+    for person in people:
+        pending = person['images'] - person['enrolled']
+        note = f" ({pending} not enrolled)" if pending else ""
+        print(f"  {person['name']}: {person['images']} image(s){note}")
     print("-" * 50)
-    print(f"Total: {len(faces)} person(s)")
+    print(f"Total: {catalog.count_people()} person(s)")
+    if next_after is not None:
+        print(f"More: --after {next_after}")
+
+
+def list_tenant_galleries(args):
+    """List the tenant galleries with their people and images from each gallery catalog."""
+    tenants = list_tenants(args.tenants_dir)
+
+    if not tenants:
+        print(f"No tenant galleries found in {args.tenants_dir}.")
+        return
+
+    print("Tenants:")
+    print("-" * 50)
+    for tenant in tenants:
+        recognizer = FaceRecognizer(tenant=tenant, tenants_dir=args.tenants_dir)
+        catalog = recognizer.catalog
+        if catalog.is_empty():
+            # Labels are assigned on first load, together with the saved model's
+            print(f"  {tenant}: not catalogued yet (run: list --tenant {tenant})")
+        else:
+            catalog.sync()
+            statuses = catalog.status_counts()
+            images = sum(statuses.values())
+            pending = images - statuses.get(ENROLLED, 0)
+            note = f", {pending} not enrolled" if pending else ""
+            print(f"  {tenant}: {catalog.count_people()} person(s), {images} image(s){note}")
+        recognizer.close()
+    print("-" * 50)
+    print(f"Total: {len(tenants)} tenant(s)")
 
 
 def encode_known_faces(args):
     """Encode all known faces."""
-    print(f"Loading and encoding known faces (model={args.model})...")
-    recognizer = FaceRecognizer(tolerance=args.tolerance, model=args.model)
+    print(f"Loading and encoding known faces (model={args.model}, workers={args.workers})...")
+    recognizer = FaceRecognizer(
+        tolerance=args.tolerance, model=args.model, workers=args.workers,
+        **detection_options(args), **index_options(args), **tenant_options(args)
+    )
     recognizer.load_known_faces()
 
-    print(f"\n✓ Successfully encoded {len(recognizer.known_face_encodings)} face(s)")
+    face_count = len(recognizer.gallery)
+    print(f"\n✓ Successfully encoded {face_count} face(s)")
     print(f"  Known people: {len(set(recognizer.known_face_names))}")
 
+    if args.compact:
+        print(f"\nCompacting to at most {args.prototypes} prototype(s) per person...")
+        result = recognizer.compact_gallery(
+            max_prototypes=args.prototypes, duplicate_similarity=args.duplicate_similarity, holdout=args.holdout,
+            max_accuracy_drop=args.max_accuracy_drop
+        )
+        if not result['success']:
+            print(f"✗ {result['message']}")
+            if result['report'] and 'evaluation' in result['report']:
+                print_compaction_report(result['report']['evaluation'])
+            return
+        print(f"✓ {result['message']}")
+        print_compaction_report(result['report']['evaluation'])
+
+
+def print_compaction_report(evaluation):
+    """Print the held-out accuracy, size and search time of the full and compacted galleries."""
+    if not evaluation['probes']:
+        print(f"  {evaluation['message']}")
+        return
+
+    print(f"\nHeld-out evaluation ({evaluation['probes']} probe image(s))")
+    print("-" * 56)
+    print(f"{'Gallery':<10}{'Rows':>8}{'Memory MB':>12}{'Accuracy':>12}{'Search ms':>12}")
+    for name in ('full', 'compact'):
+        row = evaluation[name]
+        print(f"{name:<10}{row['rows']:>8}{row['bytes'] / 1e6:>12.1f}{row['accuracy']:>12.2%}{row['search_ms']:>12.3f}")
+    print("-" * 56)
+    print(f"Accuracy change: {evaluation['accuracy_change'] * 100:+.2f} points")
+
+
+def convert_model(args):
+    """Convert a legacy LBPH YAML model and label pickle to the binary model format."""
+    for path in (args.model_file, args.encodings_file):
+        if not os.path.exists(path):
+            print(f"Error: File not found: {path}")
+            return
+
+    print(f"Converting {args.model_file} and {args.encodings_file} to {args.output}...")
+    options = index_options(args)
+    gallery, label_to_name, model_id = convert_legacy_model(
+        args.model_file, args.encodings_file, args.output,
+        options['index'], **options['index_options']
+    )
+    print(f"✓ Converted {len(gallery)} face(s) of {len(label_to_name)} person(s) (model {model_id})")
+
+
+def scan_inputs(args):
+    """Recognize faces in every image and sampled video frame under the inputs."""
+    fmt = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+    checkpoint = args.checkpoint
+    if checkpoint is None and args.output != '-':
+        checkpoint = args.output + '.checkpoint'
+
+    # Progress goes to stderr so results can be piped from stdout
+    log = sys.stderr if args.output == '-' else sys.stdout
+    print(f"Loading recognizer (tolerance={args.tolerance})...", file=log)
+    recognizer = FaceRecognizer(
+        tolerance=args.tolerance, **detection_options(args), **index_options(args),
+        **tenant_options(args)
+    )
+    recognizer.load_known_faces()
+
+    done = {'items': 0}
+
+    def report(record):
+        done['items'] += 1
+        if done['items'] % 100 == 0:
+            print(f"  {done['items']} item(s) done, last: {record['source']}", file=log)
+
+    try:
+        result = scan(
+            recognizer, args.inputs, output=args.output, fmt=fmt,
+            workers=args.workers or None, sample_fps=args.sample_fps or None,
+            checkpoint_path=checkpoint, resume=args.resume, on_result=report
+        )
+    except ValueError as e:
+        print(f"Error: {str(e)}", file=log)
+        return
+    except KeyboardInterrupt:
+        print(f"\n✗ Interrupted after {done['items']} item(s); rerun with --resume to continue", file=log)
+        return
+
+    if result['resumed']:
+        print(f"Resumed after {result['resumed']} item(s) from {checkpoint}", file=log)
+    rate = result['items'] / result['seconds'] if result['seconds'] else 0.0
+    print(f"✓ Scanned {result['items']} item(s): {result['faces']} face(s), {result['errors']} error(s) "
+          f"in {result['seconds']:.1f}s ({rate:.1f} items/s)", file=log)
+
+
+def run_streams(args):
+    """Recognize faces on several sources at once, sharing one set of detection threads."""
+    from app.stream_scheduler import StreamScheduler, parse_stream_spec
+
+    try:
+        specs = [parse_stream_spec(spec, default_id=f"stream{i}") for i, spec in enumerate(args.streams, 1)]
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        return
+
+    recognizer = FaceRecognizer(**detection_options(args), **index_options(args))
+    recognizer.load_known_faces()
+
+    scheduler = StreamScheduler(recognizer, workers=args.workers, tracker_options={})
+    events_file = open(args.events, 'w', encoding='utf-8') if args.events else None
+    if events_file is not None:
+        scheduler.add_listener(lambda event: events_file.write(json.dumps(event) + '\n'))
+
+    try:
+        for spec in specs:
+            scheduler.add_stream(loop=args.loop, **spec)
+
+        started = time.monotonic()
+        next_report = started + args.report_interval
+        while any(stats['state'] in ('starting', 'running') for stats in scheduler.stats().values()):
+            if args.duration and time.monotonic() - started >= args.duration:
+                break
+            time.sleep(0.2)
+            if time.monotonic() >= next_report:
+                print_stream_stats(scheduler.stats())
+                next_report += args.report_interval
+    except (KeyboardInterrupt, ValueError) as e:
+        if isinstance(e, ValueError):
+            print(f"Error: {str(e)}")
+    finally:
+        scheduler.stop()
+        if events_file is not None:
+            events_file.close()
+
+    print_stream_stats(scheduler.stats())
+
+
+def print_stream_stats(streams):
+    """Print achieved FPS, lag and worker share for every stream."""
+    print(f"\n{'Stream':<16}{'Priority':>9}{'Target':>8}{'FPS':>7}{'Lag ms':>9}{'Share':>8}"
+          f"{'Processed':>11}{'Skipped':>9}  State")
+    for stream_id, stats in streams.items():
+        target = f"{stats['target_fps']:g}" if stats['target_fps'] else '-'
+        print(f"{stream_id:<16}{stats['priority']:>9g}{target:>8}{stats['fps']:>7.2f}{stats['lag_ms']:>9.1f}"
+              f"{stats['share']:>8.1%}{stats['processed']:>11}{stats['skipped']:>9}  {stats['state']}")
+
 
 if __name__ == '__main__':
     main()
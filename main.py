@@ -12,11 +12,19 @@ from app.routes import app
 
 if __name__ == '__main__':
     import os
+    # Async mode (--asgi or SERVER_MODE=asgi) serves the same routes on an event loop
+    asgi = '--asgi' in sys.argv[1:] or os.environ.get('SERVER_MODE', '').lower() == 'asgi'
+
     print("=" * 60)
     print("🔍 Face Recognition System")
     print("=" * 60)
-    print("Starting Flask application...")
+    print("Starting async (ASGI) application..." if asgi else "Starting Flask application...")
     port = int(os.environ.get('PORT', 5000))
     print(f"Open your browser and go to: http://localhost:{port}")
     print("=" * 60)
-    app.run(debug=False, port=port, host='0.0.0.0')
+
+    if asgi:
+        import uvicorn
+        uvicorn.run('app.asgi:app', port=port, host='0.0.0.0')
+    else:
+        app.run(debug=False, port=port, host='0.0.0.0')
@@ -145,6 +145,13 @@ let stream = null;
 let frameCount = 0;
 let processingFrame = false;  // Prevent concurrent requests
 let lastDetectedFaces = [];  // Store last detection results
+let webcamStreamId = null;  // Lets the server track faces across our frames
+let frameSocket = null;  // WebSocket frame channel (async server mode); null = HTTP uploads
+let frameSeq = 0;  // Sequence number of the last frame sent over the socket
+let lastReplySeq = 0;  // Newest frame the server has answered
+let lastFrameSentAt = 0;
+let serverFrameMs = 100;  // Smoothed server processing time per frame
+const captureCanvas = document.createElement('canvas');  // Frames sent for recognition, without overlays
 
 async function startWebcam() {
     const canvas = document.getElementById('webcamCanvas');
@@ -181,9 +188,13 @@ async function startWebcam() {
         newCanvas.height = 480;
         
         webcamRunning = true;
+        webcamStreamId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
         status.textContent = '🎥 Webcam is running... Detecting faces...';
         showMessage('✅ Webcam started - Detecting faces in real-time', 'success');
         
+        // Stream frames over a WebSocket when the server supports it
+        openFrameSocket();
+        
         // Process frames
         processWebcamFrames(video, newCanvas, ctx);
         
@@ -226,14 +237,17 @@ async function processWebcamFrames(video, canvas, ctx) {
     
     frameCount++;
     
-    // Process every 3rd frame for performance, but only if not already processing
-    if (frameCount % 3 === 0 && !processingFrame) {
+    if (frameSocket && frameSocket.readyState === WebSocket.OPEN) {
+        sendFrameOverSocket(video);
+    } else if (frameCount % 3 === 0 && !processingFrame) {
+        // Process every 3rd frame for performance, but only if not already processing
         processingFrame = true;
         
-        canvas.toBlob(async (blob) => {
+        captureFrame(video).toBlob(async (blob) => {
             try {
                 const formData = new FormData();
                 formData.append('file', blob, 'frame.jpg');
+                formData.append('stream_id', webcamStreamId);
                 
                 const response = await fetch('/recognize_image', {
                     method: 'POST',
@@ -258,6 +272,74 @@ async function processWebcamFrames(video, canvas, ctx) {
     requestAnimationFrame(() => processWebcamFrames(video, canvas, ctx));
 }
 
+function captureFrame(video) {
+    // Copy the raw video frame; the visible canvas also has the face overlays
+    captureCanvas.width = 640;
+    captureCanvas.height = 480;
+    captureCanvas.getContext('2d').drawImage(video, 0, 0, captureCanvas.width, captureCanvas.height);
+    return captureCanvas;
+}
+
+function openFrameSocket() {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const socket = new WebSocket(`${protocol}//${window.location.host}/ws/recognize`);
+    
+    frameSeq = 0;
+    lastReplySeq = 0;
+    lastFrameSentAt = 0;
+    
+    socket.onopen = () => {
+        if (!webcamRunning) {
+            socket.close();
+            return;
+        }
+        frameSocket = socket;
+    };
+    
+    socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        
+        // Ignore replies older than the faces already drawn
+        if (data.seq === undefined || data.seq <= lastReplySeq) return;
+        lastReplySeq = data.seq;
+        
+        if (data.processing_ms !== undefined) {
+            serverFrameMs = 0.8 * serverFrameMs + 0.2 * data.processing_ms;
+        }
+        lastDetectedFaces = data.faces || [];
+    };
+    
+    socket.onclose = () => {
+        // The Flask server has no WebSocket endpoint; HTTP uploads take over
+        if (frameSocket === socket) frameSocket = null;
+    };
+}
+
+function sendFrameOverSocket(video) {
+    const now = performance.now();
+    const waiting = frameSeq - lastReplySeq;
+    
+    // Keep at most one frame queued behind the one being recognized and send no
+    // faster than the server processes them (resync if a reply never came)
+    if (now - lastFrameSentAt < 2000) {
+        if (waiting >= 2 || now - lastFrameSentAt < Math.max(serverFrameMs, 33)) return;
+    }
+    if (frameSocket.bufferedAmount > 0) return;  // Previous frame still uploading
+    
+    const socket = frameSocket;
+    const seq = ++frameSeq;
+    lastFrameSentAt = now;
+    
+    captureFrame(video).toBlob((blob) => {
+        if (!blob || socket.readyState !== WebSocket.OPEN) return;
+        
+        // 4-byte big-endian sequence number, then the JPEG
+        const header = new ArrayBuffer(4);
+        new DataView(header).setUint32(0, seq);
+        socket.send(new Blob([header, blob]));
+    }, 'image/jpeg', 0.7);
+}
+
 function stopWebcam() {
     const status = document.getElementById('webcamStatus');
     const canvas = document.getElementById('webcamCanvas');
@@ -266,6 +348,11 @@ function stopWebcam() {
     frameCount = 0;
     lastDetectedFaces = [];  // Clear stored faces
     
+    if (frameSocket) {
+        frameSocket.close();
+        frameSocket = null;
+    }
+    
     if (stream) {
         stream.getTracks().forEach(track => track.stop());
         stream = null;
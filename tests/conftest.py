@@ -0,0 +1,87 @@
+"""
+Shared fixtures for the test suite.
+
+Galleries and probe images are drawn with the benchmarks' synthetic
+cartoon faces, so the tests need no real photos. Recognizers keep their
+model, crop cache and catalog in the working directory, so every fixture
+that builds one first moves into the test's temporary directory.
+"""
+import os
+import threading
+import time
+import cv2
+import pytest
+from app.face_recognizer import FaceRecognizer
+from app.video_pipeline import VideoPipeline
+from benchmarks.synthetic import build_gallery, compose_scene, write_video
+
+
+PEOPLE = 3
+IMAGES_PER_PERSON = 3
+
+
+def encode(image, ext='.jpg'):
+    """Encode an image to bytes, as an upload would arrive."""
+    ok, buffer = cv2.imencode(ext, image)
+    assert ok
+    return buffer.tobytes()
+
+
+def person_name(person):
+    """Directory name build_gallery gives a synthetic person."""
+    return f'person_{person:05d}'
+
+
+def probe_image(person, seed=8):
+    """A new photo of one synthetic person, not in the gallery (the default seed is recognized for all)."""
+    return compose_scene(320, 320, [person], seed=seed, face_size=180)
+
+
+def video_file(path, frames=30, fps=25, face_seed=0):
+    """Write a small synthetic video of one moving face and return its path."""
+    return write_video(str(path), frames=frames, width=160, height=120, fps=fps, face_seed=face_seed)
+
+
+class StubRecognizer:
+    """
+    Stands in for a FaceRecognizer in video tests.
+
+    Detection finds no faces and takes a fixed time, so tests control how
+    far it falls behind capture; every frame it is given is recorded.
+    """
+
+    def __init__(self, cost=0.0):
+        self.cost = cost
+        self.frames = []
+        self.videos = 0
+        self._lock = threading.Lock()
+
+    def recognize_faces_in_buffer(self, frame, tracker=None, **kwargs):
+        with self._lock:
+            self.frames.append(frame)
+        time.sleep(self.cost)
+        return {'error': None, 'faces': []}
+
+    def recognize_faces_in_video(self, video_source=0, max_frames=None, **options):
+        with self._lock:
+            self.videos += 1
+        pipeline = VideoPipeline(self, video_source=video_source, **options)
+        yield from pipeline.frames(max_frames=max_frames)
+
+
+@pytest.fixture
+def gallery_dir(tmp_path, monkeypatch):
+    """A known_faces gallery of a few synthetic people, with tmp_path as working directory."""
+    monkeypatch.chdir(tmp_path)
+    root = os.path.join(tmp_path, 'known_faces')
+    build_gallery(root, PEOPLE, IMAGES_PER_PERSON)
+    return root
+
+
+@pytest.fixture
+def recognizer(gallery_dir):
+    """A FaceRecognizer trained on gallery_dir."""
+    recognizer = FaceRecognizer(known_faces_dir=gallery_dir, workers=1)
+    recognizer.load_known_faces()
+    yield recognizer
+    recognizer.close()
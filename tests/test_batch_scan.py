@@ -0,0 +1,102 @@
+import json
+import os
+import cv2
+import pytest
+from app.batch_scan import ScanCheckpoint, scan
+from tests.conftest import probe_image
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    """A directory of probe images of the gallery's people."""
+    root = tmp_path / 'inputs'
+    root.mkdir()
+    for i in range(6):
+        cv2.imwrite(str(root / f'probe_{i}.jpg'), probe_image(i % 3, seed=i))
+    return str(root)
+
+
+def interrupt_after(count):
+    seen = []
+
+    def on_result(record):
+        seen.append(record)
+        if len(seen) == count:
+            raise Interrupted()
+    return on_result
+
+
+def read_sources(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line)['source'] for line in f]
+
+
+def test_resume_finishes_an_interrupted_scan(recognizer, inputs, tmp_path):
+    output = str(tmp_path / 'out.jsonl')
+    checkpoint = output + '.checkpoint'
+
+    with pytest.raises(Interrupted):
+        scan(recognizer, [inputs], output=output, workers=0, checkpoint_path=checkpoint,
+             on_result=interrupt_after(2))
+    assert os.path.exists(checkpoint)
+
+    stats = scan(recognizer, [inputs], output=output, workers=0, checkpoint_path=checkpoint, resume=True)
+
+    sources = read_sources(output)
+    assert stats['resumed'] == 2
+    assert stats['items'] == 4
+    assert sorted(sources) == sorted(os.path.join(inputs, f'probe_{i}.jpg') for i in range(6))
+    assert not os.path.exists(checkpoint)
+
+
+def test_resume_rejects_a_changed_walk(recognizer, inputs, tmp_path):
+    output = str(tmp_path / 'out.jsonl')
+    checkpoint = output + '.checkpoint'
+    with pytest.raises(Interrupted):
+        scan(recognizer, [inputs], output=output, workers=0, checkpoint_path=checkpoint,
+             on_result=interrupt_after(3))
+    with open(checkpoint, encoding='utf-8') as f:
+        saved = f.read()
+
+    # A new file sorting first shifts every item index
+    cv2.imwrite(os.path.join(inputs, 'a_new.jpg'), probe_image(0))
+    with pytest.raises(ValueError, match='does not match'):
+        scan(recognizer, [inputs], output=output, workers=0, checkpoint_path=checkpoint, resume=True)
+
+    with open(checkpoint, encoding='utf-8') as f:
+        assert f.read() == saved
+
+
+def test_resume_rejects_a_shorter_walk(recognizer, inputs, tmp_path):
+    output = str(tmp_path / 'out.jsonl')
+    checkpoint = output + '.checkpoint'
+    with pytest.raises(Interrupted):
+        scan(recognizer, [inputs], output=output, workers=0, checkpoint_path=checkpoint,
+             on_result=interrupt_after(4))
+
+    for i in range(2, 6):
+        os.remove(os.path.join(inputs, f'probe_{i}.jpg'))
+    with pytest.raises(ValueError, match='does not match'):
+        scan(recognizer, [inputs], output=output, workers=0, checkpoint_path=checkpoint, resume=True)
+
+
+def test_checkpoint_keeps_finished_items_above_the_watermark(tmp_path):
+    path = str(tmp_path / 'scan.checkpoint')
+    items = [(f'img_{i}.jpg', None, None) for i in range(4)]
+    checkpoint = ScanCheckpoint(path, ['inputs'], 1.0)
+    for index in (0, 2, 3):
+        checkpoint.mark_done(index, items[index])
+    checkpoint.save()
+
+    resumed = ScanCheckpoint(path, ['inputs'], 1.0)
+    assert resumed.load()
+    assert resumed.completed == 1
+    assert [resumed.is_done(i, item) for i, item in enumerate(items)] == [True, False, True, True]
+    resumed.check_walked(len(items))
+
+    with pytest.raises(ValueError):
+        ScanCheckpoint(path, ['other'], 1.0).load()
@@ -0,0 +1,57 @@
+import threading
+import time
+from app.broadcaster import BroadcastHub
+from tests.conftest import StubRecognizer, video_file
+
+
+def consume(feed, parts, stop, delay=0.0):
+    """Read a subscriber's feed until told to stop, then detach."""
+    for part in feed:
+        parts.append(part)
+        if stop.is_set():
+            break
+        time.sleep(delay)
+    feed.close()
+
+
+def test_subscribers_share_one_loop_and_slow_ones_skip_frames(tmp_path):
+    source = video_file(tmp_path / 'camera.avi', frames=200, fps=50)
+    recognizer = StubRecognizer()
+    hub = BroadcastHub(recognizer, max_latency=None)
+    stop = threading.Event()
+    fast, slow = [], []
+    viewers = [
+        threading.Thread(target=consume, args=(hub.subscribe(source), fast, stop)),
+        threading.Thread(target=consume, args=(hub.subscribe(source), slow, stop, 0.2)),
+    ]
+    for viewer in viewers:
+        viewer.start()
+
+    time.sleep(1.0)
+    assert hub.active_sources() == {source: 2}
+    stop.set()
+    for viewer in viewers:
+        viewer.join(5)
+
+    # One capture and detection loop served both viewers
+    assert recognizer.videos == 1
+    # The slow viewer skipped frames without holding the fast one back
+    assert 2 <= len(slow) < len(fast) / 3
+
+    broadcaster = hub._broadcasters[source]
+    broadcaster._thread.join(5)
+    assert not broadcaster._thread.is_alive()
+    assert hub.active_sources() == {}
+
+
+def test_a_new_viewer_after_the_last_one_left_starts_a_new_loop(tmp_path):
+    source = video_file(tmp_path / 'camera.avi', frames=100, fps=50)
+    recognizer = StubRecognizer()
+    hub = BroadcastHub(recognizer, max_latency=None)
+
+    for _ in range(2):
+        feed = hub.subscribe(source)
+        assert next(feed).startswith(b'--frame')
+        feed.close()
+
+    assert recognizer.videos == 2
@@ -0,0 +1,71 @@
+import numpy as np
+from app import face_recognizer
+from app.compaction import evaluate_compaction, k_medoids, select_prototypes
+from app.model_store import load_model
+
+
+def gallery_arrays(recognizer):
+    gallery = recognizer.gallery
+    return gallery.histograms, np.array(gallery.labels)
+
+
+def test_prototypes_are_capped_per_person(recognizer):
+    histograms, labels = gallery_arrays(recognizer)
+
+    keep = select_prototypes(histograms, labels, max_prototypes=2, duplicate_similarity=None)
+
+    counts = np.unique(labels[keep], return_counts=True)[1]
+    assert len(counts) == len(np.unique(labels))
+    assert counts.max() <= 2
+    assert len(set(keep.tolist())) == len(keep)
+
+
+def test_k_medoids_picks_members_from_each_cluster():
+    points = np.array([0.0, 0.1, 0.2, 10.0, 10.1, 10.2])
+    distances = np.abs(points[:, None] - points[None, :])
+
+    medoids = k_medoids(distances, 2)
+
+    assert medoids.tolist() == [1, 4]
+
+
+def test_holdout_accuracy_is_reported(recognizer):
+    histograms, labels = gallery_arrays(recognizer)
+
+    report = evaluate_compaction(histograms, labels, max_prototypes=1, duplicate_similarity=None, holdout=0.34)
+
+    assert report['probes'] == len(np.unique(labels))
+    for name in ('full', 'compact'):
+        assert 0.0 <= report[name]['accuracy'] <= 1.0
+    assert report['compact']['rows'] < report['full']['rows']
+    assert report['accuracy_change'] == round(report['compact']['accuracy'] - report['full']['accuracy'], 4)
+
+
+def test_compacted_gallery_keeps_enrolled_histograms(recognizer):
+    histograms, labels = gallery_arrays(recognizer)
+
+    result = recognizer.compact_gallery(max_prototypes=1, max_accuracy_drop=None)
+
+    assert result['success']
+    assert result['report']['rows_after'] == len(np.unique(labels))
+    compacted = recognizer.gallery.histograms
+    # Every prototype is one of the original rows, not an average
+    for row, label in zip(compacted, recognizer.gallery.labels):
+        assert any(np.allclose(row, original) for original in histograms[labels == label])
+    saved, _, _ = load_model(recognizer.model_dir)
+    assert len(saved) == len(compacted)
+
+
+def test_compaction_losing_accuracy_is_refused(recognizer, monkeypatch):
+    def losing_evaluation(*args, **kwargs):
+        return {'probes': 3, 'accuracy_change': -0.5}
+    monkeypatch.setattr(face_recognizer, 'evaluate_compaction', losing_evaluation)
+    gallery, model_id = recognizer.gallery, recognizer.model_id
+
+    result = recognizer.compact_gallery(max_prototypes=1, max_accuracy_drop=0.02)
+
+    assert not result['success']
+    assert 'refused' in result['message']
+    assert result['report']['evaluation']['accuracy_change'] == -0.5
+    assert recognizer.gallery is gallery
+    assert recognizer.model_id == model_id
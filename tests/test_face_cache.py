@@ -0,0 +1,67 @@
+import numpy as np
+from app.face_cache import FaceCropCache
+
+
+def make_cache(tmp_path):
+    return FaceCropCache(data_file=str(tmp_path / 'crops.bin'), index_file=str(tmp_path / 'index.pkl'),
+                         detector_key='test', roi_size=(8, 8))
+
+
+def make_image(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(name.encode())
+    return str(path)
+
+
+def crop(value):
+    return np.full((8, 8), value, np.uint8)
+
+
+def test_cached_crop_round_trips(tmp_path):
+    cache = make_cache(tmp_path)
+    face = make_image(tmp_path, 'face.jpg')
+    empty = make_image(tmp_path, 'empty.jpg')
+    cache.put(face, crop(7))
+    cache.put(empty, None)
+    cache.save()
+
+    reloaded = make_cache(tmp_path)
+    hit, roi = reloaded.get(face)
+    assert hit and roi[0, 0] == 7
+    assert reloaded.get(empty) == (True, None)
+
+
+def test_caches_sharing_files_do_not_overwrite_each_other(tmp_path):
+    # Two instances stand in for two processes sharing one cache
+    first, second = make_cache(tmp_path), make_cache(tmp_path)
+    first_paths = [make_image(tmp_path, f'a{i}.jpg') for i in range(3)]
+    second_paths = [make_image(tmp_path, f'b{i}.jpg') for i in range(3)]
+    for i, (a, b) in enumerate(zip(first_paths, second_paths)):
+        first.put(a, crop(i))
+        second.put(b, crop(100 + i))
+    first.save()
+    second.save()
+
+    reloaded = make_cache(tmp_path)
+    for i, (a, b) in enumerate(zip(first_paths, second_paths)):
+        assert reloaded.get(a)[1][0, 0] == i
+        assert reloaded.get(b)[1][0, 0] == 100 + i
+
+
+def test_compaction_by_another_instance_is_noticed(tmp_path):
+    writer = make_cache(tmp_path)
+    paths = [make_image(tmp_path, f'{i}.jpg') for i in range(100)]
+    for i, path in enumerate(paths):
+        writer.put(path, crop(i))
+    writer.save()
+
+    reader = make_cache(tmp_path)
+    reader.load()
+    writer.prune(paths[90:])
+    writer.save()
+
+    # The reader's rows point into the old blob; it must reload instead of returning wrong crops
+    assert reader.get(paths[95]) == (False, None)
+    hit, roi = reader.get(paths[95])
+    assert hit and roi[0, 0] == 95
+    assert reader.get(paths[5]) == (False, None)
@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+import pytest
+from app.gallery import IVFGallery, create_gallery
+from benchmarks.synthetic import add_noise, draw_face
+
+PEOPLE = 12
+IMAGES_PER_PERSON = 4
+
+
+def face_crops(person, count, first_seed=0):
+    """Noisy 100x100 crops of one synthetic person."""
+    face = draw_face(person, size=100)
+    return [add_noise(face, seed=first_seed + i) for i in range(count)]
+
+
+@pytest.fixture(scope='module')
+def lbph_model():
+    crops, labels = [], []
+    for person in range(PEOPLE):
+        crops += face_crops(person, IMAGES_PER_PERSON)
+        labels += [person] * IMAGES_PER_PERSON
+    model = cv2.face.LBPHFaceRecognizer_create()
+    model.train(crops, np.array(labels, dtype=np.int32))
+    return model
+
+
+@pytest.fixture(scope='module')
+def probes():
+    return [crop for person in range(PEOPLE) for crop in face_crops(person, 2, first_seed=100)]
+
+
+def test_extracted_histograms_match_the_model(lbph_model):
+    gallery = create_gallery('brute', recognizer=lbph_model)
+
+    histograms = gallery.extract(face_crops(0, IMAGES_PER_PERSON))
+
+    np.testing.assert_allclose(histograms, np.vstack(lbph_model.getHistograms()[:IMAGES_PER_PERSON]), rtol=1e-6)
+
+
+def test_brute_search_matches_lbph_predict(lbph_model, probes):
+    gallery = create_gallery('brute', recognizer=lbph_model)
+
+    matches = gallery.search(gallery.extract(probes), k=1)
+
+    for probe, best in zip(probes, matches):
+        label, distance = lbph_model.predict(probe)
+        assert best[0][0] == label
+        assert best[0][1] == pytest.approx(distance, rel=1e-4)
+
+
+def test_top_k_is_sorted_and_per_identity_is_distinct(lbph_model, probes):
+    gallery = create_gallery('brute', recognizer=lbph_model)
+    probe = gallery.extract(probes[:1])
+
+    matches = gallery.search(probe, k=6)[0]
+    identities = gallery.search(probe, k=6, per_identity=True)[0]
+
+    assert len(matches) == 6
+    assert [distance for _, distance in matches] == sorted(distance for _, distance in matches)
+    assert len({label for label, _ in identities}) == 6
+    assert identities[0] == matches[0]
+
+
+def test_ivf_searching_every_list_matches_brute_force(lbph_model, probes):
+    brute = create_gallery('brute', recognizer=lbph_model)
+    ivf = create_gallery('ivf', recognizer=lbph_model, nlist=4, nprobe=4, train_size=8)
+    histograms = brute.extract(probes)
+
+    assert ivf._centroids is not None
+    assert ivf.search(histograms, k=5) == brute.search(histograms, k=5)
+
+
+def test_ivf_follows_adds_and_removals(lbph_model, probes):
+    ivf = IVFGallery(nlist=4, nprobe=4, train_size=8)
+    brute = create_gallery('brute')
+    histograms = np.vstack(lbph_model.getHistograms())
+    labels = lbph_model.getLabels().ravel()
+    for gallery in (ivf, brute):
+        gallery.add(histograms[:24], labels[:24])
+        gallery.add(histograms[24:], labels[24:])
+        gallery.remove_label(3)
+
+    probe_histograms = brute.extract(probes)
+    assert 3 not in ivf.labels
+    assert ivf.search(probe_histograms, k=3) == brute.search(probe_histograms, k=3)
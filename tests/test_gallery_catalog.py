@@ -0,0 +1,110 @@
+import os
+import pytest
+from app.gallery_catalog import ENROLLED, PENDING, GalleryCatalog
+
+
+@pytest.fixture
+def faces_dir(tmp_path):
+    root = tmp_path / 'known_faces'
+    for name in ('alice', 'bob'):
+        for i in range(2):
+            write_image(root, name, f'{i}.jpg')
+    return root
+
+
+@pytest.fixture
+def catalog(tmp_path, faces_dir):
+    catalog = GalleryCatalog(str(tmp_path / 'gallery.db'), str(faces_dir))
+    yield catalog
+    catalog.close()
+
+
+def write_image(root, name, filename, content=None):
+    person_dir = root / name
+    person_dir.mkdir(parents=True, exist_ok=True)
+    (person_dir / filename).write_bytes(content or f'{name}/{filename}'.encode())
+    touch(person_dir)
+    touch(root)
+
+
+def touch(path):
+    # Changes within one clock tick can leave a directory's mtime unchanged
+    mtime = os.stat(path).st_mtime_ns + 1_000_000_000
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_sync_records_the_gallery(catalog, faces_dir):
+    changes = catalog.sync()
+
+    assert changes['people_added'] == ['alice', 'bob']
+    assert len(changes['added']) == 4
+    assert sorted(catalog.label_to_name().values()) == ['alice', 'bob']
+    assert catalog.status_counts() == {PENDING: 4}
+    assert catalog.person('alice')['images'] == 2
+
+
+def test_unchanged_gallery_syncs_to_no_changes(catalog):
+    catalog.sync()
+
+    changes = catalog.sync()
+
+    assert not changes['added'] and not changes['removed'] and not changes['labels']
+
+
+def test_sync_notices_added_and_removed_images(catalog, faces_dir):
+    catalog.sync()
+    catalog.mark_trained()
+    label = catalog.label_for('alice')
+
+    write_image(faces_dir, 'alice', '2.jpg')
+    os.remove(faces_dir / 'alice' / '0.jpg')
+    touch(faces_dir / 'alice')
+    changes = catalog.sync()
+
+    assert changes['added'] == [str(faces_dir / 'alice' / '2.jpg')]
+    assert changes['removed'] == [str(faces_dir / 'alice' / '0.jpg')]
+    assert changes['labels'] == {label}
+    assert catalog.changed_labels() == {label}
+    assert catalog.person('alice')['images'] == 2
+
+
+def test_labels_survive_deletion_and_are_never_reused(catalog, faces_dir):
+    catalog.sync()
+    labels = {name: catalog.label_for(name) for name in ('alice', 'bob')}
+
+    assert catalog.remove_person('alice') == labels['alice']
+    carol = catalog.add_person('carol')
+
+    assert carol not in labels.values()
+    assert catalog.label_to_name() == {labels['bob']: 'bob', carol: 'carol'}
+    # A returning person gets their old label back
+    assert catalog.add_person('alice') == labels['alice']
+
+
+def test_labels_are_stable_across_reopening(tmp_path, catalog):
+    catalog.sync()
+    labels = catalog.label_to_name()
+    catalog.close()
+
+    reopened = GalleryCatalog(catalog.path, catalog.known_faces_dir)
+    reopened.sync()
+    assert reopened.label_to_name() == labels
+    reopened.close()
+
+
+def test_seeded_labels_keep_a_saved_model_valid(catalog):
+    catalog.seed_labels({3: 'bob', 7: 'alice'})
+    catalog.sync()
+
+    assert catalog.label_to_name() == {3: 'bob', 7: 'alice'}
+
+
+def test_set_status_updates_enrollment_counts(catalog, faces_dir):
+    catalog.sync()
+    label = catalog.label_for('bob')
+    paths = [str(faces_dir / 'bob' / f'{i}.jpg') for i in range(2)]
+
+    catalog.set_status([(path, label, ENROLLED) for path in paths])
+
+    assert catalog.person('bob')['enrolled'] == 2
+    assert catalog.status_counts() == {PENDING: 2, ENROLLED: 2}
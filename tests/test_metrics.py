@@ -0,0 +1,46 @@
+from app import metrics
+
+
+def test_counter_increments_are_rendered(monkeypatch):
+    monkeypatch.setattr(metrics, '_enabled', True)
+    registry = metrics.MetricsRegistry()
+    frames = registry.counter('frames_total', 'Frames by outcome', ('outcome',))
+
+    frames.inc(1, 'shown')
+    frames.inc(2, 'shown')
+    frames.inc(1, 'dropped')
+
+    assert registry.render().splitlines() == [
+        '# HELP frames_total Frames by outcome',
+        '# TYPE frames_total counter',
+        'frames_total{outcome="dropped"} 1',
+        'frames_total{outcome="shown"} 3',
+    ]
+
+
+def test_histogram_buckets_are_cumulative(monkeypatch):
+    monkeypatch.setattr(metrics, '_enabled', True)
+    registry = metrics.MetricsRegistry()
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        'latency_seconds_sum 5.55',
+        'latency_seconds_count 3',
+    ]
+
+
+def test_nothing_is_recorded_while_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, '_enabled', False)
+    registry = metrics.MetricsRegistry()
+    frames = registry.counter('frames_total', 'Frames')
+
+    frames.inc()
+
+    assert registry.render() == '\n'
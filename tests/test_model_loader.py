@@ -0,0 +1,58 @@
+import threading
+from app.model_loader import ModelLoader
+
+
+class FakeRecognizer:
+    """A recognizer whose model load waits until the test releases it."""
+
+    def __init__(self, release=None, error=None):
+        self.release = release
+        self.error = error
+        self.load_progress = {'loaded': 0}
+
+    def load_known_faces(self):
+        if self.release is not None:
+            self.release.wait(10)
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        self.load_progress['loaded'] = 3
+
+
+def test_wait_returns_none_until_the_model_is_loaded():
+    release = threading.Event()
+    recognizer = FakeRecognizer(release)
+    loader = ModelLoader(lambda: recognizer)
+
+    assert loader.status()['state'] == 'idle'
+    loader.start()
+
+    assert loader.wait(0) is None
+    assert loader.wait(0.05) is None
+    assert not loader.ready
+    assert loader.status()['state'] == 'loading'
+
+    release.set()
+    assert loader.wait(10) is recognizer
+    assert loader.ready
+    assert loader.status()['state'] == 'ready'
+    assert loader.status()['progress'] == {'loaded': 3}
+
+
+def test_on_ready_runs_before_the_recognizer_is_published():
+    seen = []
+    loader = ModelLoader(FakeRecognizer, on_ready=lambda recognizer: seen.append(loader.recognizer))
+
+    loader.start()
+
+    assert loader.wait(10) is not None
+    assert seen == [None]
+
+
+def test_a_failed_load_is_reported():
+    loader = ModelLoader(lambda: FakeRecognizer(error='gallery missing'))
+
+    loader.start()
+
+    assert loader.wait(10) is None
+    assert loader.status()['state'] == 'failed'
+    assert loader.status()['error'] == 'gallery missing'
@@ -0,0 +1,126 @@
+import os
+import numpy as np
+import pytest
+from app import face_recognizer
+from app.face_recognizer import FaceRecognizer
+from app.gallery import create_gallery
+from app.model_store import (DELTA_FILE, append_delta, current_model_id, load_model, read_delta, save_model,
+                             split_model_id)
+from tests.conftest import encode, person_name, probe_image
+
+
+def random_histograms(rows, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    histograms = rng.random((rows, dim), dtype=np.float32)
+    return histograms / histograms.sum(axis=1, keepdims=True)
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    gallery = create_gallery('brute')
+    gallery.add(random_histograms(4, gallery.dim), [0, 0, 1, 1])
+    path = str(tmp_path / 'model')
+    save_model(path, gallery, {0: 'alice', 1: 'bob'})
+    return path
+
+
+def test_delta_is_applied_on_load(model_dir):
+    snapshot_id = current_model_id(model_dir)
+    gallery, _, model_id = load_model(model_dir)
+    added = random_histograms(2, gallery.dim, seed=1)
+
+    model_id, others = append_delta(model_dir, model_id, {
+        'op': 'add', 'labels': [2, 2], 'names': {2: 'carol'}, 'histograms': added,
+    })
+    model_id, _ = append_delta(model_dir, model_id, {'op': 'remove', 'label': 0})
+
+    assert others == []
+    assert current_model_id(model_dir) == snapshot_id
+    loaded, label_to_name, loaded_id = load_model(model_dir)
+    assert loaded_id == model_id
+    assert label_to_name == {1: 'bob', 2: 'carol'}
+    assert sorted(loaded.labels.tolist()) == [1, 1, 2, 2]
+    np.testing.assert_allclose(loaded.histograms[loaded.labels == 2], added, rtol=1e-6)
+
+
+def test_appends_return_records_of_other_writers(model_dir):
+    _, _, model_id = load_model(model_dir)
+    first, _ = append_delta(model_dir, model_id, {'op': 'remove', 'label': 0})
+
+    # A second writer still holding the original model id
+    _, others = append_delta(model_dir, model_id, {'op': 'remove', 'label': 1})
+
+    assert [record['label'] for record in others] == [0]
+    records, _ = read_delta(model_dir, first)
+    assert [record['label'] for record in records] == [1]
+
+
+def test_torn_record_is_ignored_and_cut_off(model_dir):
+    _, _, model_id = load_model(model_dir)
+    model_id, _ = append_delta(model_dir, model_id, {'op': 'remove', 'label': 0})
+    delta_file = os.path.join(model_dir, current_model_id(model_dir), DELTA_FILE)
+    with open(delta_file, 'ab') as f:
+        f.write(b'FDL1\x10')
+
+    _, label_to_name, loaded_id = load_model(model_dir)
+    assert loaded_id == model_id
+    assert label_to_name == {1: 'bob'}
+
+    model_id, _ = append_delta(model_dir, model_id, {'op': 'remove', 'label': 1})
+    assert os.path.getsize(delta_file) == split_model_id(model_id)[1]
+
+
+def test_add_and_delete_append_to_the_delta(recognizer, tmp_path):
+    snapshot_id = current_model_id(recognizer.model_dir)
+    path = str(tmp_path / 'new.jpg')
+    with open(path, 'wb') as f:
+        f.write(encode(probe_image(0, seed=5)))
+
+    assert recognizer.add_face_to_known(path, 'newcomer')['success']
+    assert recognizer.delete_face_from_known(person_name(2))['success']
+
+    assert current_model_id(recognizer.model_dir) == snapshot_id
+    assert split_model_id(recognizer.model_id)[1] > 0
+
+    # A worker following the model applies only the new records
+    worker = FaceRecognizer(known_faces_dir=recognizer.known_faces_dir)
+    worker.reload_saved_model()
+    assert worker.model_id == recognizer.model_id
+    assert sorted(worker.label_to_name.values()) == sorted(recognizer.label_to_name.values())
+    assert person_name(2) not in worker.label_to_name.values()
+    worker.close()
+
+
+def test_large_delta_is_compacted_in_the_background(recognizer, tmp_path, monkeypatch):
+    monkeypatch.setattr(face_recognizer, 'DELTA_COMPACT_MIN_BYTES', 1)
+    monkeypatch.setattr(face_recognizer, 'DELTA_COMPACT_RATIO', 0.0)
+    snapshot_id = current_model_id(recognizer.model_dir)
+
+    assert recognizer.delete_face_from_known(person_name(2))['success']
+    recognizer._compact_thread.join()
+
+    assert current_model_id(recognizer.model_dir) != snapshot_id
+    assert recognizer.model_id == current_model_id(recognizer.model_dir)
+    _, label_to_name, _ = load_model(recognizer.model_dir)
+    assert label_to_name == recognizer.label_to_name
+
+
+def test_change_after_another_process_compacted_keeps_both(recognizer, tmp_path):
+    # A second instance stands in for another server process on the same gallery
+    other = FaceRecognizer(known_faces_dir=recognizer.known_faces_dir)
+    other.load_known_faces()
+    assert recognizer.delete_face_from_known(person_name(2))['success']
+    recognizer._compact_model()
+    assert current_model_id(recognizer.model_dir) == recognizer.model_id
+
+    path = str(tmp_path / 'new.jpg')
+    with open(path, 'wb') as f:
+        f.write(encode(probe_image(0, seed=5)))
+    assert other.add_face_to_known(path, 'newcomer')['success']
+
+    _, label_to_name, model_id = load_model(recognizer.model_dir)
+    assert model_id == other.model_id
+    assert person_name(2) not in label_to_name.values()
+    assert 'newcomer' in label_to_name.values()
+    assert label_to_name == other.label_to_name
+    other.close()
@@ -0,0 +1,91 @@
+import numpy as np
+from app.face_recognizer import FaceRecognizer
+from app.result_cache import ResultCache, difference_hash, frame_thumbnail
+from tests.conftest import encode, person_name, probe_image
+
+
+def test_frame_thumbnail_accepts_bytes_and_arrays():
+    data = encode(probe_image(0))
+
+    thumbnail = frame_thumbnail(data)
+    assert thumbnail.shape == (64, 64)
+    np.testing.assert_array_equal(thumbnail, frame_thumbnail(np.frombuffer(data, dtype=np.uint8)))
+    assert frame_thumbnail(b'') is None
+    assert frame_thumbnail(b'not an image') is None
+
+
+def test_re_encoded_frame_is_answered_from_the_cache(gallery_dir):
+    recognizer = FaceRecognizer(known_faces_dir=gallery_dir, workers=1, result_cache_size=16)
+    recognizer.load_known_faces()
+    image = probe_image(1)
+
+    first = recognizer.recognize_faces_in_buffer(encode(image, '.png'))
+    second = recognizer.recognize_faces_in_buffer(encode(image, '.jpg'))
+
+    assert second == first
+    assert recognizer.result_cache.hits == 1
+    recognizer.close()
+
+
+def test_frames_sharing_a_hash_but_not_a_thumbnail_miss():
+    first = frame_thumbnail(encode(probe_image(0, seed=7)))
+    second = frame_thumbnail(encode(probe_image(1, seed=7)))
+    cache = ResultCache(16)
+    cache.put(difference_hash(first), {'error': None, 'faces': []}, first)
+
+    # Looked up under the same hash, as a collision would be
+    assert cache.get(difference_hash(first), second) is None
+    assert cache.get(difference_hash(first), first) == {'error': None, 'faces': []}
+    assert cache.stats()['rejections'] == 1
+
+
+def test_different_faces_at_the_same_spot_get_their_own_results(gallery_dir):
+    recognizer = FaceRecognizer(known_faces_dir=gallery_dir, workers=1, result_cache_size=16)
+    recognizer.load_known_faces()
+    # Same background, same position and size: only the person differs
+    first = encode(probe_image(0, seed=7))
+    second = encode(probe_image(1, seed=7))
+
+    # The frames share a hash; the stored thumbnail tells them apart
+    assert recognizer.cached_result(first)[0][0] == recognizer.cached_result(second)[0][0]
+
+    first_result = recognizer.recognize_faces_in_buffer(first)
+    second_result = recognizer.recognize_faces_in_buffer(second)
+    assert first_result['faces'][0]['name'] == person_name(0)
+    assert second_result['faces'][0]['name'] == person_name(1)
+    recognizer.close()
+
+
+def test_repeated_image_is_answered_from_the_cache(gallery_dir):
+    recognizer = FaceRecognizer(known_faces_dir=gallery_dir, workers=1, result_cache_size=16)
+    recognizer.load_known_faces()
+    data = encode(probe_image(2))
+
+    first = recognizer.recognize_faces_in_buffer(data)
+    second = recognizer.recognize_faces_in_buffer(data)
+
+    assert second == first
+    assert recognizer.result_cache.hits == 1
+    recognizer.close()
+
+
+def test_model_change_makes_old_entries_unreachable(recognizer):
+    recognizer.result_cache = ResultCache(16)
+    data = encode(probe_image(0))
+    key, _ = recognizer.cached_result(data)
+
+    recognizer._set_model(recognizer.gallery, dict(recognizer.label_to_name))
+    new_key, cached = recognizer.cached_result(data)
+
+    assert new_key[0] != key[0]
+    assert cached is None
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    for key in 'abc':
+        cache.put(key, {'error': None, 'faces': []})
+
+    assert cache.get('a') is None
+    assert cache.get('c') == {'error': None, 'faces': []}
+    assert cache.evictions == 1
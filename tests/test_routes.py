@@ -0,0 +1,233 @@
+import io
+import os
+import struct
+import threading
+import time
+import zipfile
+import pytest
+from app.model_loader import ModelLoader
+from tests.conftest import IMAGES_PER_PERSON, PEOPLE, encode, person_name, probe_image
+from benchmarks.synthetic import build_gallery
+
+
+@pytest.fixture(scope='module')
+def routes(tmp_path_factory):
+    """The Flask app, loaded against a synthetic gallery in a temporary working directory."""
+    root = tmp_path_factory.mktemp('server')
+    build_gallery(str(root / 'known_faces'), PEOPLE, IMAGES_PER_PERSON)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(root)
+        # Recognize on the request thread; spawning worker processes is slow
+        patch.setenv('RECOGNITION_WORKERS', '0')
+        from app import routes
+        assert routes.model_loader.wait(120) is not None
+        yield routes
+
+
+@pytest.fixture
+def client(routes):
+    return routes.app.test_client()
+
+
+def upload(name, image, filename='face.jpg'):
+    return {'name': name, 'file': (io.BytesIO(encode(image)), filename)}
+
+
+def test_recognize_image(client):
+    response = client.post('/recognize_image', data={'file': (io.BytesIO(encode(probe_image(1))), 'probe.jpg')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert [face['name'] for face in response.get_json()['faces']] == [person_name(1)]
+
+
+def test_uploads_with_the_same_name_get_separate_paths(routes):
+    with routes.upload_path('face.jpg') as first, routes.upload_path('face.jpg') as second:
+        assert first != second
+        assert os.path.basename(first) == os.path.basename(second) == 'face.jpg'
+        assert os.path.dirname(os.path.dirname(first)) == routes.app.config['UPLOAD_FOLDER']
+
+    assert not os.path.exists(os.path.dirname(first))
+    assert not os.path.exists(os.path.dirname(second))
+
+
+def test_add_face_keeps_the_uploaded_file_name(routes, client):
+    response = client.post('/add_face', data=upload('newcomer', probe_image(0, seed=11)),
+                           content_type='multipart/form-data')
+
+    assert response.get_json()['success']
+    person_dir = os.path.join(routes.get_recognizer().known_faces_dir, 'newcomer')
+    assert os.listdir(person_dir) == ['face.jpg']
+
+
+def test_full_recognition_queue_answers_503(routes, client, monkeypatch):
+    monkeypatch.setattr(routes.recognition_pool, 'max_pending', 0)
+
+    response = client.post('/recognize_image', data={'file': (io.BytesIO(encode(probe_image(1))), 'probe.jpg')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(routes.BUSY_RETRY_AFTER)
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('fps', ['abc', '0', '-2', 'nan'])
+def test_stream_feed_rejects_a_bad_fps(client, fps):
+    response = client.get(f'/streams/front/video_feed?fps={fps}')
+
+    assert response.status_code == 400
+    assert 'fps' in response.get_json()['error']
+
+
+def test_asgi_stream_feed_rejects_a_bad_fps(routes):
+    from starlette.testclient import TestClient
+    from app.asgi import app
+
+    response = TestClient(app).get('/streams/front/video_feed?fps=abc')
+
+    assert response.status_code == 400
+    assert 'fps' in response.json()['error']
+
+
+def zip_of(images):
+    """A zip archive holding the given {filename: image} entries."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as bundle:
+        for filename, image in images.items():
+            bundle.writestr(filename, encode(image))
+    archive.seek(0)
+    return archive
+
+
+def test_recognize_batch_answers_per_image(client):
+    files = [
+        (io.BytesIO(encode(probe_image(0))), 'first.jpg'),
+        (io.BytesIO(b'not an image'), 'broken.jpg'),
+        (zip_of({'inner/second.jpg': probe_image(2), 'notes.txt': probe_image(1)}), 'bundle.zip'),
+    ]
+
+    response = client.post('/recognize_batch', data={'files': files}, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    results = {result['filename']: result for result in response.get_json()['results']}
+    assert list(results) == ['first.jpg', 'broken.jpg', 'inner/second.jpg']
+    assert [face['name'] for face in results['first.jpg']['faces']] == [person_name(0)]
+    assert [face['name'] for face in results['inner/second.jpg']['faces']] == [person_name(2)]
+    # An undecodable image gets an empty result of its own instead of failing the batch
+    assert results['broken.jpg']['faces'] == []
+
+
+def test_recognize_batch_rejects_a_disallowed_file_type(client):
+    response = client.post('/recognize_batch', data={'files': [(io.BytesIO(b'text'), 'notes.txt')]},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    assert 'notes.txt' in response.get_json()['error']
+
+
+def test_recognize_batch_caps_the_number_of_images(routes, client, monkeypatch):
+    monkeypatch.setattr(routes, 'MAX_BATCH_IMAGES', 2)
+    files = [(io.BytesIO(encode(probe_image(person))), f'{person}.jpg') for person in range(PEOPLE)]
+
+    response = client.post('/recognize_batch', data={'files': files}, content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert 'max 2' in response.get_json()['error']
+
+    archive = zip_of({f'{person}.jpg': probe_image(person) for person in range(PEOPLE)})
+    response = client.post('/recognize_batch', data={'file': (archive, 'bundle.zip')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert 'max 2' in response.get_json()['error']
+
+
+def test_health_answers_while_the_model_loads(routes, client, monkeypatch):
+    recognizer = routes.model_loader.recognizer
+    release = threading.Event()
+    loader = ModelLoader(lambda: recognizer, on_ready=lambda recognizer: release.wait(10))
+    monkeypatch.setattr(routes, 'model_loader', loader)
+    loader.start()
+
+    response = client.get('/health')
+    assert response.status_code == 200
+    assert response.get_json()['ready'] is False
+    assert response.get_json()['model']['state'] == 'loading'
+    assert client.get('/ready').status_code == 503
+
+    release.set()
+    assert loader.wait(10) is not None
+    assert client.get('/ready').status_code == 200
+    assert client.get('/health').get_json()['ready'] is True
+
+
+def frame_message(seq, image):
+    return struct.pack('>I', seq) + encode(image)
+
+
+def test_websocket_replies_carry_the_frame_seq(routes):
+    from starlette.testclient import TestClient
+    from app.asgi import app
+
+    with TestClient(app).websocket_connect('/ws/recognize') as websocket:
+        websocket.send_bytes(frame_message(7, probe_image(1)))
+        reply = websocket.receive_json()
+
+    assert reply['seq'] == 7
+    assert reply['dropped'] == 0
+    assert [face['name'] for face in reply['faces']] == [person_name(1)]
+
+
+def test_websocket_drops_stale_frames(routes, monkeypatch):
+    from starlette.testclient import TestClient
+    from app.asgi import app
+
+    recognizer = routes.model_loader.recognizer
+    recognize = recognizer.recognize_faces_in_buffer
+
+    def slow_recognize(buffer, **kwargs):
+        time.sleep(0.2)
+        return recognize(buffer, **kwargs)
+
+    monkeypatch.setattr(recognizer, 'recognize_faces_in_buffer', slow_recognize)
+    frames = 6
+
+    with TestClient(app).websocket_connect('/ws/recognize') as websocket:
+        for seq in range(1, frames + 1):
+            websocket.send_bytes(frame_message(seq, probe_image(0)))
+        replies = [websocket.receive_json()]
+        while replies[-1]['seq'] != frames:
+            replies.append(websocket.receive_json())
+
+    seqs = [reply['seq'] for reply in replies]
+    assert seqs == sorted(seqs)
+    assert len(seqs) < frames
+    assert replies[-1]['dropped'] == frames - len(seqs)
+
+
+def metric_samples(text):
+    """{sample name with labels: value} from a Prometheus text exposition."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_metrics_count_recognition_requests(client):
+    requests = 'face_recognition_http_request_seconds_count{endpoint="/recognize_image",status="200"}'
+    detections = 'face_recognition_stage_seconds_count{stage="detect"}'
+    before = metric_samples(client.get('/metrics').get_data(as_text=True))
+
+    client.post('/recognize_image', data={'file': (io.BytesIO(encode(probe_image(2, seed=21))), 'probe.jpg')},
+                content_type='multipart/form-data')
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE face_recognition_http_request_seconds histogram' in text
+    assert '# TYPE face_recognition_model_ready gauge' in text
+    after = metric_samples(text)
+    assert after[requests] == before.get(requests, 0) + 1
+    assert after[detections] == before.get(detections, 0) + 1
+    assert after['face_recognition_model_ready'] == 1
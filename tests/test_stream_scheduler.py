@@ -0,0 +1,106 @@
+import threading
+import time
+import pytest
+from app.stream_scheduler import StreamScheduler, parse_stream_spec
+from tests.conftest import StubRecognizer, video_file
+
+
+@pytest.fixture
+def videos(tmp_path):
+    """Two local video files standing in for two cameras."""
+    return [video_file(tmp_path / f'camera_{i}.avi', face_seed=i) for i in range(2)]
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(cost=0.01, workers=1):
+        scheduler = StreamScheduler(StubRecognizer(cost), workers=workers)
+        schedulers.append(scheduler)
+        return scheduler
+    yield make
+    for scheduler in schedulers:
+        scheduler.stop()
+
+
+def run_for(scheduler, seconds):
+    time.sleep(seconds)
+    scheduler.stop()
+
+
+def test_workers_share_time_by_priority(make_scheduler, videos):
+    scheduler = make_scheduler()
+    high = scheduler.add_stream('high', videos[0], priority=3, realtime=False, loop=True)
+    low = scheduler.add_stream('low', videos[1], priority=1, realtime=False, loop=True)
+
+    run_for(scheduler, 1.0)
+
+    ratio = high.stats['processed'] / max(1, low.stats['processed'])
+    assert 2.0 <= ratio <= 4.5
+    assert high.stats['busy_seconds'] > 2 * low.stats['busy_seconds']
+
+
+def test_target_fps_caps_a_stream(make_scheduler, videos):
+    scheduler = make_scheduler()
+    capped = scheduler.add_stream('capped', videos[0], target_fps=10, realtime=False, loop=True)
+    free = scheduler.add_stream('free', videos[1], realtime=False, loop=True)
+
+    run_for(scheduler, 1.0)
+
+    assert 5 <= capped.stats['processed'] <= 12
+    # The capped stream's unused share goes to the other one
+    assert free.stats['processed'] > 3 * capped.stats['processed']
+
+
+def test_frames_replaced_before_detection_are_counted_as_skipped(make_scheduler, videos):
+    scheduler = make_scheduler(cost=0.02)
+    stream = scheduler.add_stream('camera', videos[0], realtime=False, loop=True)
+
+    run_for(scheduler, 0.5)
+
+    stats = stream.stats
+    assert stats['skipped'] > 0
+    # Every captured frame was either detected, skipped or is the last one waiting
+    assert stats['captured'] - stats['skipped'] - stats['processed'] in (0, 1)
+
+
+def test_removing_a_stream_ends_its_feed(make_scheduler, videos):
+    scheduler = make_scheduler()
+    scheduler.add_stream('camera', videos[0], realtime=False, loop=True)
+    feed = scheduler.frames('camera')
+    assert next(feed).startswith(b'--frame')
+
+    drained = threading.Thread(target=lambda: list(feed))
+    drained.start()
+    assert scheduler.remove_stream('camera')
+    drained.join(5)
+
+    assert not drained.is_alive()
+    assert 'camera' not in scheduler
+
+
+def test_events_replay_after_a_seq_and_filter_by_stream(make_scheduler, videos):
+    scheduler = make_scheduler()
+    published = []
+    scheduler.add_listener(published.append)
+    scheduler.add_stream('a', videos[0])
+    scheduler.add_stream('b', videos[1])
+    deadline = time.monotonic() + 5
+    while len(published) < 6 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scheduler.stop()
+
+    seqs = [event['seq'] for event in published]
+    assert len(seqs) >= 6
+    replayed = [event['seq'] for event in scheduler.events(after=seqs[2])]
+    assert replayed == seqs[3:]
+    assert {event['stream_id'] for event in scheduler.events(stream_id='b', after=0)} == {'b'}
+
+
+def test_stream_spec_parsing():
+    spec = parse_stream_spec('door=rtsp://cam1/live;priority=2;fps=5')
+
+    assert spec == {'stream_id': 'door', 'source': 'rtsp://cam1/live', 'priority': 2.0, 'target_fps': 5.0}
+    with pytest.raises(ValueError):
+        parse_stream_spec('0;speed=2')
@@ -0,0 +1,119 @@
+import threading
+import time
+import pytest
+from app.tenants import TenantRegistry
+
+MB = 1024 * 1024
+
+
+class FakeTenantRecognizer:
+    """A tenant's recognizer with a fixed model size and a slow load."""
+
+    def __init__(self, tenant, size=MB, load_seconds=0.0):
+        self.tenant = tenant
+        self.size = size
+        self.load_seconds = load_seconds
+        self.loads = 0
+        self.closed = False
+
+    def load_known_faces(self):
+        time.sleep(self.load_seconds)
+        self.loads += 1
+
+    def memory_bytes(self):
+        return self.size
+
+    def close(self):
+        self.closed = True
+
+
+def make_registry(max_bytes=3 * MB, **kwargs):
+    created = []
+
+    def factory(tenant):
+        recognizer = FakeTenantRecognizer(tenant, **kwargs)
+        created.append(recognizer)
+        return recognizer
+    return TenantRegistry(factory, max_bytes=max_bytes), created
+
+
+def test_least_recently_used_tenant_is_evicted_first():
+    registry, created = make_registry()
+    for tenant in ('a', 'b', 'c'):
+        registry.get(tenant)
+    registry.get('a')
+
+    registry.get('d')
+
+    assert 'b' not in registry
+    assert all(tenant in registry for tenant in ('a', 'c', 'd'))
+    assert created[1].closed
+    assert registry.stats()['evictions'] == 1
+
+
+def test_memory_budget_is_honoured():
+    registry, _ = make_registry(max_bytes=5 * MB)
+    for i in range(20):
+        registry.get(f'tenant_{i}')
+
+    assert registry.memory_bytes() <= 5 * MB
+    assert len(registry) == 5
+
+
+def test_max_tenants_limits_loaded_tenants():
+    registry, _ = make_registry(max_bytes=100 * MB)
+    registry.max_tenants = 2
+    for tenant in ('a', 'b', 'c'):
+        registry.get(tenant)
+
+    assert len(registry) == 2
+    assert 'a' not in registry
+
+
+def test_pinned_tenant_is_never_evicted():
+    registry, _ = make_registry(max_bytes=2 * MB)
+    default = FakeTenantRecognizer('default')
+    registry.pin('default', default)
+
+    for i in range(5):
+        registry.get(f'tenant_{i}')
+
+    assert 'default' in registry
+    assert not default.closed
+    assert registry.get('default') is default
+    assert registry.stats()['pinned'] == 1
+
+
+def test_racing_first_requests_load_a_tenant_once():
+    registry, created = make_registry(load_seconds=0.2)
+    results = []
+    barrier = threading.Barrier(8)
+
+    def request():
+        barrier.wait()
+        results.append(registry.get('acme'))
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(created) == 1
+    assert created[0].loads == 1
+    assert len(results) == 8 and all(result is created[0] for result in results)
+
+
+def test_failed_load_is_retried_by_the_next_request():
+    attempts = []
+
+    def factory(tenant):
+        attempts.append(tenant)
+        if len(attempts) == 1:
+            raise ValueError('model unreadable')
+        return FakeTenantRecognizer(tenant)
+    registry = TenantRegistry(factory)
+
+    with pytest.raises(ValueError):
+        registry.get('acme')
+    assert registry.get('acme').tenant == 'acme'
+    assert len(attempts) == 2
@@ -0,0 +1,26 @@
+from app.tracker import FaceTracker
+from tests.conftest import person_name, probe_image
+
+
+def test_tracks_keep_their_identity_between_frames(recognizer):
+    tracker = FaceTracker(recognizer, refresh_interval=60.0)
+    frame = probe_image(1)
+
+    first = tracker.update(frame)
+    second = tracker.update(frame)
+
+    assert [face['name'] for face in first] == [person_name(1)]
+    assert [face['track_id'] for face in second] == [face['track_id'] for face in first]
+    assert tracker.stats['predictions'] == 1
+
+
+def test_model_swap_drops_tracks(recognizer):
+    tracker = FaceTracker(recognizer, refresh_interval=60.0)
+    frame = probe_image(1)
+    first = tracker.update(frame)
+
+    recognizer._set_model(recognizer.gallery, dict(recognizer.label_to_name))
+    second = tracker.update(frame)
+
+    assert second[0]['track_id'] != first[0]['track_id']
+    assert tracker.stats['predictions'] == 2
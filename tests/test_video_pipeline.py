@@ -0,0 +1,60 @@
+import time
+import cv2
+import numpy as np
+from app.video_pipeline import VideoPipeline
+from tests.conftest import StubRecognizer, video_file
+
+
+def read_frames(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def test_frames_are_emitted_from_a_video_file(tmp_path):
+    path = video_file(tmp_path / 'video.avi', frames=20, fps=100)
+    pipeline = VideoPipeline(StubRecognizer(), video_source=path, max_latency=None)
+
+    parts = list(pipeline.frames())
+
+    assert parts and all(part.startswith(b'--frame\r\nContent-Type: image/jpeg') for part in parts)
+    assert pipeline.stats['captured'] == 20
+    assert pipeline.stats['encoded'] == len(parts)
+    assert pipeline.stats['detected'] > 0
+
+
+def test_detection_skips_to_the_newest_frame(tmp_path):
+    path = video_file(tmp_path / 'video.avi', frames=30)
+    recognizer = StubRecognizer(cost=0.1)
+    pipeline = VideoPipeline(recognizer, video_source=path, realtime=False)
+
+    pipeline.start()
+    # The detection thread exits once capture is done and the last frame is detected
+    pipeline._threads[1].join(10)
+    pipeline.stop()
+
+    assert pipeline.stats['captured'] == 30
+    assert len(recognizer.frames) < 30
+    np.testing.assert_array_equal(recognizer.frames[-1], read_frames(path)[-1])
+
+
+def test_stale_frames_are_dropped_instead_of_queued(tmp_path):
+    path = video_file(tmp_path / 'video.avi', frames=30)
+    pipeline = VideoPipeline(StubRecognizer(), video_source=path, realtime=False, max_latency=0.1)
+
+    pipeline.start()
+    # A viewer that stalls while all frames are captured
+    while pipeline.stats['captured'] < 30:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    parts = list(pipeline.frames())
+
+    assert parts == []
+    assert pipeline.stats['dropped'] == 1
+    assert pipeline.stats['encoded'] == 0
@@ -0,0 +1,50 @@
+import threading
+import pytest
+from app.worker_pool import PoolSaturated, RecognitionPool
+
+
+class BlockingRecognizer:
+    """Stands in for a FaceRecognizer whose batches wait until released."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def recognize_batch(self, images):
+        self.started.set()
+        self.release.wait(10)
+        return [{'error': None, 'faces': []} for _ in images]
+
+
+def test_full_queue_turns_jobs_away():
+    recognizer = BlockingRecognizer()
+    pool = RecognitionPool(recognizer, workers=0, max_pending=1)
+    running = threading.Thread(target=pool.run, args=('recognize_batch', [b'first']))
+    running.start()
+    assert recognizer.started.wait(10)
+
+    with pytest.raises(PoolSaturated):
+        pool.submit('recognize_batch', [b'second'])
+
+    recognizer.release.set()
+    running.join()
+    assert pool.stats()['rejected'] == 1
+    assert pool.stats()['pending'] == 0
+    # The released slot admits the next job
+    assert pool.run('recognize_batch', [b'third']) == [{'error': None, 'faces': []}]
+
+
+def test_calls_are_admitted_all_or_none():
+    pool = RecognitionPool(BlockingRecognizer(), workers=0, max_pending=2)
+    calls = [('recognize_batch', ([b'image'],), {})] * 3
+
+    with pytest.raises(PoolSaturated):
+        pool.submit_many(calls)
+    assert pool.pending == 0
+
+
+def test_unknown_methods_are_refused():
+    pool = RecognitionPool(BlockingRecognizer(), workers=0)
+
+    with pytest.raises(ValueError):
+        pool.submit('delete_face_from_known', 'alice')